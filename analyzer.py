@@ -0,0 +1,648 @@
+# Description: Rule analysis core shared by the web UI and the CLI.
+# Kept free of Streamlit so command-line and batch runs do not pay for
+# importing the web framework.
+
+import os
+import time
+import logging
+from dataclasses import asdict
+from typing import Dict, Any, Iterator, List, Optional
+from llms.factory import LLMFactory
+from llms.router import ProviderRouter, RoutingPolicy
+from engine.cache import get_analysis_cache, make_cache_key
+from engine.coalesce import FlightAbandoned, SingleFlight
+from engine.concurrency import get_rate_limiter
+from engine.metrics import metrics, timed, trace
+from engine.usage import BudgetExceeded, get_budget
+from rules.diff import describe_changes
+from rules.regex_perf import regex_performance
+from rules.similarity import SimilarityIndex, SimilarRule
+from rules.simulator import verify_test_cases
+from rules.splitter import RuleBlock
+from rules.technical import technical_analysis
+from templates.prompt_template import (DELTA_MAX_TOKENS, GROUP_RULE_MAX_TOKENS, build_delta_prompt_template,
+                                       format_rule_group)
+from templates.report import AnalysisReport, parse_report, split_group_response
+
+# Configure logging
+log_level = os.getenv("log_level", "info").lower()
+if log_level == "off":
+    logging.disable(logging.CRITICAL)
+else:
+    logging.basicConfig(level=log_level.upper())
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+    logger.info("Loaded environment variables from .env file")
+except Exception as e:
+    logger.warning("Could not load .env file: %s", e)
+
+# Identical analyses currently running, shared by concurrent callers
+_in_flight = SingleFlight()
+
+def check_api_key(provider: str = "perplexity") -> str:
+    """Check if API key is present in environment variables.
+    
+    Args:
+        provider: The LLM provider to get the API key for
+        
+    Returns:
+        The API key for the specified provider (empty for providers that need none)
+    """
+    key_mapping = {
+        "perplexity": "perplexity_api_key",
+        "openai": "openai_api_key",
+        "xcom": "xcom_api_key",
+        "google": "google_api_key",
+        "ollama": None  # Runs locally, no API key required
+    }
+    
+    if provider not in key_mapping:
+        error_msg = f"Unknown provider: {provider}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    
+    env_var = key_mapping[provider]
+    if env_var is None:
+        return ""
+        
+    api_key = os.getenv(env_var)
+    if not api_key:
+        error_msg = f"{env_var} environment variable not found"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+        
+    return api_key
+
+def get_llm_client(api_key: str, provider: str = "perplexity"):
+    """Return the shared client for a provider, building it once per process.
+    
+    The registry lives in LLMFactory rather than the Streamlit script, so UI
+    reruns (which re-execute the script but not imported modules) and CLI
+    threads all reuse the same instance and connection pool.
+    """
+    logger.debug("get_llm_client called with provider=%s, api_key=%s", provider, 'set' if api_key else 'not set')
+    return LLMFactory.get_client(provider, api_key)
+
+def get_routed_client(api_key: str, provider: str, routing: RoutingPolicy) -> ProviderRouter:
+    """Wrap the provider's client in a router that applies the routing policy.
+    
+    Fallback and hedge providers whose API key is missing are left out with a
+    warning rather than failing the analysis.
+    """
+    routes = [routing.route(provider, get_llm_client(api_key, provider))]
+    for name in routing.fallback:
+        if name == provider:
+            continue
+        try:
+            routes.append(routing.route(name, get_llm_client(check_api_key(name), name)))
+        except ValueError as e:
+            logger.warning("Skipping fallback provider %s: %s", name, e)
+    hedge = None
+    if routing.hedge and routing.hedge != provider:
+        try:
+            hedge = routing.route(routing.hedge, get_llm_client(check_api_key(routing.hedge), routing.hedge))
+        except ValueError as e:
+            logger.warning("Skipping hedge provider %s: %s", routing.hedge, e)
+    return ProviderRouter(routes, hedge, routing.hedge_after)
+
+def _client(api_key: str, provider: str, routing: Optional[RoutingPolicy] = None):
+    with timed("client_build"):
+        if routing is not None and routing.enabled:
+            client = get_routed_client(api_key, provider, routing)
+        else:
+            client = get_llm_client(api_key, provider)
+    logger.debug("LLM client instantiated: %s", client)
+    return client
+
+def _prepare_analysis(rule: str, prompt_template: str, provider: str, use_cache: bool,
+                      max_tokens: Optional[int] = None, routing: Optional[RoutingPolicy] = None):
+    """Resolve the client, prompt and cache entry shared by analyze and stream.
+
+    The cache key doubles as the in-flight key used to coalesce identical
+    concurrent requests, so it is computed even when caching is off.
+    
+    Returns:
+        Tuple of (client, prompt, cache, cache_key, cached_analysis)
+    """
+    # Verify API key
+    with timed("key_lookup"):
+        api_key = check_api_key(provider)
+    logger.debug("API key verified for provider %s", provider)
+    
+    # Initialize LLM client
+    client = _client(api_key, provider, routing)
+    
+    # Format prompt with rule
+    with timed("prompt_format"):
+        prompt = prompt_template.format(rule=rule)
+    logger.debug("Formatted prompt: %s", prompt)
+    
+    # Serve repeated analyses from the persistent cache
+    cache = get_analysis_cache() if use_cache else None
+    cache_key = make_cache_key(rule, prompt_template, provider, getattr(client, "model", None), max_tokens)
+    cached = None
+    if cache is not None:
+        with timed("cache_lookup"):
+            cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving cached analysis for provider %s", provider)
+    return client, prompt, cache, cache_key, cached
+
+def _acquire_rate_limit(client, provider: str):
+    # Stop or pace the run against its token and cost budget first
+    budget = get_budget()
+    if budget is not None:
+        with timed("budget_wait"):
+            budget.admit()
+    # Respect the provider's request rate when called from many threads;
+    # a router paces each provider it calls itself
+    if isinstance(client, ProviderRouter):
+        return
+    limiter = get_rate_limiter(provider)
+    if limiter is not None:
+        with timed("rate_limit_wait"):
+            limiter.acquire()
+
+def _call_provider(client, prompt: str, provider: str, cache, cache_key: str,
+                   max_tokens: Optional[int]) -> Dict[str, Any]:
+    _acquire_rate_limit(client, provider)
+    logger.debug("Calling analyze on LLM client for provider: %s", provider)
+    with timed("provider_call"):
+        if max_tokens:
+            analysis = client.analyze(prompt, max_tokens=max_tokens)
+        else:
+            analysis = client.analyze(prompt)
+    logger.debug("Received analysis from provider %s: %s", provider, analysis)
+    if cache is not None:
+        with timed("cache_store"):
+            cache.set(cache_key, analysis)
+    return analysis
+
+async def _acquire_rate_limit_async(client, provider: str):
+    budget = get_budget()
+    if budget is not None:
+        with timed("budget_wait"):
+            await budget.admit_async()
+    if isinstance(client, ProviderRouter):
+        return
+    limiter = get_rate_limiter(provider)
+    if limiter is not None:
+        with timed("rate_limit_wait"):
+            await limiter.acquire_async()
+
+async def _call_provider_async(client, prompt: str, provider: str, cache, cache_key: str,
+                               max_tokens: Optional[int]) -> Dict[str, Any]:
+    await _acquire_rate_limit_async(client, provider)
+    logger.debug("Calling analyze_async on LLM client for provider: %s", provider)
+    with timed("provider_call"):
+        if max_tokens:
+            analysis = await client.analyze_async(prompt, max_tokens=max_tokens)
+        else:
+            analysis = await client.analyze_async(prompt)
+    logger.debug("Received analysis from provider %s: %s", provider, analysis)
+    if cache is not None:
+        with timed("cache_store"):
+            cache.set(cache_key, analysis)
+    return analysis
+
+def _local_sections(rule: str, include_technical_analysis: bool, include_regex_performance: bool) -> str:
+    """Build the requested locally generated sections, each followed by a blank line."""
+    sections = []
+    if include_technical_analysis:
+        with timed("technical_analysis"):
+            sections.append(technical_analysis(rule))
+    if include_regex_performance:
+        with timed("regex_performance"):
+            sections.append(regex_performance(rule))
+    return "".join(f"{section}\n" for section in sections if section)
+
+def _with_local_sections(rule: str, analysis: Dict[str, Any], include_technical_analysis: bool,
+                         include_regex_performance: bool) -> Dict[str, Any]:
+    local = _local_sections(rule, include_technical_analysis, include_regex_performance)
+    if not local:
+        return analysis
+    return {**analysis, "markdown_content": local + analysis.get('markdown_content', '')}
+
+def analyze_modsec_rule(rule: str, prompt_template: Optional[str], provider: str = "perplexity",
+                        use_cache: bool = True, include_technical_analysis: bool = False,
+                        max_tokens: Optional[int] = None,
+                        routing: Optional[RoutingPolicy] = None,
+                        include_regex_performance: bool = False) -> Dict[str, Any]:
+    """
+    Analyze ModSecurity rule using the specified LLM provider.
+    
+    Concurrent calls for the same rule, template and provider share a single
+    provider request.
+    
+    Args:
+        rule: The ModSecurity rule to analyze
+        prompt_template: The template to use for formatting the prompt, or
+            None to return only the requested local sections without
+            calling the provider
+        provider: The LLM provider to use (default: "perplexity")
+        use_cache: Serve and store results in the persistent analysis cache
+        include_technical_analysis: Prepend the locally generated Technical
+            Analysis section (for templates that do not ask the LLM for it)
+        max_tokens: Optional completion token cap passed to the provider
+        routing: Optional failover/hedging policy across providers
+        include_regex_performance: Prepend the locally measured Regex
+            Performance section (see rules.regex_perf)
+    
+    Returns:
+        Dictionary containing the analysis results
+    """
+    if prompt_template is None:
+        return _with_local_sections(rule, {"markdown_content": ""}, include_technical_analysis,
+                                    include_regex_performance)
+    try:
+        logger.info("Starting rule analysis with %s provider", provider)
+        logger.debug("Input rule: %s", rule)
+        
+        with trace("analysis", provider=provider) as current:
+            client, prompt, cache, cache_key, cached = _prepare_analysis(
+                rule, prompt_template, provider, use_cache, max_tokens, routing)
+            current.labels["cached"] = cached is not None
+            if cached is not None:
+                return _with_local_sections(rule, cached, include_technical_analysis, include_regex_performance)
+            
+            # Get analysis from LLM, joining an identical request already in flight
+            analysis = dict(_in_flight.do(
+                cache_key, lambda: _call_provider(client, prompt, provider, cache, cache_key, max_tokens)))
+            return _with_local_sections(rule, analysis, include_technical_analysis, include_regex_performance)
+        
+    except Exception as e:
+        logger.error("Error analyzing rule: %s", e)
+        logger.debug("Stack trace:", exc_info=True)
+        raise
+
+async def analyze_modsec_rule_async(rule: str, prompt_template: Optional[str], provider: str = "perplexity",
+                                    use_cache: bool = True, include_technical_analysis: bool = False,
+                                    max_tokens: Optional[int] = None,
+                                    routing: Optional[RoutingPolicy] = None,
+                                    include_regex_performance: bool = False) -> Dict[str, Any]:
+    """
+    Asynchronous variant of analyze_modsec_rule for use on an event loop.
+    
+    The provider call is awaited through LLMProvider.analyze_async; key
+    lookup, prompt formatting and the cache lookup run inline since they do
+    not touch the network. Takes the same arguments as analyze_modsec_rule.
+    
+    Returns:
+        Dictionary containing the analysis results
+    """
+    if prompt_template is None:
+        return _with_local_sections(rule, {"markdown_content": ""}, include_technical_analysis,
+                                    include_regex_performance)
+    try:
+        logger.info("Starting async rule analysis with %s provider", provider)
+        logger.debug("Input rule: %s", rule)
+        
+        with trace("analysis", provider=provider) as current:
+            client, prompt, cache, cache_key, cached = _prepare_analysis(
+                rule, prompt_template, provider, use_cache, max_tokens, routing)
+            current.labels["cached"] = cached is not None
+            if cached is not None:
+                return _with_local_sections(rule, cached, include_technical_analysis, include_regex_performance)
+            
+            analysis = dict(await _in_flight.do_async(
+                cache_key, lambda: _call_provider_async(client, prompt, provider, cache, cache_key, max_tokens)))
+            return _with_local_sections(rule, analysis, include_technical_analysis, include_regex_performance)
+        
+    except Exception as e:
+        logger.error("Error analyzing rule: %s", e)
+        logger.debug("Stack trace:", exc_info=True)
+        raise
+
+def cached_analysis(rule: str, prompt_template: Optional[str], provider: str = "perplexity",
+                    include_technical_analysis: bool = False, max_tokens: Optional[int] = None,
+                    routing: Optional[RoutingPolicy] = None,
+                    include_regex_performance: bool = False) -> Optional[Dict[str, Any]]:
+    """Return the cached analysis analyze_modsec_rule would serve, without calling the provider.
+
+    Lets callers answer cache hits immediately instead of queueing them
+    behind provider calls. Arguments are those of analyze_modsec_rule.
+
+    Returns:
+        The analysis, or None when it is not cached (or caching is disabled,
+        or only local sections are requested)
+
+    Raises:
+        ValueError: If the provider's API key is missing
+    """
+    if prompt_template is None:
+        return None
+    _, _, _, _, cached = _prepare_analysis(rule, prompt_template, provider, True, max_tokens, routing)
+    if cached is None:
+        return None
+    return _with_local_sections(rule, cached, include_technical_analysis, include_regex_performance)
+
+def analyze_similar_rule(rule: str, base: SimilarRule, provider: str = "perplexity",
+                         use_cache: bool = True, max_tokens: Optional[int] = None,
+                         routing: Optional[RoutingPolicy] = None) -> Dict[str, Any]:
+    """
+    Explain a rule relative to a similar rule whose analysis is already known.
+    
+    The provider is only asked how the differences change the rule, with a
+    small completion budget; the base analysis is appended to its answer.
+    
+    Args:
+        rule: The ModSecurity rule to analyze
+        base: Similar rule with its analysis dictionary as payload
+        provider: The LLM provider to use (default: "perplexity")
+        use_cache: Serve and store results in the persistent analysis cache
+        max_tokens: Optional completion token cap (at most DELTA_MAX_TOKENS)
+        routing: Optional failover/hedging policy across providers
+    
+    Returns:
+        Dictionary containing the analysis results, with the base rule id
+        under "similar_to" and the similarity score under "similarity"
+    """
+    base_analysis = base.payload.get("markdown_content", "")
+    budget = min(max_tokens, DELTA_MAX_TOKENS) if max_tokens else DELTA_MAX_TOKENS
+    template = build_delta_prompt_template(base.text, base_analysis, describe_changes(base.text, rule),
+                                           base.rule_id, budget)
+    delta = analyze_modsec_rule(rule, template, provider, use_cache, max_tokens=budget, routing=routing)
+    base_name = f"rule {base.rule_id}" if base.rule_id else "the similar rule"
+    markdown = (f"{delta.get('markdown_content', '').rstrip()}\n\n"
+                f"_Apart from the differences above, the analysis of {base_name} applies:_\n\n"
+                f"{base_analysis}")
+    return {**delta, "markdown_content": markdown, "similar_to": base.rule_id, "similarity": base.score}
+
+def analyze_with_index(rule: str, prompt_template: Optional[str], index: SimilarityIndex,
+                       provider: str = "perplexity",
+                       use_cache: bool = True, include_technical_analysis: bool = False,
+                       max_tokens: Optional[int] = None,
+                       routing: Optional[RoutingPolicy] = None,
+                       include_regex_performance: bool = False) -> Dict[str, Any]:
+    """
+    Analyze a rule, reusing the analysis of a near-duplicate from the index.
+    
+    Rules without a near-duplicate get a full analysis, which is added to the
+    index so later similar rules only need a delta analysis.
+    
+    Args:
+        rule: The ModSecurity rule to analyze
+        prompt_template: The template used for full analyses (None: local
+            sections only, without using the index)
+        index: Similarity index of rules analyzed with prompt_template
+        provider, use_cache, include_technical_analysis, max_tokens, routing,
+            include_regex_performance: As for analyze_modsec_rule
+    
+    Returns:
+        Dictionary containing the analysis results
+    """
+    if prompt_template is None:
+        return analyze_modsec_rule(rule, None, provider, use_cache, include_technical_analysis, max_tokens,
+                                   routing, include_regex_performance)
+    with timed("similarity_lookup"):
+        base = index.find(rule)
+    if base is None:
+        analysis = analyze_modsec_rule(rule, prompt_template, provider, use_cache,
+                                       max_tokens=max_tokens, routing=routing)
+        index.add(rule, analysis)
+    else:
+        logger.info("Rule resembles rule %s (similarity %.2f), analyzing differences only",
+                    base.rule_id, base.score)
+        analysis = analyze_similar_rule(rule, base, provider, use_cache, max_tokens, routing)
+    return _with_local_sections(rule, analysis, include_technical_analysis, include_regex_performance)
+
+def analyze_rule_group(rules: List[str], prompt_template: str, group_template: str, provider: str = "perplexity",
+                       use_cache: bool = True, include_technical_analysis: bool = False,
+                       max_tokens: Optional[int] = None,
+                       routing: Optional[RoutingPolicy] = None,
+                       include_regex_performance: bool = False) -> List[Dict[str, Any]]:
+    """
+    Analyze several related rules with a single provider request.
+    
+    The provider answers with one part per rule. Each part is cached as that
+    rule's analysis under prompt_template, the single-rule template asking
+    for the same sections, so later runs reuse it whether they group rules
+    or not. Cached rules are not sent again. Rules missing from the answer,
+    or all pending rules if the shared request fails, are analyzed one by
+    one; an exhausted budget is raised instead.
+    
+    Args:
+        rules: The ModSecurity rules to analyze, e.g. consecutive rules of one file
+        prompt_template: Single-rule template for the selected sections
+        group_template: Multi-rule template from build_group_prompt_template
+        provider, use_cache, include_technical_analysis, routing,
+            include_regex_performance: As for analyze_modsec_rule
+        max_tokens: Optional completion token cap per rule
+    
+    Returns:
+        The analysis of each rule, in input order. Analyses that came from a
+        shared request carry the number of rules it covered under "group_size",
+        and its "usage" and "citations", which are those of the whole request
+        (not a per-rule share).
+    """
+    logger.info("Starting analysis of %d rules with %s provider", len(rules), provider)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(rules)
+    with trace("group_analysis", provider=provider, rules=len(rules)) as current:
+        with timed("key_lookup"):
+            api_key = check_api_key(provider)
+        client = _client(api_key, provider, routing)
+        cache = get_analysis_cache() if use_cache else None
+        keys = [make_cache_key(rule, prompt_template, provider, getattr(client, "model", None), max_tokens)
+                for rule in rules]
+        if cache is not None:
+            with timed("cache_lookup"):
+                results = [cache.get(key) for key in keys]
+        pending = [index for index, result in enumerate(results) if result is None]
+        current.labels["cached"] = len(rules) - len(pending)
+        if len(pending) > 1:
+            with timed("prompt_format"):
+                prompt = format_rule_group(group_template, [rules[index] for index in pending])
+            try:
+                response = _call_provider(client, prompt, provider, None, "",
+                                          (max_tokens or GROUP_RULE_MAX_TOKENS) * len(pending))
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                logger.warning("Group request for %d rules failed, analyzing them separately: %s",
+                               len(pending), e)
+                response = {}
+            with timed("parse"):
+                parts = split_group_response(response.get("markdown_content", ""), len(pending))
+            for position, index in enumerate(pending):
+                if position not in parts:
+                    continue
+                analysis = {"markdown_content": parts[position], "group_size": len(pending)}
+                for key in ("model", "usage", "citations"):
+                    if response.get(key):
+                        analysis[key] = response[key]
+                if cache is not None:
+                    with timed("cache_store"):
+                        cache.set(keys[index], analysis)
+                results[index] = analysis
+            if response and len(parts) < len(pending):
+                logger.warning("Provider answered %d of %d rules; analyzing the rest separately",
+                               len(parts), len(pending))
+    for index, rule in enumerate(rules):
+        if results[index] is None:
+            results[index] = analyze_modsec_rule(rule, prompt_template, provider, use_cache,
+                                                 include_technical_analysis, max_tokens, routing,
+                                                 include_regex_performance)
+        else:
+            results[index] = _with_local_sections(rule, results[index], include_technical_analysis,
+                                                  include_regex_performance)
+    return results
+
+def stream_modsec_rule(rule: str, prompt_template: Optional[str], provider: str = "perplexity",
+                       use_cache: bool = True, include_technical_analysis: bool = False,
+                       max_tokens: Optional[int] = None,
+                       routing: Optional[RoutingPolicy] = None,
+                       include_regex_performance: bool = False) -> Iterator[str]:
+    """
+    Analyze ModSecurity rule, yielding the markdown analysis as it is generated.
+    
+    A cached analysis is yielded as a single chunk. A completed stream is
+    stored in the cache together with the model, usage and citations the
+    provider reported; an abandoned one is not.
+    
+    Args:
+        rule: The ModSecurity rule to analyze
+        prompt_template: The template to use for formatting the prompt, or
+            None to yield only the requested local sections
+        provider: The LLM provider to use (default: "perplexity")
+        use_cache: Serve and store results in the persistent analysis cache
+        include_technical_analysis: Yield the locally generated Technical
+            Analysis section before the LLM output
+        max_tokens: Optional completion token cap passed to the provider
+        routing: Optional failover policy across providers (streams fail
+            over before their first chunk and are not hedged)
+        include_regex_performance: Yield the locally measured Regex
+            Performance section before the LLM output
+    
+    Yields:
+        Successive pieces of the markdown analysis
+    """
+    try:
+        logger.info("Starting streamed rule analysis with %s provider", provider)
+        logger.debug("Input rule: %s", rule)
+        
+        local = _local_sections(rule, include_technical_analysis, include_regex_performance)
+        if local:
+            yield local
+        if prompt_template is None:
+            return
+        
+        client, prompt, cache, cache_key, cached = _prepare_analysis(
+            rule, prompt_template, provider, use_cache, max_tokens, routing)
+        if cached is not None:
+            yield cached.get("markdown_content", "")
+            return
+        
+        # An identical request is already streaming: wait for its full result
+        leader, flight = _in_flight.begin(cache_key)
+        if not leader:
+            try:
+                yield flight.result().get("markdown_content", "")
+                return
+            except FlightAbandoned:
+                leader, flight = _in_flight.begin(cache_key)
+                if not leader:
+                    yield flight.result().get("markdown_content", "")
+                    return
+        
+        chunks = []
+        finished = False
+        try:
+            _acquire_rate_limit(client, provider)
+            started = time.perf_counter()
+            chunk_stream = iter(client.stream(prompt, max_tokens=max_tokens) if max_tokens
+                                else client.stream(prompt))
+            while True:
+                try:
+                    chunk = next(chunk_stream)
+                except StopIteration as stop:
+                    # The stream's return value carries the response's model, usage and citations
+                    metadata = stop.value or {}
+                    break
+                if not chunks:
+                    metrics.observe("first_chunk", time.perf_counter() - started)
+                chunks.append(chunk)
+                yield chunk
+            metrics.observe("stream", time.perf_counter() - started)
+            finished = True
+        except Exception as e:
+            _in_flight.finish(cache_key, flight, error=e)
+            raise
+        finally:
+            if not finished and not flight.done():
+                _in_flight.finish(cache_key, flight, error=FlightAbandoned("Streaming analysis was abandoned"))
+        analysis = {**metadata, "markdown_content": "".join(chunks)}
+        # Release waiting followers before touching the cache, which may fail
+        _in_flight.finish(cache_key, flight, result=analysis)
+        if cache is not None:
+            try:
+                with timed("cache_store"):
+                    cache.set(cache_key, analysis)
+            except Exception as e:
+                # The analysis was already delivered; losing the cache entry only costs a re-analysis
+                logger.warning("Could not cache streamed analysis: %s", e)
+        
+    except Exception as e:
+        logger.error("Error analyzing rule: %s", e)
+        logger.debug("Stack trace:", exc_info=True)
+        raise
+
+def rule_data_dir(source: Optional[str]) -> Optional[str]:
+    """Directory `@pmFromFile` data files of rules read from source are resolved against."""
+    if not source or source.startswith("<"):
+        return None
+    return os.path.dirname(os.path.abspath(source))
+
+def report_record(rule: str, report: AnalysisReport, data_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Serialize a report, with its curl test cases checked locally against the rule."""
+    data = report.to_dict()
+    checks = verify_test_cases(rule, report.test_case, data_dir)
+    if checks:
+        data["test_results"] = [{**asdict(check), "passed": check.passed} for check in checks]
+    return data
+
+def block_record(block: RuleBlock) -> Dict[str, Any]:
+    """Start the JSON record of a rule block: where it was read from and its text."""
+    return {
+        "source": block.source,
+        "line": block.line,
+        "rule_id": block.rule_id,
+        "rule": block.text,
+    }
+
+def add_analysis(record: Dict[str, Any], analysis: Optional[str], structured: bool = False):
+    """Add an analysis to a record from block_record, with its `report` when structured."""
+    record["analysis"] = analysis
+    if structured and analysis is not None:
+        report = parse_report(analysis, record.get("rule_id"))
+        record["report"] = report_record(record["rule"], report, rule_data_dir(record.get("source")))
+
+def analysis_record(block: RuleBlock, analysis: Dict[str, Any], structured: bool = False) -> Dict[str, Any]:
+    """
+    Build the JSON record of an analyzed rule block.
+    
+    This is the record format shared by the CLI's batch output and the
+    analysis service.
+    
+    Args:
+        block: The analyzed rule block
+        analysis: Result of analyze_modsec_rule or a related function
+        structured: Add the per-section `report`, with curl test cases
+            checked against the rule
+    
+    Returns:
+        The block's location and text, the analysis and any model, usage,
+        citations, similarity and group size the analysis carries
+    """
+    record = block_record(block)
+    add_analysis(record, analysis.get("markdown_content"), structured)
+    if analysis.get("similar_to") is not None:
+        record["similar_to"] = analysis["similar_to"]
+        record["similarity"] = analysis.get("similarity")
+    for key in ("model", "usage", "citations", "group_size"):
+        if analysis.get(key):
+            record[key] = analysis[key]
+    return record
@@ -1,101 +1,12 @@
-import os
 import logging
-import traceback
-from typing import Dict, Any
 import streamlit as st
-from llms.factory import LLMFactory
-from templates.prompt_template import PROMPT_TEMPLATE
+from analyzer import stream_modsec_rule
+from llms.router import RoutingPolicy
+from rules.normalizer import canonicalize_rule
+from templates.prompt_template import ALL_SECTIONS, DEFAULT_SECTIONS, SECTION_TITLES, build_prompt_template
 
-# Configure logging
-log_level = os.getenv("log_level", "info").lower()
-if log_level == "off":
-    logging.disable(logging.CRITICAL)
-else:
-    logging.basicConfig(level=log_level.upper())
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-    logger.info("Loaded environment variables from .env file")
-except Exception as e:
-    logger.warning(f"Could not load .env file: {e}")
-
-def check_api_key(provider: str = "perplexity") -> str:
-    """Check if API key is present in environment variables.
-    
-    Args:
-        provider: The LLM provider to get the API key for
-        
-    Returns:
-        The API key for the specified provider
-    """
-    key_mapping = {
-        "perplexity": "perplexity_api_key",
-        "openai": "openai_api_key",
-        "xcom": "xcom_api_key",
-        "google": "google_api_key"
-    }
-    
-    env_var = key_mapping.get(provider)
-    if not env_var:
-        error_msg = f"Unknown provider: {provider}"
-        logger.error(error_msg)
-        raise ValueError(error_msg)
-        
-    api_key = os.getenv(env_var)
-    if not api_key:
-        error_msg = f"{env_var} environment variable not found"
-        logger.error(error_msg)
-        raise ValueError(error_msg)
-        
-    return api_key
-
-def get_llm_client(api_key: str, provider: str = "perplexity"):
-    logger.debug(f"get_llm_client called with provider={provider}, api_key={'set' if api_key else 'not set'}")
-    return LLMFactory.create(provider, api_key)
-
-def analyze_modsec_rule(rule: str, prompt_template: str, provider: str = "perplexity") -> Dict[str, Any]:
-    """
-    Analyze ModSecurity rule using the specified LLM provider.
-    
-    Args:
-        rule: The ModSecurity rule to analyze
-        prompt_template: The template to use for formatting the prompt
-        provider: The LLM provider to use (default: "perplexity")
-    
-    Returns:
-        Dictionary containing the analysis results
-    """
-    try:
-        logger.info(f"Starting rule analysis with {provider} provider")
-        logger.debug(f"Input rule: {rule}")
-        
-        # Verify API key
-        api_key = check_api_key(provider)
-        logger.debug(f"API key verified for provider {provider}")
-        
-        # Initialize LLM client
-        logger.debug(f"Instantiating LLM client for provider: {provider}")
-        client = get_llm_client(api_key, provider)
-        logger.debug(f"LLM client instantiated: {client}")
-        
-        # Format prompt with rule
-        prompt = prompt_template.format(rule=rule)
-        logger.debug(f"Formatted prompt: {prompt}")
-        
-        # Get analysis from LLM
-        logger.debug(f"Calling analyze on LLM client for provider: {provider}")
-        analysis = client.analyze(prompt)
-        logger.debug(f"Received analysis from provider {provider}: {analysis}")
-        return analysis
-        
-    except Exception as e:
-        logger.error(f"Error analyzing rule: {str(e)}")
-        logger.debug(f"Stack trace: {traceback.format_exc()}")
-        raise
-
 def initialize_session_state():
     """Initialize session state variables."""
     if "rule_history" not in st.session_state:
@@ -147,6 +58,43 @@ def main():
             options=["perplexity", "ollama"],
             index=0
         )
+        use_cache = st.checkbox(
+            "Use cached analyses",
+            value=True,
+            help="Reuse a stored analysis when the same rule was analyzed before with this provider and template."
+        )
+        fallback = st.selectbox(
+            "Fallback provider",
+            options=["none"] + [p for p in ["perplexity", "ollama"] if p != provider],
+            index=0,
+            help="Provider used when the selected one fails, times out or is temporarily disabled by its circuit breaker."
+        )
+        provider_timeout = st.number_input(
+            "Provider timeout in seconds (0 = none)",
+            min_value=0,
+            max_value=600,
+            value=0,
+            step=10,
+            help="Give up on a provider that has not answered in time and move on to the fallback."
+        )
+        routing = RoutingPolicy(
+            fallback=[] if fallback == "none" else [fallback],
+            timeout=provider_timeout or None
+        )
+        
+        st.header("Report Sections")
+        selected_sections = [
+            key for key in ALL_SECTIONS
+            if st.checkbox(SECTION_TITLES[key], value=key in DEFAULT_SECTIONS, key=f"section_{key}")
+        ]
+        token_budget = st.number_input(
+            "Token budget (0 = provider default)",
+            min_value=0,
+            max_value=8192,
+            value=0,
+            step=256,
+            help="Cap on completion tokens; the budget is split across the selected sections."
+        )
         
         st.header("Quick Start")
         st.markdown("""
@@ -256,25 +204,40 @@ def main():
             st.error("Please enter a ModSecurity rule to analyze")
         else:
             try:
-                logger.debug(f"UI selected provider: {provider}")
+                logger.debug("UI selected provider: %s", provider)
+                logger.info("Analyzing rule: %s", st.session_state.current_rule)
+                prompt_template = build_prompt_template(selected_sections, token_budget or None)
+                live_output = st.empty()
+                content = ""
                 with st.spinner(f"Analyzing rule with {provider} provider..."):
-                    logger.info(f"Analyzing rule: {st.session_state.current_rule}")
-                    analysis = analyze_modsec_rule(
+                    # Re-render as chunks arrive so finished sections show up immediately
+                    for chunk in stream_modsec_rule(
                         st.session_state.current_rule,
-                        PROMPT_TEMPLATE,
-                        provider=provider
-                    )
+                        prompt_template,
+                        provider=provider,
+                        use_cache=use_cache,
+                        include_technical_analysis="technical_analysis" in selected_sections,
+                        max_tokens=token_budget or None,
+                        routing=routing,
+                        include_regex_performance="regex_performance" in selected_sections
+                    ):
+                        content += chunk
+                        live_output.markdown(content)
+                    live_output.empty()
+                    analysis = {"markdown_content": content}
                     st.session_state.current_analysis = analysis
-                    if not any(h['rule'] == st.session_state.current_rule for h in st.session_state.rule_history):
+                    canonical = canonicalize_rule(st.session_state.current_rule)
+                    if not any(h.get('canonical') == canonical for h in st.session_state.rule_history):
                         st.session_state.rule_history.append({
                             "rule": st.session_state.current_rule,
+                            "canonical": canonical,
                             "analysis": analysis
                         })
             except Exception as e:
                 st.session_state.current_analysis = None  # Clear any previous analysis
                 st.error(f"Error analyzing rule: {str(e)}")
-                logger.error(f"Error: {str(e)}")
-                logger.debug(f"Stack trace: {traceback.format_exc()}")
+                logger.error("Error: %s", e)
+                logger.debug("Stack trace:", exc_info=True)
 
     # --- Analysis Results ---
     if st.session_state.current_analysis:
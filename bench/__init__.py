@@ -0,0 +1,3 @@
+from .mock_server import MockLLMServer, MockSettings
+
+__all__ = ['MockLLMServer', 'MockSettings']
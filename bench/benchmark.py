@@ -0,0 +1,439 @@
+# Description: Offline end-to-end benchmark of the analysis pipeline.
+# Runs rules through analyze_modsec_rule against the local mock LLM server in
+# single (sequential), batch (worker threads) and concurrent (asyncio) modes
+# and reports throughput, latency percentiles and memory, optionally failing
+# when results regress against a saved baseline.
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Allow running as `python bench/benchmark.py` from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.mock_server import MockLLMServer
+from engine.concurrency import DEFAULT_ASYNC_CONCURRENCY, DEFAULT_CONCURRENCY, run_async_concurrently, run_concurrently
+from llms.http import close_async_client
+from rules.splitter import iter_rules_from_paths
+
+logger = logging.getLogger(__name__)
+
+MODES = ("single", "batch", "concurrent")
+
+# Entry points whose import cost short CLI and cron invocations pay up front
+IMPORT_MODULES = ("cli", "analyzer", "llms.factory", "app")
+# Dependencies that should only load once they are actually used
+HEAVY_MODULES = ("streamlit", "httpx", "requests")
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SYNTHETIC_RULE = (
+    'SecRule REQUEST_HEADERS:User-Agent "@rx (?:scanner{n}|probe{n})" '
+    '"id:{rule_id},phase:1,block,t:none,t:lowercase,log,msg:\'Benchmark rule {n}\',severity:\'CRITICAL\'"'
+)
+
+
+@dataclass
+class BenchResult:
+    """Throughput, latency and memory of one benchmark mode."""
+
+    mode: str
+    rules: int
+    errors: int
+    seconds: float
+    rules_per_sec: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_rss_mb: Optional[float] = None
+    peak_memory_mb: Optional[float] = None
+
+
+def synthetic_rules(count: int) -> List[str]:
+    """Return `count` distinct rules (distinct rules are neither cached nor coalesced)."""
+    return [SYNTHETIC_RULE.format(n=n, rule_id=900000 + n) for n in range(count)]
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / (1024 * 1024), 2)
+
+
+def _summarize(mode: str, latencies: List[float], errors: int, elapsed: float,
+               peak: Optional[int]) -> BenchResult:
+    ordered = sorted(latencies)
+    count = len(latencies) + errors
+    return BenchResult(
+        mode=mode,
+        rules=count,
+        errors=errors,
+        seconds=round(elapsed, 3),
+        rules_per_sec=round(count / elapsed, 2) if elapsed else 0.0,
+        p50_ms=round(_percentile(ordered, 0.50) * 1000, 2),
+        p95_ms=round(_percentile(ordered, 0.95) * 1000, 2),
+        p99_ms=round(_percentile(ordered, 0.99) * 1000, 2),
+        max_rss_mb=_max_rss_mb(),
+        peak_memory_mb=None if peak is None else round(peak / (1024 * 1024), 2),
+    )
+
+
+# Python heap tracing costs a large share of throughput, so it is opt-in
+trace_memory = False
+
+
+def _measure(mode: str, run: Callable[[List[float]], int]) -> BenchResult:
+    """Run one mode; run() appends latencies and returns the error count.
+
+    The process peak RSS is always recorded. With `trace_memory` set, the
+    peak Python heap of the mode is measured with tracemalloc as well.
+    """
+    latencies: List[float] = []
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    peak = None
+    try:
+        errors = run(latencies)
+        elapsed = time.perf_counter() - started
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return _summarize(mode, latencies, errors, elapsed, peak)
+
+
+def bench_single(rules: List[str], analyze: Callable[[str], Any]) -> BenchResult:
+    """Analyze rules one after another."""
+    def run(latencies: List[float]) -> int:
+        errors = 0
+        for rule in rules:
+            started = time.perf_counter()
+            try:
+                analyze(rule)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+        return errors
+    return _measure("single", run)
+
+
+def bench_batch(rules: List[str], analyze: Callable[[str], Any], concurrency: int) -> BenchResult:
+    """Analyze rules on a pool of worker threads, as `cli.py --batch` does."""
+    def timed_analyze(rule: str) -> float:
+        started = time.perf_counter()
+        analyze(rule)
+        return time.perf_counter() - started
+
+    def run(latencies: List[float]) -> int:
+        errors = 0
+        for _, seconds, error in run_concurrently(timed_analyze, rules, max_workers=concurrency):
+            if error is None:
+                latencies.append(seconds)
+            else:
+                errors += 1
+        return errors
+    return _measure("batch", run)
+
+
+def bench_concurrent(rules: List[str], analyze_async: Callable[[str], Any], concurrency: int) -> BenchResult:
+    """Analyze rules as asyncio coroutines, as `cli.py --batch --async` does."""
+    async def timed_analyze(rule: str) -> float:
+        started = time.perf_counter()
+        await analyze_async(rule)
+        return time.perf_counter() - started
+
+    async def collect(latencies: List[float]) -> int:
+        errors = 0
+        try:
+            async for _, seconds, error in run_async_concurrently(timed_analyze, rules, max_in_flight=concurrency):
+                if error is None:
+                    latencies.append(seconds)
+                else:
+                    errors += 1
+        finally:
+            await close_async_client()
+        return errors
+
+    return _measure("concurrent", lambda latencies: asyncio.run(collect(latencies)))
+
+
+# Environment variables a benchmark run overrides and restores afterwards
+BENCH_ENV_VARS = ("perplexity_base_url", "OLLAMA_HOST", "perplexity_api_key",
+                  "perplexity_requests_per_minute", "analysis_cache_path")
+
+
+def _reset_provider_clients():
+    """Drop rate limiters and clients so they are rebuilt from the current environment."""
+    from engine.concurrency import reset_rate_limiters
+    from llms.factory import LLMFactory
+    reset_rate_limiters()
+    LLMFactory.clear_clients()
+
+
+def _point_providers_at(url: str):
+    """Send provider traffic to the mock server and drop clients built for other hosts."""
+    os.environ["perplexity_base_url"] = url
+    os.environ["OLLAMA_HOST"] = url
+    os.environ.setdefault("perplexity_api_key", "mock-key")
+    # Measure the pipeline, not the client-side rate limit
+    os.environ["perplexity_requests_per_minute"] = "0"
+    _reset_provider_clients()
+
+
+def _restore_environment(saved: Dict[str, Optional[str]]):
+    """Put back the variables saved before a run (None: unset) and rebuild provider clients."""
+    for name, value in saved.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    _reset_provider_clients()
+
+
+def run_benchmark(rules: List[str], provider: str = "perplexity", modes=MODES,
+                  concurrency: int = DEFAULT_CONCURRENCY,
+                  async_concurrency: int = DEFAULT_ASYNC_CONCURRENCY,
+                  url: Optional[str] = None, use_cache: bool = False,
+                  **mock_settings: Any) -> List[BenchResult]:
+    """Benchmark the selected modes and return one result per mode.
+
+    Args:
+        rules: Rule texts to analyze in every mode
+        provider: Provider whose client is exercised ("perplexity" or "ollama")
+        modes: Any of "single", "batch" and "concurrent"
+        concurrency: Worker threads for batch mode
+        async_concurrency: Coroutines in flight for concurrent mode
+        url: Base URL of an already running mock server (one is started
+            in-process when omitted)
+        use_cache: Keep the analysis cache enabled (off by default so every
+            rule reaches the provider)
+        **mock_settings: latency, jitter, error_rate and seed for the
+            in-process mock server
+
+    Returns:
+        List of BenchResult in the order of `modes`. The environment and
+        provider clients are restored afterwards
+    """
+    from analyzer import analyze_modsec_rule, analyze_modsec_rule_async
+    from templates.prompt_template import PROMPT_TEMPLATE
+
+    def analyze(rule: str):
+        return analyze_modsec_rule(rule, PROMPT_TEMPLATE, provider=provider, use_cache=use_cache)
+
+    def analyze_async(rule: str):
+        return analyze_modsec_rule_async(rule, PROMPT_TEMPLATE, provider=provider, use_cache=use_cache)
+
+    saved = {name: os.environ.get(name) for name in BENCH_ENV_VARS}
+    server = None if url else MockLLMServer(**mock_settings).start()
+    try:
+        if not use_cache:
+            os.environ["analysis_cache_path"] = "off"
+        _point_providers_at(url or server.url)
+        results = []
+        for mode in modes:
+            logger.info("Benchmarking %s mode with %d rules", mode, len(rules))
+            if mode == "single":
+                results.append(bench_single(rules, analyze))
+            elif mode == "batch":
+                results.append(bench_batch(rules, analyze, concurrency))
+            elif mode == "concurrent":
+                results.append(bench_concurrent(rules, analyze_async, async_concurrency))
+            else:
+                raise ValueError(f"Unknown benchmark mode: {mode}")
+        return results
+    finally:
+        if server is not None:
+            server.stop()
+        _restore_environment(saved)
+
+
+@dataclass
+class ImportResult:
+    """Cold import time of one module and the heavy dependencies it loaded."""
+
+    module: str
+    median_ms: float
+    min_ms: float
+    heavy_modules: List[str]
+
+
+_IMPORT_PROBE = """
+import sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(elapsed, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def measure_import_time(module: str, repeat: int = 5) -> ImportResult:
+    """Import a module in fresh interpreters and report the median wall time.
+
+    Each run is a new process, so nothing is already in sys.modules; the
+    interpreter's own startup is not included.
+
+    Raises:
+        RuntimeError: If the module cannot be imported
+    """
+    probe = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    env = dict(os.environ, log_level="off")
+    timings = []
+    heavy: List[str] = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", probe], cwd=_REPO_ROOT, env=env,
+                                   capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed: {completed.stderr.strip().splitlines()[-1:]}")
+        elapsed, _, loaded = completed.stdout.strip().rpartition("\n")[2].partition(" ")
+        timings.append(float(elapsed) * 1000)
+        heavy = [name for name in loaded.split(",") if name]
+    return ImportResult(module, round(statistics.median(timings), 1), round(min(timings), 1), heavy)
+
+
+def format_import_table(results: List[ImportResult]) -> str:
+    header = f"{'module':<16}{'median ms':>11}{'min ms':>9}  heavy dependencies loaded"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(f"{r.module:<16}{r.median_ms:>11.1f}{r.min_ms:>9.1f}  {', '.join(r.heavy_modules) or '-'}")
+    return "\n".join(lines)
+
+
+def find_regressions(results: List[BenchResult], baseline: List[Dict[str, Any]],
+                     tolerance: float) -> List[str]:
+    """Compare results with a baseline saved by --json.
+
+    A mode regresses when its throughput drops, or its p95 latency or peak
+    memory grows, by more than `tolerance` (a fraction, e.g. 0.2 for 20%).
+    """
+    previous = {entry["mode"]: entry for entry in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get(result.mode)
+        if base is None:
+            continue
+        if result.rules_per_sec < base["rules_per_sec"] * (1 - tolerance):
+            regressions.append(f"{result.mode}: rules/sec {base['rules_per_sec']} -> {result.rules_per_sec}")
+        for field in ("p95_ms", "max_rss_mb", "peak_memory_mb"):
+            current = getattr(result, field)
+            if base.get(field) and current is not None and current > base[field] * (1 + tolerance):
+                regressions.append(f"{result.mode}: {field} {base[field]} -> {current}")
+    return regressions
+
+
+def _format_mb(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def format_table(results: List[BenchResult]) -> str:
+    header = f"{'mode':<11}{'rules':>7}{'errors':>8}{'seconds':>9}{'rules/s':>10}" \
+             f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MB':>9}{'heap MB':>9}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(f"{r.mode:<11}{r.rules:>7}{r.errors:>8}{r.seconds:>9.2f}{r.rules_per_sec:>10.2f}"
+                     f"{r.p50_ms:>9.1f}{r.p95_ms:>9.1f}{r.p99_ms:>9.1f}"
+                     f"{_format_mb(r.max_rss_mb):>9}{_format_mb(r.peak_memory_mb):>9}")
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark rule analysis end to end against a mock LLM server')
+    parser.add_argument('--rules', nargs='+', metavar='PATH',
+                        help='Rule files or directories to analyze (default: synthetic rules)')
+    parser.add_argument('--count', type=int, default=100,
+                        help='Number of synthetic rules when --rules is not given (default: 100)')
+    parser.add_argument('--modes', default=','.join(MODES),
+                        help=f'Comma-separated modes to run (default: {",".join(MODES)})')
+    parser.add_argument('--provider', default='perplexity', choices=['perplexity', 'ollama'],
+                        help='Provider API to exercise (default: perplexity)')
+    parser.add_argument('--concurrency', '-j', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Worker threads in batch mode (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--async-concurrency', type=int, default=DEFAULT_ASYNC_CONCURRENCY,
+                        help=f'Coroutines in flight in concurrent mode (default: {DEFAULT_ASYNC_CONCURRENCY})')
+    parser.add_argument('--latency', type=float, default=0.05, help='Mock response latency in seconds (default: 0.05)')
+    parser.add_argument('--jitter', type=float, default=0.02, help='Mock latency jitter in seconds (default: 0.02)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of mock requests that fail (default: 0)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the mock server (default: 1)')
+    parser.add_argument('--url', help='Use an already running mock server instead of starting one')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Measure the peak Python heap of each mode with tracemalloc (slows the run)')
+    parser.add_argument('--json', metavar='PATH', help='Write results as JSON (usable as a --baseline later)')
+    parser.add_argument('--baseline', metavar='PATH', help='Fail if results regress against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed regression against the baseline as a fraction (default: 0.2)')
+    parser.add_argument('--imports', nargs='*', metavar='MODULE',
+                        help=f'Measure cold import times instead (default modules: {", ".join(IMPORT_MODULES)})')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Fresh interpreters per module with --imports (default: 5)')
+    args = parser.parse_args()
+
+    if args.imports is not None:
+        try:
+            import_results = [measure_import_time(module, args.repeat) for module in args.imports or IMPORT_MODULES]
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return 1
+        print(format_import_table(import_results))
+        if args.json:
+            with open(args.json, 'w') as handle:
+                json.dump([asdict(r) for r in import_results], handle, indent=2)
+        return 0
+
+    logging.basicConfig(level=os.getenv("log_level", "warning").upper())
+    global trace_memory
+    trace_memory = args.trace_memory
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        print(f"Error: unknown mode(s): {', '.join(unknown)}")
+        return 1
+    if args.rules:
+        rules = [block.text for block in iter_rules_from_paths(args.rules)]
+    else:
+        rules = synthetic_rules(args.count)
+    if not rules:
+        print("Error: no rules to benchmark")
+        return 1
+
+    results = run_benchmark(rules, args.provider, modes, args.concurrency, args.async_concurrency, args.url,
+                            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+    print(format_table(results))
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump([asdict(r) for r in results], handle, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as handle:
+            regressions = find_regressions(results, json.load(handle), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
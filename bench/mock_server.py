@@ -0,0 +1,261 @@
+# Description: Local stand-in for the Perplexity and Ollama HTTP APIs.
+# Serves canned analyses with configurable latency, jitter and error rates so
+# the analyzer can be exercised and benchmarked end to end without network
+# access or API keys.
+
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MOCK_ANALYSIS = """## Rule Overview
+This rule detects requests sent by well-known security scanners by matching the User-Agent header.
+
+## Security Impact
+Blocks automated reconnaissance before it reaches the application.
+
+## Effectiveness and False Positives
+Effective against unmodified scanners; legitimate clients rarely send these strings.
+
+## Improvement Suggestions
+Anchor the pattern to word boundaries to avoid matching unrelated agents.
+
+## Summary
+A low-cost, high-signal scanner detection rule.
+"""
+
+
+class MockSettings:
+    """Behaviour of the mock server, adjustable while it is running."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 chunks: int = 8, seed: Optional[int] = None):
+        """Initialize the settings.
+
+        Args:
+            latency: Base seconds before a response is sent
+            jitter: Extra random seconds (uniform 0..jitter) added to the latency
+            error_rate: Fraction of requests (0..1) answered with HTTP 503
+            chunks: Number of pieces a streamed response is split into
+            seed: Seed for reproducible jitter and errors
+        """
+        if not 0 <= error_rate <= 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunks = max(1, chunks)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def draw(self) -> Dict[str, Any]:
+        """Return the delay and failure decision for one request."""
+        with self._lock:
+            self.requests += 1
+            return {
+                "delay": self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0),
+                "fail": self._random.random() < self.error_rate,
+            }
+
+
+def _split(text: str, parts: int) -> List[str]:
+    size = max(1, -(-len(text) // parts))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """Answers Perplexity chat completions and Ollama generate/tags requests."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY every
+    # response would wait on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    @property
+    def settings(self) -> MockSettings:
+        return self.server.settings
+
+    def log_message(self, format: str, *args: Any):
+        logger.debug("mock server: " + format, *args)
+
+    def _send_json(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, content_type: str, lines: Iterator[str], delay: float):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for line in lines:
+            data = line.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+            if delay:
+                time.sleep(delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "gemma3:latest"}]})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        payload = self._read_json()
+        outcome = self.settings.draw()
+        if self.path not in ("/chat/completions", "/api/generate"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        stream = bool(payload.get("stream"))
+        # Streams spread the latency over their chunks, like a real model
+        if not stream and outcome["delay"]:
+            time.sleep(outcome["delay"])
+        if outcome["fail"]:
+            if stream and outcome["delay"]:
+                time.sleep(outcome["delay"])
+            self._send_json(503, {"error": {"message": "Mock server: simulated overload"}})
+            return
+        chunk_delay = outcome["delay"] / self.settings.chunks if stream else 0.0
+        if self.path == "/chat/completions":
+            self._chat_completions(payload, stream, chunk_delay)
+        else:
+            self._generate(payload, stream, chunk_delay)
+
+    def _chat_completions(self, payload: Dict[str, Any], stream: bool, chunk_delay: float):
+        prompt = " ".join(m.get("content", "") for m in payload.get("messages", []))
+        usage = {
+            "prompt_tokens": len(prompt.split()),
+            "completion_tokens": len(MOCK_ANALYSIS.split()),
+            "total_tokens": len(prompt.split()) + len(MOCK_ANALYSIS.split()),
+        }
+        if not stream:
+            self._send_json(200, {
+                "id": "mock-completion",
+                "model": payload.get("model"),
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "usage": usage,
+                "citations": ["https://coreruleset.org/docs/"],
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": MOCK_ANALYSIS},
+                }],
+            })
+            return
+
+        model = payload.get("model")
+
+        def events() -> Iterator[str]:
+            for piece in _split(MOCK_ANALYSIS, self.settings.chunks):
+                yield "data: " + json.dumps({"model": model, "choices": [{"delta": {"content": piece}}]}) + "\n\n"
+            yield "data: " + json.dumps({"model": model, "choices": [{"delta": {}}], "usage": usage,
+                                         "citations": ["https://coreruleset.org/docs/"]}) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        self._send_stream("text/event-stream", events(), chunk_delay)
+
+    def _generate(self, payload: Dict[str, Any], stream: bool, chunk_delay: float):
+        model = payload.get("model")
+        counts = {"prompt_eval_count": len(payload.get("prompt", "").split()),
+                  "eval_count": len(MOCK_ANALYSIS.split())}
+        if not stream:
+            self._send_json(200, {"model": model, "response": MOCK_ANALYSIS, "done": True, **counts})
+            return
+
+        def lines() -> Iterator[str]:
+            for piece in _split(MOCK_ANALYSIS, self.settings.chunks):
+                yield json.dumps({"model": model, "response": piece, "done": False}) + "\n"
+            yield json.dumps({"model": model, "response": "", "done": True, **counts}) + "\n"
+
+        self._send_stream("application/x-ndjson", lines(), chunk_delay)
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops connections under concurrent load
+    request_queue_size = 256
+
+
+class MockLLMServer:
+    """Run the mock API on a background thread.
+
+    Usable as a context manager; `url` is the base URL to point
+    `perplexity_base_url` and `OLLAMA_HOST` at.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **settings: Any):
+        self.settings = MockSettings(**settings)
+        self._server = _MockHTTPServer((host, port), MockLLMHandler)
+        self._server.settings = self.settings
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted."""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Perplexity/Ollama API server for offline testing')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8089, help='Port to listen on (default: 8089)')
+    parser.add_argument('--latency', type=float, default=0.5, help='Base response latency in seconds (default: 0.5)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Extra random latency in seconds (default: 0.2)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with HTTP 503 (default: 0)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible runs')
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, seed=args.seed)
+    print(f"Mock LLM server listening on {server.url}")
+    print(f"  perplexity_base_url={server.url}  OLLAMA_HOST={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,29 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
+import json
 import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from dataclasses import asdict
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
 from dotenv import load_dotenv
-from app import analyze_modsec_rule, check_api_key
-from templates.prompt_template import PROMPT_TEMPLATE
+from analyzer import (analysis_record, analyze_modsec_rule, analyze_modsec_rule_async, analyze_rule_group,
+                      analyze_with_index, block_record, check_api_key, report_record, rule_data_dir,
+                      stream_modsec_rule)
+from engine.concurrency import DEFAULT_ASYNC_CONCURRENCY, DEFAULT_CONCURRENCY, run_async_concurrently, run_concurrently
+from engine.jobs import DEFAULT_MAX_ATTEMPTS, DONE, FAILED, PENDING, JobStore, get_job_store
+from engine.metrics import metrics
+from engine.usage import Budget, BudgetExceeded, set_budget, usage_ledger
+from llms.router import DEFAULT_HEDGE_AFTER, RoutingPolicy
+from rules.diff import RuleChange, diff_rule_sets
+from rules.regex_perf import analyze_rule_regexes
+from rules.similarity import DEFAULT_THRESHOLD, SimilarityIndex
+from rules.splitter import RuleBlock, extract_rule_id, group_rules, iter_rules_from_paths
+from templates.prompt_template import (ALL_SECTIONS, DEFAULT_SECTIONS, OPT_IN_SECTIONS, build_group_prompt_template,
+                                       build_prompt_template)
+from templates.report import SectionParser
 
 def read_rule_from_file(file_path: str) -> str:
     """Read a rule from a file.
@@ -21,30 +41,586 @@ def read_rule_from_file(file_path: str) -> str:
         print(f"Error reading rule file: {str(e)}")
         return None
 
+def analyze_batch(blocks: Iterable[RuleBlock], prompt_template: str, provider: str, output: TextIO,
+                  concurrency: int = DEFAULT_CONCURRENCY, similarity: Optional[float] = None,
+                  structured: bool = False, group_template: Optional[str] = None, group_size: int = 1,
+                  **options) -> int:
+    """Analyze rule blocks concurrently, streaming each result as a JSON line.
+
+    Records are written in completion order and flushed immediately so
+    partial results survive an interrupted run. A failing rule is recorded
+    with an `error` field and does not stop the batch.
+
+    With a similarity threshold, a rule that closely resembles an already
+    analyzed rule of the batch only gets a short delta analysis; its record
+    names that rule under `similar_to`.
+
+    With `structured`, records also carry the analysis split into its
+    sections under `report` (see templates.report.AnalysisReport).
+
+    With a group template and a group size above 1, consecutive rules of the
+    same file are sent together, up to group_size per request (see
+    analyzer.analyze_rule_group).
+
+    Args:
+        blocks: Rule blocks to analyze, typically from iter_rules_from_paths
+        prompt_template: The template to use for formatting the prompt
+        provider: The LLM provider to use
+        output: Writable text stream receiving the JSONL records
+        concurrency: Maximum number of analyses in flight
+        similarity: Minimum similarity (0..1] for reusing an analysis, or None
+            to analyze every rule in full
+        structured: Add the per-section `report` to each record
+        group_template: Multi-rule template from build_group_prompt_template
+        group_size: Maximum number of rules per provider request
+        **options: Extra keyword arguments for analyze_modsec_rule (e.g. use_cache)
+
+    Returns:
+        The number of rules that failed to analyze
+    """
+    if group_template is not None and group_size > 1:
+        return _analyze_groups(group_rules(blocks, group_size), prompt_template, group_template, provider,
+                               output, concurrency, structured, **options)
+    index = SimilarityIndex(similarity) if similarity is not None else None
+
+    def _analyze(block: RuleBlock):
+        if index is not None:
+            return analyze_with_index(block.text, prompt_template, index, provider=provider, **options)
+        return analyze_modsec_rule(block.text, prompt_template, provider=provider, **options)
+
+    failures = 0
+    for block, result, error in run_concurrently(_analyze, blocks, max_workers=concurrency):
+        failures += _write_result(output, block, result, error, structured)
+    return failures
+
+def _analyze_groups(groups: Iterable[List[RuleBlock]], prompt_template: str, group_template: str, provider: str,
+                    output: TextIO, concurrency: int, structured: bool, **options) -> int:
+    def _analyze(group: List[RuleBlock]):
+        return analyze_rule_group([block.text for block in group], prompt_template, group_template,
+                                  provider=provider, **options)
+
+    failures = 0
+    for group, results, error in run_concurrently(_analyze, groups, max_workers=concurrency):
+        for position, block in enumerate(group):
+            failures += _write_result(output, block, None if error else results[position], error, structured)
+    return failures
+
+async def analyze_batch_async(blocks: Iterable[RuleBlock], prompt_template: str, provider: str, output: TextIO,
+                              concurrency: int = DEFAULT_ASYNC_CONCURRENCY, structured: bool = False,
+                              **options) -> int:
+    """Analyze rule blocks on the running event loop, streaming each result as a JSON line.
+
+    Same output as analyze_batch, but analyses are coroutines awaiting the
+    providers' async HTTP clients, so hundreds can be in flight from one
+    thread.
+
+    Args:
+        blocks: Rule blocks to analyze, typically from iter_rules_from_paths
+        prompt_template: The template to use for formatting the prompt
+        provider: The LLM provider to use
+        output: Writable text stream receiving the JSONL records
+        concurrency: Maximum number of analyses in flight
+        structured: Add the per-section `report` to each record
+        **options: Extra keyword arguments for analyze_modsec_rule_async
+
+    Returns:
+        The number of rules that failed to analyze
+    """
+    async def _analyze(block: RuleBlock):
+        return await analyze_modsec_rule_async(block.text, prompt_template, provider=provider, **options)
+
+    failures = 0
+    try:
+        async for block, result, error in run_async_concurrently(_analyze, blocks, max_in_flight=concurrency):
+            failures += _write_result(output, block, result, error, structured)
+    finally:
+        # Imported here: the HTTP client stack is only needed once a provider is used
+        from llms.http import close_async_client
+        await close_async_client()
+    return failures
+
+def _write_result(output: TextIO, block: RuleBlock, result: Dict, error: BaseException,
+                  structured: bool = False) -> int:
+    """Write the record of one analyzed block and return 1 if it failed."""
+    _write_record(output, _result_record(block, result, error, structured))
+    return 0 if error is None else 1
+
+def _result_record(block: RuleBlock, result: Dict, error: BaseException, structured: bool = False) -> Dict:
+    if error is None:
+        return analysis_record(block, result, structured)
+    return {**block_record(block), "error": str(error)}
+
+def _write_record(output: TextIO, record: Dict):
+    output.write(json.dumps(record) + "\n")
+    output.flush()
+
+@contextmanager
+def _open_output(output_path: str = None) -> Iterator[TextIO]:
+    if output_path:
+        with open(output_path, 'w') as output:
+            yield output
+    else:
+        yield sys.stdout
+
+def run_batch(paths, prompt_template: str, provider: str, output_path: str = None,
+              concurrency: int = DEFAULT_CONCURRENCY, use_async: bool = False,
+              similarity: Optional[float] = None, structured: bool = False,
+              group_template: Optional[str] = None, group_size: int = 1, **options) -> int:
+    """Run batch analysis over rule files/directories and return an exit code."""
+    blocks = iter_rules_from_paths(paths)
+    try:
+        with _open_output(output_path) as output:
+            if use_async:
+                failures = asyncio.run(
+                    analyze_batch_async(blocks, prompt_template, provider, output, concurrency,
+                                        structured, **options))
+            else:
+                failures = analyze_batch(blocks, prompt_template, provider, output, concurrency,
+                                         similarity, structured, group_template, group_size, **options)
+    except OSError as e:
+        print(f"Error reading rule file: {str(e)}", file=sys.stderr)
+        return 1
+    if failures:
+        print(f"{failures} rule(s) failed to analyze", file=sys.stderr)
+        return 1
+    return 0
+
+def analyze_stored_run(store: JobStore, run_id: str, prompt_template: str, provider: str, output: TextIO,
+                       concurrency: int = DEFAULT_CONCURRENCY, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                       structured: bool = False, **options) -> int:
+    """Analyze the rules of a stored run that are not done yet, recording every outcome.
+
+    Records of rules finished by earlier attempts are written first, then new
+    results stream out as they complete. Each rule's state is committed as
+    soon as it changes, so an interrupted run loses at most the analyses in
+    flight.
+
+    Rules stopped by an exhausted budget are returned to pending without
+    using up an attempt, so a later resume with a larger budget picks them up.
+
+    Args:
+        store: Job store holding the run
+        run_id: Run to continue
+        prompt_template: The template to use for formatting the prompt
+        provider: The LLM provider to use
+        output: Writable text stream receiving the JSONL records
+        concurrency: Maximum number of analyses in flight
+        max_attempts: Attempts per rule, across resumes, before it stays failed
+        structured: Add the per-section `report` to each record
+        **options: Extra keyword arguments for analyze_modsec_rule
+
+    Returns:
+        The number of rules that are failed or left pending at the end of the run
+    """
+    todo = store.remaining(run_id, max_attempts)
+    retried = {position for position, _ in todo}
+    exhausted = 0
+    for position, record in store.records(run_id, (DONE, FAILED)):
+        if position not in retried:
+            _write_record(output, record)
+            exhausted += "error" in record
+
+    def _analyze(item):
+        position, block = item
+        store.mark_running(run_id, position)
+        return analyze_modsec_rule(block.text, prompt_template, provider=provider, **options)
+
+    failures = 0
+    for (position, block), result, error in run_concurrently(_analyze, todo, max_workers=concurrency):
+        if isinstance(error, BudgetExceeded):
+            store.mark_pending(run_id, position)
+            failures += 1
+            continue
+        record = _result_record(block, result, error, structured)
+        if error is None:
+            store.mark_done(run_id, position, record)
+        else:
+            store.mark_failed(run_id, position, record)
+            failures += 1
+        _write_record(output, record)
+    return exhausted + failures
+
+def run_stored(store: JobStore, run_id: str, output_path: str = None, concurrency: int = DEFAULT_CONCURRENCY,
+               max_attempts: int = DEFAULT_MAX_ATTEMPTS, routing: Optional[RoutingPolicy] = None) -> int:
+    """Run or resume a stored batch with the settings it was created with and return an exit code."""
+    config = store.run_config(run_id)
+    options = dict(config["options"], routing=routing)
+    with _open_output(output_path) as output:
+        failures = analyze_stored_run(store, run_id, config["prompt_template"], config["provider"], output,
+                                      concurrency, max_attempts, config["structured"], **options)
+    counts = store.counts(run_id)
+    print(f"Run {run_id}: {counts[DONE]} done, {counts[FAILED]} failed, {counts[PENDING]} pending",
+          file=sys.stderr)
+    if failures:
+        print(f"{failures} rule(s) not analyzed; retry them with --resume {run_id}", file=sys.stderr)
+        return 1
+    return 0
+
+def load_previous_results(path: str) -> Dict[str, Dict]:
+    """Load analyses from an earlier JSONL run, keyed by rule id."""
+    previous = {}
+    with open(path, 'r') as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("rule_id") and record.get("analysis"):
+                previous[record["rule_id"]] = record
+    return previous
+
+def analyze_diff(changes: List[RuleChange], prompt_template: str, provider: str, output: TextIO,
+                 previous: Dict[str, Dict] = None, concurrency: int = DEFAULT_CONCURRENCY,
+                 structured: bool = False, **options) -> Dict[str, int]:
+    """Analyze only added and modified rules, reusing prior results for the rest.
+
+    Unchanged rules without a prior result are analyzed as well (usually a
+    cache hit). Reused and removed rules are written first, then the new
+    analyses stream out as they complete. Every record carries a `change`
+    status and, for modified rules, a list of `changes`.
+
+    Args:
+        changes: Output of diff_rule_sets
+        prompt_template: The template to use for formatting the prompt
+        provider: The LLM provider to use
+        output: Writable text stream receiving the JSONL records
+        previous: Prior results keyed by rule id (see load_previous_results)
+        concurrency: Maximum number of analyses in flight
+        structured: Add the per-section `report` to records with an analysis
+        **options: Extra keyword arguments for analyze_modsec_rule
+
+    Returns:
+        Counts per change status plus `analyzed`, `reused` and `failed`
+    """
+    previous = previous or {}
+    summary = {"added": 0, "modified": 0, "unchanged": 0, "removed": 0, "analyzed": 0, "reused": 0, "failed": 0}
+
+    def _record(change: RuleChange, analysis: Optional[Dict] = None) -> Dict:
+        block = change.new or change.old
+        record = block_record(block) if analysis is None else analysis_record(block, analysis, structured)
+        record.update({"rule_id": change.rule_id, "change": change.status, "changes": change.details})
+        return record
+
+    pending = []
+    for change in changes:
+        summary[change.status] += 1
+        prior = previous.get(change.rule_id)
+        if change.needs_analysis or (change.new is not None and prior is None):
+            pending.append(change)
+            continue
+        if change.new is None:
+            record = _record(change)
+        else:
+            # The prior record's model, usage and citations describe the reused analysis
+            record = _record(change, {**prior, "markdown_content": prior["analysis"]})
+            summary["reused"] += 1
+        _write_record(output, record)
+
+    def _analyze(change: RuleChange):
+        return analyze_modsec_rule(change.new.text, prompt_template, provider=provider, **options)
+
+    for change, result, error in run_concurrently(_analyze, pending, max_workers=concurrency):
+        if error is None:
+            record = _record(change, result)
+            summary["analyzed"] += 1
+        else:
+            record = _record(change)
+            record["error"] = str(error)
+            summary["failed"] += 1
+        _write_record(output, record)
+    return summary
+
+def run_diff(old_path: str, new_path: str, prompt_template: str, provider: str, output_path: str = None,
+             previous_path: str = None, concurrency: int = DEFAULT_CONCURRENCY, structured: bool = False,
+             **options) -> int:
+    """Run diff mode between two rule trees and return an exit code."""
+    try:
+        previous = load_previous_results(previous_path) if previous_path else {}
+        changes = list(diff_rule_sets(iter_rules_from_paths([old_path]), iter_rules_from_paths([new_path])))
+        with _open_output(output_path) as output:
+            summary = analyze_diff(changes, prompt_template, provider, output, previous, concurrency,
+                                   structured, **options)
+    except (OSError, ValueError) as e:
+        print(f"Error reading rule file: {str(e)}", file=sys.stderr)
+        return 1
+    print(
+        f"Diff: {summary['added']} added, {summary['modified']} modified, "
+        f"{summary['unchanged']} unchanged, {summary['removed']} removed; "
+        f"{summary['analyzed']} analyzed, {summary['reused']} reused, {summary['failed']} failed",
+        file=sys.stderr,
+    )
+    return 1 if summary["failed"] else 0
+
+def run_regex_check(paths, output_path: str = None) -> int:
+    """Write one JSONL record per `@rx` pattern with its backtracking analysis.
+
+    Patterns are measured one at a time so timings are not skewed by
+    parallel work.
+
+    Returns:
+        1 if any pattern backtracks polynomially or exponentially (or a file
+        cannot be read), else 0
+    """
+    dangerous = total = 0
+    try:
+        with _open_output(output_path) as output:
+            for block in iter_rules_from_paths(paths):
+                for report in analyze_rule_regexes(block.text):
+                    total += 1
+                    dangerous += report.dangerous
+                    record = block_record(block)
+                    record.update(asdict(report))
+                    _write_record(output, record)
+    except OSError as e:
+        print(f"Error reading rule file: {str(e)}", file=sys.stderr)
+        return 1
+    print(f"Regex check: {total} pattern(s), {dangerous} with super-linear backtracking", file=sys.stderr)
+    return 1 if dangerous else 0
+
 def main():
     parser = argparse.ArgumentParser(description='Analyze ModSecurity rules using AI')
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('rule', nargs='?', help='The ModSecurity rule to analyze')
     group.add_argument('--file', '-f', help='Path to a file containing the ModSecurity rule to analyze')
+    group.add_argument('--batch', '-b', nargs='+', metavar='PATH',
+                       help='Rule files or directories of .conf files to analyze rule by rule (JSONL output)')
+    group.add_argument('--regex-check', nargs='+', metavar='PATH',
+                       help='Measure backtracking of every @rx pattern in rule files/directories, '
+                            'without calling a provider (JSONL output)')
+    group.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'),
+                       help='Compare two rule trees by rule id and only analyze added or modified rules (JSONL output)')
+    group.add_argument('--resume', metavar='RUN_ID',
+                       help='Continue a batch run started with --run-id, skipping rules already analyzed (JSONL output)')
+    parser.add_argument('--output', '-o',
+                       help='Write batch/diff results to this JSONL file instead of stdout',
+                       default=None)
+    parser.add_argument('--previous',
+                       help='JSONL results of an earlier run; reused for rules unchanged in --diff mode',
+                       default=None)
+    parser.add_argument('--concurrency', '-j', type=int,
+                       help=f'Maximum concurrent analyses in batch mode (default: {DEFAULT_CONCURRENCY}, '
+                            f'or {DEFAULT_ASYNC_CONCURRENCY} with --async)',
+                       default=None)
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                       help='Run batch analyses as asyncio coroutines instead of worker threads')
+    parser.add_argument('--structured', action='store_true',
+                       help='Split analyses into their report sections (JSON output, "report" field in batch/diff)')
+    parser.add_argument('--dedup', action='store_true',
+                       help='In batch mode, explain near-duplicate rules relative to an already analyzed rule')
+    parser.add_argument('--similarity', type=float, metavar='THRESHOLD', default=DEFAULT_THRESHOLD,
+                       help=f'Minimum similarity (0-1] for --dedup to reuse an analysis (default: {DEFAULT_THRESHOLD:g})')
+    parser.add_argument('--group-size', type=int, metavar='N', default=1,
+                       help='In batch mode, analyze up to N consecutive rules of the same file per provider request '
+                            '(default: 1)')
+    parser.add_argument('--run-id', metavar='RUN_ID',
+                       help='Record per-rule progress of a batch run in the job store so it can be resumed')
+    parser.add_argument('--job-store', metavar='PATH',
+                       help='SQLite job store for --run-id/--resume (default: $job_store_path or '
+                            '~/.cache/modsec-rule-analyzer/jobs.sqlite3)')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                       help=f'Attempts per rule across resumes before it stays failed (default: {DEFAULT_MAX_ATTEMPTS})')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Always call the provider instead of reusing cached analyses')
     parser.add_argument('--prompt-template', 
                        help='Custom prompt template (optional)',
                        default=None)  # We'll set the default after loading the template
+    parser.add_argument('--sections',
+                       help=f'Comma-separated report sections to generate (default: all but {", ".join(OPT_IN_SECTIONS)}). '
+                            f'Choices: {", ".join(ALL_SECTIONS)}',
+                       default=None)
+    parser.add_argument('--max-tokens', type=int,
+                       help='Completion token budget, split across the selected sections',
+                       default=None)
     parser.add_argument('--provider',
                        help='AI provider to use (default: perplexity)',
                        default="perplexity",
                        choices=['perplexity', 'openai', 'xcom', 'google', 'ollama'])
+    parser.add_argument('--fallback', nargs='+', metavar='PROVIDER', default=[],
+                       choices=['perplexity', 'openai', 'xcom', 'google', 'ollama'],
+                       help='Providers to try in order when the main provider fails or times out')
+    parser.add_argument('--hedge', metavar='PROVIDER',
+                       choices=['perplexity', 'openai', 'xcom', 'google', 'ollama'],
+                       help='Also ask this provider (e.g. ollama) when the main one is slow to answer')
+    parser.add_argument('--hedge-after', type=float, metavar='SECONDS', default=DEFAULT_HEDGE_AFTER,
+                       help=f'Seconds to wait before sending the hedged request (default: {DEFAULT_HEDGE_AFTER:g})')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                       help='Give up on a provider call after this many seconds')
+    parser.add_argument('--retries', type=int, default=0,
+                       help='Extra attempts per provider, with jittered backoff (default: 0)')
+    parser.add_argument('--max-total-tokens', type=int, metavar='TOKENS',
+                       help='Stop calling the provider once this many tokens have been spent')
+    parser.add_argument('--max-cost', type=float, metavar='USD',
+                       help='Stop calling the provider once this estimated cost (USD) has been spent')
+    parser.add_argument('--tokens-per-minute', type=float, metavar='TOKENS',
+                       help='Throttle provider calls to this token spend rate')
+    parser.add_argument('--metrics', metavar='PATH',
+                       help='Write per-stage timing metrics as JSON to this file when done')
+    parser.add_argument('--usage', metavar='PATH',
+                       help='Write token usage and estimated cost per provider and model as JSON to this file when done')
     args = parser.parse_args()
     
+    status = run(args)
+    print_usage_summary()
+    if args.metrics:
+        write_metrics(args.metrics)
+    if args.usage:
+        write_usage(args.usage)
+    return status
+
+def write_metrics(path: str):
+    """Write the per-stage timing snapshot collected during this run."""
+    try:
+        with open(path, 'w') as handle:
+            json.dump(metrics.snapshot(), handle, indent=2)
+    except OSError as e:
+        print(f"Error writing metrics file: {str(e)}", file=sys.stderr)
+
+def write_usage(path: str):
+    """Write the token usage and cost totals collected during this run."""
+    try:
+        with open(path, 'w') as handle:
+            json.dump(usage_ledger.snapshot(), handle, indent=2)
+    except OSError as e:
+        print(f"Error writing usage file: {str(e)}", file=sys.stderr)
+
+def print_usage_summary():
+    """Summarize the run's provider spend on stderr, if any provider reported usage."""
+    total = usage_ledger.total()
+    if not total.requests:
+        return
+    cost = f", ~${total.cost_usd:.4f}" if total.cost_usd is not None else ""
+    print(f"Usage: {total.requests} request(s), {total.tokens} tokens{cost}", file=sys.stderr)
+
+def run(args: argparse.Namespace) -> int:
+    """Execute the parsed command line and return an exit code."""
+    if args.regex_check:
+        return run_regex_check(args.regex_check, args.output)
+    
     # Load environment variables and check API key
     load_dotenv()
-    api_key = check_api_key(args.provider)
-    if not api_key:
-        print(f"Error: {args.provider}_api_key environment variable is not set")
+    store = None
+    if args.run_id or args.resume:
+        if args.run_id and not args.batch:
+            print("Error: --run-id is only supported with --batch")
+            return 1
+        if args.use_async or args.dedup:
+            print("Error: --run-id and --resume cannot be combined with --async or --dedup")
+            return 1
+        if args.max_attempts < 1:
+            print("Error: --max-attempts must be at least 1")
+            return 1
+        try:
+            store = get_job_store(args.job_store)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error opening job store: {str(e)}")
+            return 1
+    if args.resume:
+        config = store.run_config(args.resume)
+        if config is None:
+            print(f"Error: Unknown run: {args.resume}")
+            return 1
+        # A resumed run keeps the provider, template and options it was started with
+        args.provider = config["provider"]
+    
+    # Compose the prompt from the selected sections unless a custom template is given;
+    # the Technical Analysis section is built locally rather than by the LLM
+    if args.max_tokens is not None and args.max_tokens < 1:
+        print("Error: --max-tokens must be at least 1")
+        return 1
+    sections = [s.strip() for s in args.sections.split(',') if s.strip()] if args.sections else list(DEFAULT_SECTIONS)
+    include_technical_analysis = False
+    include_regex_performance = False
+    custom_template = args.prompt_template is not None
+    if not custom_template:
+        try:
+            args.prompt_template = build_prompt_template(sections, args.max_tokens)
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            return 1
+        include_technical_analysis = "technical_analysis" in sections
+        include_regex_performance = "regex_performance" in sections
+    elif args.sections:
+        print("Error: --sections cannot be combined with --prompt-template")
         return 1
+    # Selections of local sections only never call the provider, so need no API key
+    if (config["prompt_template"] if args.resume else args.prompt_template) is not None:
+        try:
+            check_api_key(args.provider)
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            return 1
+    if args.retries < 0 or args.hedge_after < 0:
+        print("Error: --retries and --hedge-after cannot be negative")
+        return 1
+    if args.timeout is not None and args.timeout <= 0:
+        print("Error: --timeout must be positive")
+        return 1
+    if args.use_async and not args.batch:
+        print("Error: --async is only supported with --batch")
+        return 1
+    if args.dedup and (not args.batch or args.use_async):
+        print("Error: --dedup is only supported with --batch and without --async")
+        return 1
+    if not 0 < args.similarity <= 1:
+        print("Error: --similarity must be greater than 0 and at most 1")
+        return 1
+    group_template = None
+    if args.group_size != 1:
+        if args.group_size < 1:
+            print("Error: --group-size must be at least 1")
+            return 1
+        if not args.batch or args.use_async or args.dedup or args.run_id:
+            print("Error: --group-size is only supported with --batch and without --async, --dedup or --run-id")
+            return 1
+        if custom_template:
+            print("Error: --group-size cannot be combined with --prompt-template")
+            return 1
+        group_template = build_group_prompt_template(sections, args.max_tokens)
+    limits = (args.max_total_tokens, args.max_cost, args.tokens_per_minute)
+    if any(limit is not None and limit <= 0 for limit in limits):
+        print("Error: --max-total-tokens, --max-cost and --tokens-per-minute must be positive")
+        return 1
+    if any(limit is not None for limit in limits):
+        set_budget(Budget(*limits))
+    routing = RoutingPolicy(args.fallback, args.hedge, args.hedge_after, args.timeout, args.retries)
+    options = {
+        "use_cache": not args.no_cache,
+        "include_technical_analysis": include_technical_analysis,
+        "include_regex_performance": include_regex_performance,
+        "max_tokens": args.max_tokens,
+        "routing": routing if routing.enabled else None,
+    }
     
-    # Set default template if none provided
-    if args.prompt_template is None:
-        args.prompt_template = PROMPT_TEMPLATE
+    if args.batch or args.diff or args.resume:
+        if args.concurrency is None:
+            args.concurrency = DEFAULT_ASYNC_CONCURRENCY if args.use_async else DEFAULT_CONCURRENCY
+        if args.concurrency < 1:
+            print("Error: --concurrency must be at least 1")
+            return 1
+        if args.run_id:
+            config = {
+                "provider": args.provider,
+                "prompt_template": args.prompt_template,
+                "structured": args.structured,
+                "options": {key: value for key, value in options.items() if key != "routing"},
+            }
+            try:
+                store.create_run(args.run_id, iter_rules_from_paths(args.batch), config)
+            except ValueError as e:
+                print(f"Error: {str(e)}; continue it with --resume {args.run_id}")
+                return 1
+            except OSError as e:
+                print(f"Error reading rule file: {str(e)}")
+                return 1
+        if args.run_id or args.resume:
+            return run_stored(store, args.run_id or args.resume, args.output, args.concurrency,
+                              args.max_attempts, options["routing"])
+        if args.diff:
+            return run_diff(args.diff[0], args.diff[1], args.prompt_template, args.provider, args.output,
+                            args.previous, args.concurrency, args.structured, **options)
+        return run_batch(args.batch, args.prompt_template, args.provider, args.output,
+                         args.concurrency, args.use_async, args.similarity if args.dedup else None,
+                         args.structured, group_template, args.group_size, **options)
     
     # Get the rule either from command line or file
     rule = args.rule
@@ -55,12 +631,20 @@ def main():
     
     # Analyze the rule
     try:
-        result = analyze_modsec_rule(rule, args.prompt_template, provider=args.provider)
+        if args.structured:
+            sections = SectionParser(extract_rule_id(rule))
+            for chunk in stream_modsec_rule(rule, args.prompt_template, provider=args.provider, **options):
+                sections.feed(chunk)
+            print(json.dumps(report_record(rule, sections.close(), rule_data_dir(args.file)), indent=2))
+            return 0
         print("\nAnalysis Result:")
         print("-" * 40)
         print(f"Rule: {rule}")
         print("-" * 40)
-        print(f"Analysis: {result['markdown_content']}")
+        print("Analysis: ", end="", flush=True)
+        for chunk in stream_modsec_rule(rule, args.prompt_template, provider=args.provider, **options):
+            print(chunk, end="", flush=True)
+        print()
         return 0
     except Exception as e:
         print(f"Error analyzing rule: {str(e)}")
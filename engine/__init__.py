@@ -0,0 +1,15 @@
+from .cache import AnalysisCache, get_analysis_cache, make_cache_key
+from .coalesce import SingleFlight
+from .concurrency import TokenBucket, get_rate_limiter, run_async_concurrently, run_concurrently
+from .jobs import JobStore, get_job_store
+from .resilience import CircuitBreaker, get_circuit_breaker
+from .usage import Budget, BudgetExceeded, UsageLedger, set_budget, usage_ledger
+
+__all__ = [
+    'AnalysisCache', 'get_analysis_cache', 'make_cache_key',
+    'SingleFlight',
+    'TokenBucket', 'get_rate_limiter', 'run_concurrently', 'run_async_concurrently',
+    'JobStore', 'get_job_store',
+    'CircuitBreaker', 'get_circuit_breaker',
+    'Budget', 'BudgetExceeded', 'UsageLedger', 'set_budget', 'usage_ledger',
+]
@@ -0,0 +1,167 @@
+# Description: Persistent, content-addressed cache of rule analyses.
+# Backed by SQLite with a TTL and size-based LRU eviction so re-analyzing an
+# unchanged rule set costs no API calls.
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from contextlib import closing, contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from rules.normalizer import canonicalize_rule
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "modsec-rule-analyzer", "analyses.sqlite3")
+DEFAULT_MAX_MB = 256
+DEFAULT_TTL_DAYS = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+
+
+def make_cache_key(rule: str, prompt_template: str, provider: str, model: Optional[str] = None,
+                   max_tokens: Optional[int] = None) -> str:
+    """Build the content-addressed key for an analysis.
+
+    The rule is canonicalized first, so cosmetic differences (whitespace,
+    action order, quoting) map to the same key.
+
+    Args:
+        rule: The ModSecurity rule being analyzed
+        prompt_template: The template used to build the prompt
+        provider: The LLM provider name
+        model: The provider's model name, if known
+        max_tokens: Completion token cap, if one was requested
+
+    Returns:
+        Hex SHA-256 digest identifying the analysis
+    """
+    parts = [canonicalize_rule(rule), prompt_template, provider, str(model or "")]
+    if max_tokens:
+        parts.append(max_tokens)
+    material = json.dumps(parts)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """SQLite-backed analysis cache with TTL expiry and LRU eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024,
+                 ttl: float = DEFAULT_TTL_DAYS * 86400):
+        """Open (or create) the cache database.
+
+        Args:
+            path: SQLite database file
+            max_bytes: Total size of stored analyses before LRU eviction kicks in
+            ttl: Seconds after which an entry is considered stale
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS analyses_accessed ON analyses (accessed)")
+        logger.debug("Analysis cache opened at %s", path)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection for one transaction, committed on success and closed afterwards."""
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            yield conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached analysis for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, created FROM analyses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl and now - created > self.ttl:
+                conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE analyses SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key: str, analysis: Dict[str, Any]):
+        """Store an analysis and evict least recently used entries if over size."""
+        value = json.dumps(analysis)
+        size = len(value.encode("utf-8"))
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        if self.ttl:
+            conn.execute("DELETE FROM analyses WHERE created < ?", (time.time() - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM analyses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM analyses ORDER BY accessed ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.debug("Evicted %s cached analyses", evicted)
+
+    def clear(self):
+        """Remove every cached analysis."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM analyses")
+
+    def __len__(self) -> int:
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+
+_cache: Optional[AnalysisCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """Return the process-wide analysis cache, or None if caching is disabled.
+
+    Configured through environment variables:
+        analysis_cache_path: Database file, or "off" to disable caching
+        analysis_cache_max_mb: Size limit before LRU eviction (default: 256)
+        analysis_cache_ttl_days: Entry lifetime in days (default: 30, 0 for no expiry)
+    """
+    global _cache
+    path = os.getenv("analysis_cache_path", DEFAULT_CACHE_PATH)
+    if not path or path.lower() == "off":
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            try:
+                _cache = AnalysisCache(
+                    path,
+                    max_bytes=int(float(os.getenv("analysis_cache_max_mb", DEFAULT_MAX_MB)) * 1024 * 1024),
+                    ttl=float(os.getenv("analysis_cache_ttl_days", DEFAULT_TTL_DAYS)) * 86400,
+                )
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Analysis cache disabled, could not open %s: %s", path, e)
+                return None
+        return _cache
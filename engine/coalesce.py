@@ -0,0 +1,96 @@
+# Description: Single-flight de-duplication of identical in-flight work.
+# Concurrent callers asking for the same key wait on one execution and share
+# its result instead of each calling the provider.
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FlightAbandoned(RuntimeError):
+    """Raised to followers when the leading caller gave up before finishing."""
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single execution."""
+
+    def __init__(self):
+        self._flights: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key: str) -> Tuple[bool, Future]:
+        """Join or start the flight for key.
+
+        Returns:
+            Tuple of (is_leader, future). The leader must call finish();
+            followers wait on future.result().
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                logger.debug("Joining in-flight analysis %s", key[:12])
+                return False, future
+            future = Future()
+            self._flights[key] = future
+            return True, future
+
+    def finish(self, key: str, future: Future, result: Any = None, error: BaseException = None):
+        """Publish the leader's outcome and close the flight."""
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """Run func once for all concurrent callers with the same key.
+
+        If the leader fails, every follower receives the same exception.
+        """
+        while True:
+            leader, future = self.begin(key)
+            if not leader:
+                try:
+                    return future.result()
+                except FlightAbandoned:
+                    continue
+            try:
+                result = func()
+            except BaseException as e:
+                self.finish(key, future, error=e if isinstance(e, Exception) else FlightAbandoned(str(e)))
+                raise
+            self.finish(key, future, result=result)
+            return result
+
+    async def do_async(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await func() once for all concurrent callers with the same key.
+
+        Flights are shared with do(), so async and threaded callers
+        coalesce with each other. A cancelled leader abandons the flight and
+        its followers retry.
+        """
+        while True:
+            leader, future = self.begin(key)
+            if not leader:
+                try:
+                    # Shielded so a cancelled follower does not cancel the shared future
+                    return await asyncio.shield(asyncio.wrap_future(future))
+                except FlightAbandoned:
+                    continue
+            try:
+                result = await func()
+            except BaseException as e:
+                self.finish(key, future, error=e if isinstance(e, Exception) else FlightAbandoned(str(e)))
+                raise
+            self.finish(key, future, result=result)
+            return result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
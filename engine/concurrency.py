@@ -0,0 +1,203 @@
+# Description: Bounded concurrent execution and per-provider rate limiting
+# for batch rule analysis, on a thread pool or an asyncio event loop.
+
+import os
+import asyncio
+import time
+import threading
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 4
+
+# Analyses kept in flight by the asyncio runner; each one costs a coroutine
+# and a pooled connection rather than a thread
+DEFAULT_ASYNC_CONCURRENCY = 100
+
+# Requests per minute allowed by each provider when no override is set.
+# Providers missing from this table (e.g. a local Ollama) are not throttled.
+DEFAULT_REQUESTS_PER_MINUTE: Dict[str, float] = {
+    "perplexity": 50,
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """Initialize the bucket.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum burst size (default: ten seconds of tokens, at least 1)
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate * 10)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, tokens: float) -> float:
+        """Take tokens if available; otherwise return the seconds to wait for them."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        """Take tokens from the bucket, blocking until they are available.
+
+        Args:
+            tokens: Number of tokens to take
+            timeout: Maximum seconds to wait (None waits indefinitely)
+
+        Returns:
+            True if the tokens were acquired, False if the timeout expired
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait_time = self._take(tokens)
+            if not wait_time:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_time = min(wait_time, remaining)
+            time.sleep(wait_time)
+
+    async def acquire_async(self, tokens: float = 1):
+        """Take tokens from the bucket, sleeping on the event loop until they are available."""
+        while True:
+            wait_time = self._take(tokens)
+            if not wait_time:
+                return
+            await asyncio.sleep(wait_time)
+
+
+_limiters: Dict[str, Optional[TokenBucket]] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> Optional[TokenBucket]:
+    """Return the shared rate limiter for a provider, or None if unthrottled.
+
+    The limit is read once from the `<provider>_requests_per_minute`
+    environment variable, falling back to DEFAULT_REQUESTS_PER_MINUTE.
+    A value of 0 disables throttling.
+    """
+    with _limiters_lock:
+        if provider not in _limiters:
+            configured = os.getenv(f"{provider}_requests_per_minute")
+            rpm = float(configured) if configured else DEFAULT_REQUESTS_PER_MINUTE.get(provider, 0)
+            _limiters[provider] = TokenBucket(rpm / 60.0) if rpm > 0 else None
+            logger.debug("Rate limit for %s: %s requests/minute", provider, rpm or 'unlimited')
+        return _limiters[provider]
+
+
+def reset_rate_limiters():
+    """Forget all rate limiters so limits are re-read from the environment."""
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def run_concurrently(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_workers: int = DEFAULT_CONCURRENCY,
+) -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+    """Apply func to items on a bounded thread pool, yielding as each finishes.
+
+    Items are pulled from the iterable lazily, so at most `max_workers`
+    items are in flight at any time and memory stays flat for large inputs.
+
+    Args:
+        func: Callable applied to each item
+        items: Iterable of work items
+        max_workers: Maximum number of concurrent calls
+
+    Yields:
+        Tuples of (item, result, error) in completion order. Exactly one of
+        result and error is meaningful; error is None on success.
+    """
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1")
+    iterator = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+
+        def _fill():
+            while len(in_flight) < max_workers:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                in_flight[executor.submit(func, item)] = item
+
+        _fill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                error = future.exception()
+                yield item, (None if error else future.result()), error
+            _fill()
+
+
+async def run_async_concurrently(
+    func: Callable[[Any], Awaitable[Any]],
+    items: Iterable[Any],
+    max_in_flight: int = DEFAULT_ASYNC_CONCURRENCY,
+) -> AsyncIterator[Tuple[Any, Any, Optional[BaseException]]]:
+    """Await func(item) for each item on the running event loop, yielding as each finishes.
+
+    The asyncio counterpart of run_concurrently: items are pulled lazily and
+    at most `max_in_flight` coroutines run at once, so hundreds of analyses
+    can be in flight from a single thread. Pending tasks are cancelled if the
+    caller stops iterating early.
+
+    Args:
+        func: Coroutine function applied to each item
+        items: Iterable of work items
+        max_in_flight: Maximum number of concurrent coroutines
+
+    Yields:
+        Tuples of (item, result, error) in completion order, as in
+        run_concurrently
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+    iterator = iter(items)
+    in_flight: Dict[asyncio.Future, Any] = {}
+
+    def _fill():
+        while len(in_flight) < max_in_flight:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            in_flight[asyncio.ensure_future(func(item))] = item
+
+    _fill()
+    try:
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = in_flight.pop(task)
+                error = task.exception()
+                yield item, (None if error else task.result()), error
+            _fill()
+    finally:
+        for task in in_flight:
+            task.cancel()
@@ -0,0 +1,166 @@
+# Description: Durable per-rule state of long batch runs.
+# Every rule of a run is stored in SQLite with its state (pending, running,
+# done or failed), attempt count and result record, so a run interrupted by a
+# crash or provider outage can be resumed without paying again for the rules
+# that already finished.
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from contextlib import closing, contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from rules.splitter import RuleBlock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_STORE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "modsec-rule-analyzer", "jobs.sqlite3")
+DEFAULT_MAX_ATTEMPTS = 3
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STATES = (PENDING, RUNNING, DONE, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rules (
+    run_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    rule TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    record TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (run_id, position)
+);
+CREATE INDEX IF NOT EXISTS rules_state ON rules (run_id, state);
+"""
+
+
+class JobStore:
+    """SQLite-backed store of batch runs and the state of each of their rules."""
+
+    def __init__(self, path: str = DEFAULT_JOB_STORE_PATH):
+        """Open (or create) the job database.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        logger.debug("Job store opened at %s", path)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection for one transaction, committed on success and closed afterwards."""
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            yield conn
+
+    def create_run(self, run_id: str, blocks: Iterable[RuleBlock], config: Dict[str, Any]) -> int:
+        """Record a new run with all of its rules pending.
+
+        Args:
+            run_id: Name of the run, used to resume it
+            blocks: The rules to analyze, in output order
+            config: JSON-serializable settings needed to resume the run
+
+        Returns:
+            The number of rules stored
+
+        Raises:
+            ValueError: If a run with this id already exists
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            try:
+                conn.execute("INSERT INTO runs (id, config, created) VALUES (?, ?, ?)",
+                             (run_id, json.dumps(config), now))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Run {run_id} already exists")
+            rows = [(run_id, position, block.source, block.line, block.text, PENDING, now)
+                    for position, block in enumerate(blocks)]
+            conn.executemany(
+                "INSERT INTO rules (run_id, position, source, line, rule, state, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows)
+        logger.info("Created run %s with %d rules", run_id, len(rows))
+        return len(rows)
+
+    def run_config(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Return the settings a run was created with, or None if it does not exist."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT config FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def counts(self, run_id: str) -> Dict[str, int]:
+        """Return the number of rules of a run in each state."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT state, COUNT(*) FROM rules WHERE run_id = ? GROUP BY state",
+                                (run_id,)).fetchall()
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def remaining(self, run_id: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> List[Tuple[int, RuleBlock]]:
+        """Return the (position, rule) pairs still to analyze, in order.
+
+        Pending rules, rules left running by an interrupted process and
+        failed rules with attempts to spare are included.
+        """
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT position, rule, source, line FROM rules WHERE run_id = ? "
+                "AND (state IN (?, ?) OR (state = ? AND attempts < ?)) ORDER BY position",
+                (run_id, PENDING, RUNNING, FAILED, max_attempts)).fetchall()
+        return [(position, RuleBlock(rule, source, line)) for position, rule, source, line in rows]
+
+    def records(self, run_id: str, states: Iterable[str] = (DONE, FAILED)) -> List[Tuple[int, Dict[str, Any]]]:
+        """Return the (position, record) pairs of the rules in the given states, in order."""
+        states = list(states)
+        placeholders = ", ".join("?" * len(states))
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT position, record FROM rules WHERE run_id = ? AND state IN ({placeholders}) "
+                "AND record IS NOT NULL ORDER BY position",
+                [run_id] + states).fetchall()
+        return [(position, json.loads(record)) for position, record in rows]
+
+    def mark_running(self, run_id: str, position: int):
+        """Mark a rule as being analyzed, counting the attempt."""
+        self._update(run_id, position, "state = ?, attempts = attempts + 1", (RUNNING,))
+
+    def mark_pending(self, run_id: str, position: int):
+        """Return a rule that was never sent to the provider to pending, refunding its attempt."""
+        self._update(run_id, position, "state = ?, attempts = MAX(attempts - 1, 0)", (PENDING,))
+
+    def mark_done(self, run_id: str, position: int, record: Dict[str, Any]):
+        self._update(run_id, position, "state = ?, record = ?", (DONE, json.dumps(record)))
+
+    def mark_failed(self, run_id: str, position: int, record: Dict[str, Any]):
+        self._update(run_id, position, "state = ?, record = ?", (FAILED, json.dumps(record)))
+
+    def _update(self, run_id: str, position: int, assignments: str, values: Tuple[Any, ...]):
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE rules SET {assignments}, updated = ? WHERE run_id = ? AND position = ?",
+                         values + (time.time(), run_id, position))
+
+
+def get_job_store(path: Optional[str] = None) -> JobStore:
+    """Open the job store at path, else at the `job_store_path` environment variable or the default."""
+    return JobStore(path or os.getenv("job_store_path") or DEFAULT_JOB_STORE_PATH)
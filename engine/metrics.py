@@ -0,0 +1,133 @@
+# Description: Lightweight per-stage timing instrumentation.
+# Each analysis records how long it spent in key lookup, client build,
+# prompt formatting, network and response parsing. Timings are aggregated
+# in-process and can be exported as a JSON snapshot or JSON log lines.
+
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Number of most recent samples kept per stage for percentile estimates
+RESERVOIR_SIZE = 1024
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("analysis_trace", default=None)
+
+
+class StageStats:
+    """Running statistics for one stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples: List[float] = []
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self._samples) >= RESERVOIR_SIZE:
+            self._samples.pop(0)
+        self._samples.append(seconds)
+
+    def _percentile(self, fraction: float) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, float]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "p50_ms": round(self._percentile(0.50) * 1000, 3),
+            "p95_ms": round(self._percentile(0.95) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe aggregate of stage timings keyed by stage name."""
+
+    def __init__(self):
+        self._stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.add(seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Return a JSON-serializable view of all stage statistics."""
+        with self._lock:
+            return {stage: stats.snapshot() for stage, stats in sorted(self._stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+metrics = MetricsRegistry()
+
+
+class Trace:
+    """Stage timings collected for a single operation."""
+
+    def __init__(self, name: str, **labels: Any):
+        self.name = name
+        self.labels = labels
+        self.stages: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "event": self.name,
+            **self.labels,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+        }
+
+
+@contextmanager
+def trace(name: str, **labels: Any) -> Iterator[Trace]:
+    """Collect the stages timed inside the block into one trace.
+
+    When the block exits, the total is added to the registry under `name`
+    and, if debug logging is enabled, the trace is logged as one JSON line.
+    """
+    current = Trace(name, **labels)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        metrics.observe(name, time.perf_counter() - current.started)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s", json.dumps(current.to_dict()))
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time a stage, recording it globally and on the active trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe(stage, elapsed)
+        current = _current_trace.get()
+        if current is not None:
+            current.add(stage, elapsed)
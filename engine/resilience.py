@@ -0,0 +1,120 @@
+# Description: Circuit breakers and retry backoff for provider calls.
+# A provider that keeps failing is skipped for a cool-down period instead of
+# making every analysis wait for it to time out again.
+
+import os
+import random
+import time
+import threading
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RESET_TIMEOUT = 30.0
+
+
+class CircuitBreaker:
+    """Thread-safe consecutive-failure circuit breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    rejects calls for `reset_timeout` seconds. It then lets a single trial
+    call through (half-open); success closes it, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be at least 1")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if now - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted now."""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """Give back a half-open trial whose call ended without an outcome (e.g. it was cancelled)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """Return the shared circuit breaker for a provider.
+
+    The threshold and cool-down are read once from the
+    `<provider>_failure_threshold` and `<provider>_circuit_reset_seconds`
+    environment variables.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            threshold = int(os.getenv(f"{provider}_failure_threshold", DEFAULT_FAILURE_THRESHOLD))
+            reset = float(os.getenv(f"{provider}_circuit_reset_seconds", DEFAULT_RESET_TIMEOUT))
+            breaker = _breakers[provider] = CircuitBreaker(threshold, reset)
+        return breaker
+
+
+def reset_circuit_breakers():
+    """Forget all circuit breakers (used by tests and after config changes)."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Return a "full jitter" exponential backoff delay for a retry.
+
+    Args:
+        attempt: Zero-based retry number
+        base: Delay ceiling for the first retry, in seconds
+        cap: Maximum delay ceiling, in seconds
+
+    Returns:
+        A random delay between 0 and min(cap, base * 2 ** attempt)
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
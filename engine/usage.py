@@ -0,0 +1,248 @@
+# Description: Token and cost accounting for provider calls.
+# Providers report the `usage` block of every response to a process-wide
+# ledger that aggregates it per provider and model. An optional budget caps
+# the total tokens or cost a run may spend and can pace spending to a token
+# rate, so batch throughput can be traded against cost.
+
+import os
+import json
+import threading
+import logging
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from .concurrency import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# USD list prices per model: per million input/output/citation tokens and
+# per thousand search queries. Override or extend with the `model_prices`
+# environment variable (JSON of the same shape). Models without a price get
+# no cost estimate rather than a guessed one.
+DEFAULT_PRICES: Dict[str, Dict[str, float]] = {
+    "sonar": {"input": 1.0, "output": 1.0, "search": 5.0},
+    "sonar-pro": {"input": 3.0, "output": 15.0, "search": 6.0},
+    "sonar-reasoning": {"input": 1.0, "output": 5.0, "search": 5.0},
+    "sonar-reasoning-pro": {"input": 2.0, "output": 8.0, "search": 6.0},
+    "sonar-deep-research": {"input": 2.0, "output": 8.0, "citation": 2.0, "search": 5.0},
+}
+
+# Providers that run locally and cost nothing per token
+FREE_PROVIDERS = frozenset(("ollama",))
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised instead of calling a provider once the run's budget is spent."""
+
+
+@dataclass
+class UsageTotals:
+    """Accumulated usage of one provider and model."""
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    citation_tokens: int = 0
+    search_queries: int = 0
+    cost_usd: Optional[float] = 0.0
+
+    @property
+    def tokens(self) -> int:
+        """Billed tokens: prompt, completion and citation tokens."""
+        return self.prompt_tokens + self.completion_tokens + self.citation_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["tokens"] = self.tokens
+        if self.cost_usd is not None:
+            data["cost_usd"] = round(self.cost_usd, 6)
+        return data
+
+
+def _load_prices() -> Dict[str, Dict[str, float]]:
+    prices = dict(DEFAULT_PRICES)
+    configured = os.getenv("model_prices")
+    if configured:
+        try:
+            prices.update(json.loads(configured))
+        except (ValueError, TypeError) as e:
+            logger.warning("Ignoring invalid model_prices: %s", e)
+    return prices
+
+
+def usage_cost(provider: str, model: Optional[str], usage: Dict[str, Any],
+               prices: Optional[Dict[str, Dict[str, float]]] = None) -> Optional[float]:
+    """Estimate the USD cost of one response's usage block, or None if the model has no price."""
+    if provider in FREE_PROVIDERS:
+        return 0.0
+    price = (prices if prices is not None else _load_prices()).get(model or "")
+    if price is None:
+        return None
+    return (usage.get("prompt_tokens", 0) * price.get("input", 0)
+            + usage.get("completion_tokens", 0) * price.get("output", 0)
+            + usage.get("citation_tokens", 0) * price.get("citation", 0)) / 1_000_000 \
+        + usage.get("num_search_queries", 0) * price.get("search", 0) / 1000
+
+
+class UsageLedger:
+    """Thread-safe usage totals keyed by (provider, model)."""
+
+    def __init__(self):
+        self._totals: Dict[Tuple[str, str], UsageTotals] = {}
+        self._prices = _load_prices()
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model: Optional[str], usage: Optional[Dict[str, Any]]):
+        """Add the usage block of one provider response (missing fields count as 0)."""
+        usage = usage or {}
+        cost = usage_cost(provider, model, usage, self._prices)
+        with self._lock:
+            totals = self._totals.setdefault((provider, model or ""), UsageTotals())
+            totals.requests += 1
+            totals.prompt_tokens += int(usage.get("prompt_tokens") or 0)
+            totals.completion_tokens += int(usage.get("completion_tokens") or 0)
+            totals.citation_tokens += int(usage.get("citation_tokens") or 0)
+            totals.search_queries += int(usage.get("num_search_queries") or 0)
+            totals.cost_usd = None if cost is None or totals.cost_usd is None else totals.cost_usd + cost
+        budget = _budget
+        if budget is not None:
+            budget.spent(int(usage.get("prompt_tokens") or 0) + int(usage.get("completion_tokens") or 0)
+                         + int(usage.get("citation_tokens") or 0))
+
+    def total(self) -> UsageTotals:
+        """Sum over all providers and models (cost is None if any model lacks a price)."""
+        result = UsageTotals()
+        with self._lock:
+            for totals in self._totals.values():
+                result.requests += totals.requests
+                result.prompt_tokens += totals.prompt_tokens
+                result.completion_tokens += totals.completion_tokens
+                result.citation_tokens += totals.citation_tokens
+                result.search_queries += totals.search_queries
+                if result.cost_usd is not None:
+                    result.cost_usd = None if totals.cost_usd is None else result.cost_usd + totals.cost_usd
+        return result
+
+    def priced_cost(self) -> Tuple[float, bool]:
+        """Return the summed cost of the priced models and whether any model lacks a price."""
+        cost, unpriced = 0.0, False
+        with self._lock:
+            for totals in self._totals.values():
+                if totals.cost_usd is None:
+                    unpriced = True
+                else:
+                    cost += totals.cost_usd
+        return cost, unpriced
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serializable view: totals plus a breakdown per provider and model."""
+        with self._lock:
+            by_model = [{"provider": provider, "model": model or None, **totals.to_dict()}
+                        for (provider, model), totals in sorted(self._totals.items())]
+        return {"total": self.total().to_dict(), "by_model": by_model}
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._prices = _load_prices()
+
+
+usage_ledger = UsageLedger()
+
+
+class Budget:
+    """Spending limits for a run.
+
+    `max_tokens` and `max_cost` stop new provider calls once the ledger's
+    totals reach them (calls already in flight still complete). The cost
+    limit counts priced models only; spending on a model without a price is
+    logged once and not enforced.
+    `tokens_per_minute` throttles instead: tokens reported by finished calls
+    are paid off a token bucket before the next call may start.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, max_cost: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, ledger: UsageLedger = usage_ledger):
+        """Initialize the budget.
+
+        Args:
+            max_tokens: Stop once this many billed tokens have been spent
+            max_cost: Stop once this estimated USD cost has been spent
+            tokens_per_minute: Pace provider calls to this token rate
+            ledger: Ledger whose totals are checked against the limits
+
+        Raises:
+            ValueError: If a limit is not positive
+        """
+        for name, value in (("max_tokens", max_tokens), ("max_cost", max_cost),
+                            ("tokens_per_minute", tokens_per_minute)):
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be positive")
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.ledger = ledger
+        self._rate = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+        self._owed = 0
+        self._warned_unpriced = False
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Raise BudgetExceeded if a token or cost limit has been reached."""
+        total = self.ledger.total()
+        if self.max_tokens is not None and total.tokens >= self.max_tokens:
+            raise BudgetExceeded(f"Token budget exhausted ({total.tokens} of {self.max_tokens} tokens spent)")
+        if self.max_cost is None:
+            return
+        cost, unpriced = self.ledger.priced_cost()
+        if unpriced and not self._warned_unpriced:
+            self._warned_unpriced = True
+            logger.warning("Some models have no price (see model_prices); "
+                           "the cost budget only counts priced models")
+        if cost >= self.max_cost:
+            raise BudgetExceeded(f"Cost budget exhausted (${cost:.4f} of ${self.max_cost:.2f} spent)")
+
+    def spent(self, tokens: int):
+        """Note tokens used by a finished call; the next admitted call pays them off."""
+        if self._rate is not None and tokens:
+            with self._lock:
+                self._owed += tokens
+
+    def _take_owed(self) -> int:
+        with self._lock:
+            # One burst of the bucket at most, so a single huge response
+            # cannot demand more than the bucket can ever hold
+            owed, self._owed = min(self._owed, int(self._rate.capacity)), 0
+        return owed
+
+    def admit(self):
+        """Check the limits, then wait until the token rate allows another call.
+
+        Raises:
+            BudgetExceeded: If a token or cost limit has been reached
+        """
+        self.check()
+        if self._rate is not None:
+            owed = self._take_owed()
+            if owed:
+                self._rate.acquire(owed)
+
+    async def admit_async(self):
+        """Like admit, but waits on the event loop."""
+        self.check()
+        if self._rate is not None:
+            owed = self._take_owed()
+            if owed:
+                await self._rate.acquire_async(owed)
+
+
+_budget: Optional[Budget] = None
+
+
+def set_budget(budget: Optional[Budget]):
+    """Install (or with None, remove) the process-wide budget enforced before provider calls."""
+    global _budget
+    _budget = budget
+
+
+def get_budget() -> Optional[Budget]:
+    return _budget
@@ -1,4 +1,11 @@
 from .base import LLMProvider
-from .perplexity import PerplexityProvider
 
-__all__ = ['LLMProvider', 'PerplexityProvider']
\ No newline at end of file
+__all__ = ['LLMProvider', 'PerplexityProvider']
+
+
+def __getattr__(name):
+    # Providers pull in HTTP client libraries; import them only when asked for
+    if name == 'PerplexityProvider':
+        from .perplexity import PerplexityProvider
+        return PerplexityProvider
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
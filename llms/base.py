@@ -1,5 +1,7 @@
+import asyncio
+import functools
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Optional
 
 class LLMProvider(ABC):
     """Base class for LLM providers."""
@@ -10,13 +12,58 @@ class LLMProvider(ABC):
         pass
     
     @abstractmethod
-    def analyze(self, prompt: str) -> Dict[str, Any]:
+    def analyze(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
         """Send a prompt to the LLM and get the response.
         
         Args:
             prompt: The input prompt to send to the LLM
+            max_tokens: Optional cap on completion tokens (provider default if None)
             
         Returns:
             Dictionary containing the LLM response
         """
-        pass
\ No newline at end of file
+        pass
+
+    async def analyze_async(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Asynchronous variant of `analyze`.
+
+        Providers with an async HTTP client override this. The default runs
+        `analyze` on the event loop's default thread pool so every provider
+        can be awaited.
+
+        Args:
+            prompt: The input prompt to send to the LLM
+            max_tokens: Optional cap on completion tokens (provider default if None)
+
+        Returns:
+            Dictionary containing the LLM response
+        """
+        if max_tokens is None:
+            call = functools.partial(self.analyze, prompt)
+        else:
+            call = functools.partial(self.analyze, prompt, max_tokens=max_tokens)
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    def stream(self, prompt: str, max_tokens: Optional[int] = None) -> Iterator[str]:
+        """Send a prompt to the LLM and yield the response text as it arrives.
+
+        Providers without a streaming API fall back to a single chunk
+        containing the full `analyze` result.
+
+        Args:
+            prompt: The input prompt to send to the LLM
+            max_tokens: Optional cap on completion tokens (provider default if None)
+
+        Yields:
+            Successive pieces of the markdown response
+
+        Returns:
+            The response's other fields (e.g. model, usage, citations) as the
+            generator's return value once the stream is exhausted
+        """
+        if max_tokens is None:
+            result = self.analyze(prompt)
+        else:
+            result = self.analyze(prompt, max_tokens=max_tokens)
+        yield result.get("markdown_content", "")
+        return {key: value for key, value in result.items() if key != "markdown_content"}
\ No newline at end of file
@@ -1,28 +1,33 @@
-from typing import Dict, Type
+from typing import Dict, Optional, Tuple, Type, Union
 from .base import LLMProvider
-from .perplexity import PerplexityProvider
-from .openai import OpenAIProvider
-from .xcom import XComProvider
-from .google import GoogleProvider
-from .ollama import OllamaProvider
 import logging
+import importlib
+import threading
 
 logger = logging.getLogger(__name__)
 
 class LLMFactory:
-    """Factory class for creating LLM provider instances."""
+    """Factory class for creating LLM provider instances.
     
-    _providers: Dict[str, Type[LLMProvider]] = {
-        "perplexity": PerplexityProvider,
-        "openai": OpenAIProvider,
-        "xcom": XComProvider,
-        "google": GoogleProvider,
-        "ollama": OllamaProvider
+    Built-in providers are registered as "module:Class" paths and imported on
+    first use, so importing the factory does not load every provider's HTTP
+    stack.
+    """
+    
+    _providers: Dict[str, Union[str, Type[LLMProvider]]] = {
+        "perplexity": "llms.perplexity:PerplexityProvider",
+        "openai": "llms.openai:OpenAIProvider",
+        "xcom": "llms.xcom:XComProvider",
+        "google": "llms.google:GoogleProvider",
+        "ollama": "llms.ollama:OllamaProvider"
     }
     
+    # Provider instances built by get_client, keyed on (provider_name, api_key)
+    _clients: Dict[Tuple[str, Optional[str]], LLMProvider] = {}
+    _clients_lock = threading.Lock()
+    
     # Log registered providers on startup
-    logger.debug(f"LLMFactory initialized with providers: {list(_providers.keys())}")
-    print(f"LLMFactory loaded with providers: {list(_providers.keys())}")
+    logger.debug("LLMFactory initialized with providers: %s", list(_providers.keys()))
     
     @classmethod
     def create(cls, provider_name: str, api_key: str) -> LLMProvider:
@@ -38,27 +43,72 @@ class LLMFactory:
         Raises:
             ValueError: If the provider name is not recognized
         """
-        logger.debug(f"LLMFactory.create called with provider_name={provider_name}, api_key={'set' if api_key else 'not set'}")
-        logger.debug(f"Available providers: {list(cls._providers.keys())}")
-        print(f"LLMFactory.create called with provider_name={provider_name}")
-        print(f"Available providers: {list(cls._providers.keys())}")
-        print(f"Provider name in request: '{provider_name}'")
-        print(f"Provider name type: {type(provider_name)}")
-        print(f"All provider keys: {[repr(k) for k in cls._providers.keys()]}")
+        logger.debug("LLMFactory.create called with provider_name=%s, api_key=%s", provider_name, 'set' if api_key else 'not set')
+        provider_class = cls.provider_class(provider_name)
+        logger.debug("Instantiating provider class: %s", provider_class)
+        return provider_class(api_key)
+    
+    @classmethod
+    def provider_class(cls, provider_name: str) -> Type[LLMProvider]:
+        """Return the class of a registered provider, importing its module on first use.
+        
+        Raises:
+            ValueError: If the provider name is not recognized
+        """
         provider_class = cls._providers.get(provider_name)
-        print(f"Provider class found: {provider_class}")
         if provider_class is None:
-            logger.error(f"Unknown LLM provider: {provider_name}")
+            logger.error("Unknown LLM provider: %s", provider_name)
             raise ValueError(f"Unknown LLM provider: {provider_name}")
-        logger.debug(f"Instantiating provider class: {provider_class}")
-        return provider_class(api_key)
+        if isinstance(provider_class, str):
+            module_name, _, class_name = provider_class.partition(":")
+            provider_class = getattr(importlib.import_module(module_name), class_name)
+            cls._providers[provider_name] = provider_class
+        return provider_class
+    
+    @classmethod
+    def get_client(cls, provider_name: str, api_key: Optional[str]) -> LLMProvider:
+        """Return a shared provider instance, creating it on first use.
+        
+        Instances are cached per provider and API key for the life of the
+        process, so their configuration and connection pools are reused.
+        
+        Args:
+            provider_name: Name of the LLM provider
+            api_key: API key for the provider
+            
+        Returns:
+            The cached instance of the specified LLM provider
+            
+        Raises:
+            ValueError: If the provider name is not recognized
+        """
+        key = (provider_name, api_key)
+        client = cls._clients.get(key)
+        if client is not None:
+            return client
+        with cls._clients_lock:
+            client = cls._clients.get(key)
+            if client is None:
+                client = cls.create(provider_name, api_key)
+                cls._clients[key] = client
+            return client
+    
+    @classmethod
+    def clear_clients(cls, provider_name: Optional[str] = None):
+        """Drop cached provider instances (all, or only those of one provider)."""
+        with cls._clients_lock:
+            for key in list(cls._clients):
+                if provider_name is None or key[0] == provider_name:
+                    del cls._clients[key]
     
     @classmethod
-    def register_provider(cls, name: str, provider_class: Type[LLMProvider]):
+    def register_provider(cls, name: str, provider_class: Union[str, Type[LLMProvider]]):
         """Register a new LLM provider.
         
         Args:
             name: Name to register the provider under
-            provider_class: The provider class to register
+            provider_class: The provider class, or a "module:Class" path to
+                import on first use
         """
-        cls._providers[name] = provider_class
\ No newline at end of file
+        cls._providers[name] = provider_class
+        cls.clear_clients(name)
\ No newline at end of file
@@ -0,0 +1,74 @@
+# Description: Shared HTTP session for LLM providers.
+# A single keep-alive session with a connection pool avoids a TCP/TLS
+# handshake on every analysis request. Async providers share one httpx
+# client per event loop for the same reason.
+
+import asyncio
+import itertools
+import threading
+import weakref
+from typing import List
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Upper bound on pooled connections per host; keep it at or above the
+# batch concurrency so worker threads do not queue for a connection.
+POOL_MAXSIZE = 32
+
+# Connection limit for the async client; keep it at or above the async batch
+# concurrency (engine.concurrency.DEFAULT_ASYNC_CONCURRENCY)
+ASYNC_POOL_MAXSIZE = 128
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide pooled requests session."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def close_session():
+    """Close the shared session and its pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+# httpcore's pool scans every connection for every queued request, which
+# turns quadratic with hundreds of connections; several small pools used
+# round-robin keep that scan short
+ASYNC_POOL_SHARDS = 8
+
+# httpx.AsyncClient is bound to the event loop it was first used on
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, List[httpx.AsyncClient]]" = \
+    weakref.WeakKeyDictionary()
+_next_shard = itertools.count()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return one of the pooled async HTTP clients of the running event loop."""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.get(loop)
+    if clients is None:
+        size = max(1, ASYNC_POOL_MAXSIZE // ASYNC_POOL_SHARDS)
+        limits = httpx.Limits(max_connections=size, max_keepalive_connections=size)
+        clients = _async_clients[loop] = [httpx.AsyncClient(limits=limits) for _ in range(ASYNC_POOL_SHARDS)]
+    return clients[next(_next_shard) % len(clients)]
+
+
+async def close_async_client():
+    """Close the running event loop's async clients and their pooled connections."""
+    for client in _async_clients.pop(asyncio.get_running_loop(), []):
+        await client.aclose()
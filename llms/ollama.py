@@ -1,52 +1,176 @@
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Optional
 from .base import LLMProvider
+from .http import get_async_client, get_session
+from engine.metrics import timed
+from engine.usage import usage_ledger
 import os
+import json
+import time
 import logging
-import requests
-
-print("OllamaProvider module loaded successfully")
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Seconds a successful health check is trusted before the server is probed again
+HEALTH_CHECK_TTL = 30.0
+
+_healthy_until = {}
+_health_lock = threading.Lock()
+
 class OllamaProvider(LLMProvider):
     def __init__(self, api_key: str = None):
         # Ollama does not require an API key, but keep for interface compatibility
         self.api_key = api_key
         self.host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
         self.model = "gemma3:latest"  # Use the latest version of gemma3
-        logger.debug(f"[OllamaProvider] Initialized with host: {self.host}, model: {self.model}")
+        self.session = get_session()
+        logger.debug("[OllamaProvider] Initialized with host: %s, model: %s", self.host, self.model)
+
+    def _health_known(self) -> bool:
+        with _health_lock:
+            return _healthy_until.get(self.host, 0) > time.monotonic()
+
+    def _mark_health(self, healthy: bool):
+        with _health_lock:
+            if healthy:
+                _healthy_until[self.host] = time.monotonic() + HEALTH_CHECK_TTL
+            else:
+                _healthy_until.pop(self.host, None)
 
     def _check_server(self):
+        if self._health_known():
+            return
         url = f"{self.host}/api/tags"
         try:
-            response = requests.get(url, timeout=3)
+            with timed("health_check"):
+                response = self.session.get(url, timeout=3)
             response.raise_for_status()
-            logger.debug(f"[OllamaProvider] Ollama server is running: {url}")
+            logger.debug("[OllamaProvider] Ollama server is running: %s", url)
+            self._mark_health(True)
         except Exception as e:
-            logger.error(f"[OllamaProvider] Ollama server is not running: {e}")
+            logger.error("[OllamaProvider] Ollama server is not running: %s", e)
             raise RuntimeError(f"Ollama server is not running at {self.host}. Please start Ollama and try again.")
 
-    def analyze(self, prompt: str) -> Dict[str, Any]:
-        logger.debug(f"[OllamaProvider] analyze called with prompt: {prompt}")
-        self._check_server()
-        url = f"{self.host}/api/generate"
+    async def _check_server_async(self):
+        if self._health_known():
+            return
+        url = f"{self.host}/api/tags"
+        try:
+            with timed("health_check"):
+                response = await get_async_client().get(url, timeout=3)
+            response.raise_for_status()
+            logger.debug("[OllamaProvider] Ollama server is running: %s", url)
+            self._mark_health(True)
+        except Exception as e:
+            logger.error("[OllamaProvider] Ollama server is not running: %s", e)
+            raise RuntimeError(f"Ollama server is not running at {self.host}. Please start Ollama and try again.")
+
+    def _payload(self, prompt: str, stream: bool, max_tokens: Optional[int] = None) -> Dict[str, Any]:
         payload = {
             "model": self.model,
             "prompt": prompt,
-            "stream": False
+            "stream": stream
         }
+        if max_tokens:
+            payload["options"] = {"num_predict": max_tokens}
+        return payload
+
+    def analyze(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        logger.debug("[OllamaProvider] analyze called with prompt: %s", prompt)
+        self._check_server()
+        url = f"{self.host}/api/generate"
+        payload = self._payload(prompt, stream=False, max_tokens=max_tokens)
+        try:
+            with timed("network"):
+                response = self.session.post(url, json=payload, timeout=60)
+            response.raise_for_status()
+            with timed("parse"):
+                data = response.json()
+            return self._result(data)
+        except Exception as e:
+            # Force a fresh health check next time in case the server went away
+            self._mark_health(False)
+            logger.error("[OllamaProvider] Error calling Ollama API: %s", e)
+            raise RuntimeError(f"Error calling Ollama API: {str(e)}") 
+
+    def _result(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        logger.debug("[OllamaProvider] Raw response: %s", data)
+        content = data.get("response", "")
+        if not content:
+            logger.error("[OllamaProvider] No content received from Ollama API")
+            raise RuntimeError("No content received from Ollama API")
+        result = {"markdown_content": content}
+        usage = self._usage(data)
+        usage_ledger.record("ollama", data.get("model") or self.model, usage)
+        if data.get("model"):
+            result["model"] = data["model"]
+        if usage:
+            result["usage"] = usage
+        logger.debug("[OllamaProvider] Returning response: %s", result)
+        return result
+
+    @staticmethod
+    def _usage(data: Dict[str, Any]) -> Optional[Dict[str, int]]:
+        # Ollama reports token counts in its final message under its own names
+        if "prompt_eval_count" not in data and "eval_count" not in data:
+            return None
+        prompt_tokens = data.get("prompt_eval_count", 0)
+        completion_tokens = data.get("eval_count", 0)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    async def analyze_async(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Generate with the shared httpx client without blocking the event loop."""
+        logger.debug("[OllamaProvider] analyze_async called with prompt: %s", prompt)
+        await self._check_server_async()
+        url = f"{self.host}/api/generate"
+        payload = self._payload(prompt, stream=False, max_tokens=max_tokens)
         try:
-            response = requests.post(url, json=payload, timeout=60)
+            with timed("network"):
+                response = await get_async_client().post(url, json=payload, timeout=60)
             response.raise_for_status()
-            data = response.json()
-            logger.debug(f"[OllamaProvider] Raw response: {data}")
-            content = data.get("response", "")
-            if not content:
+            with timed("parse"):
+                data = response.json()
+            return self._result(data)
+        except Exception as e:
+            self._mark_health(False)
+            logger.error("[OllamaProvider] Error calling Ollama API: %s", e)
+            raise RuntimeError(f"Error calling Ollama API: {str(e)}")
+
+    def stream(self, prompt: str, max_tokens: Optional[int] = None) -> Iterator[str]:
+        """Stream the completion from Ollama's newline-delimited JSON API."""
+        logger.debug("[OllamaProvider] stream called with prompt: %s", prompt)
+        self._check_server()
+        url = f"{self.host}/api/generate"
+        payload = self._payload(prompt, stream=True, max_tokens=max_tokens)
+        try:
+            received = False
+            metadata: Dict[str, Any] = {}
+            with self.session.post(url, json=payload, timeout=60, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise RuntimeError(data["error"])
+                    content = data.get("response", "")
+                    if content:
+                        received = True
+                        yield content
+                    if data.get("done"):
+                        if data.get("model"):
+                            metadata["model"] = data["model"]
+                        usage = self._usage(data)
+                        if usage:
+                            metadata["usage"] = usage
+                        break
+            usage_ledger.record("ollama", metadata.get("model") or self.model, metadata.get("usage"))
+            if not received:
                 logger.error("[OllamaProvider] No content received from Ollama API")
                 raise RuntimeError("No content received from Ollama API")
-            result = {"markdown_content": content}
-            logger.debug(f"[OllamaProvider] Returning response: {result}")
-            return result
+            return metadata
         except Exception as e:
-            logger.error(f"[OllamaProvider] Error calling Ollama API: {str(e)}")
-            raise RuntimeError(f"Error calling Ollama API: {str(e)}") 
\ No newline at end of file
+            self._mark_health(False)
+            logger.error("[OllamaProvider] Error calling Ollama API: %s", e)
+            raise RuntimeError(f"Error calling Ollama API: {str(e)}")
\ No newline at end of file
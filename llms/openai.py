@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .base import LLMProvider
 import os
 import logging
@@ -8,12 +8,12 @@ logger = logging.getLogger(__name__)
 class OpenAIProvider(LLMProvider):
     def __init__(self, api_key: str):
         self.api_key = api_key
-        logger.debug(f"[OpenAIProvider] Initialized with API key: {'set' if bool(api_key) else 'not set'}")
+        logger.debug("[OpenAIProvider] Initialized with API key: %s", 'set' if bool(api_key) else 'not set')
         # self.model = "gpt-4o"  # or "gpt-4-turbo"
 
-    def analyze(self, prompt: str) -> Dict[str, Any]:
-        logger.debug(f"[OpenAIProvider] analyze called with prompt: {prompt}")
+    def analyze(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        logger.debug("[OpenAIProvider] analyze called with prompt: %s", prompt)
         # Here you would call the OpenAI API. For now, return a mock response.
         response = {"markdown_content": f"[OpenAI] Analysis for: {prompt[:40]}..."}
-        logger.debug(f"[OpenAIProvider] Returning response: {response}")
+        logger.debug("[OpenAIProvider] Returning response: %s", response)
         return response 
\ No newline at end of file
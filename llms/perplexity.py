@@ -2,14 +2,21 @@
 # LLM: Perplexity AI
 # Model: sonar-reasoning-pro or sonar-deep-research
 
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Optional
+import os
+import json
+import httpx
 import requests
-from requests.exceptions import JSONDecodeError
 from .base import LLMProvider
+from .http import get_async_client, get_session
+from engine.metrics import timed
+from engine.usage import usage_ledger
 import logging
 
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = "You are a ModSecurity rule analysis expert. Provide detailed analysis following the exact format specified in the prompt, including all sections and subsections. Use markdown formatting for better readability."
+
 class PerplexityProvider(LLMProvider):
     """Implementation of LLMProvider for Perplexity AI."""
     
@@ -20,57 +27,139 @@ class PerplexityProvider(LLMProvider):
             api_key: Perplexity API key
         """
         self.api_key = api_key
-        self.base_url = "https://api.perplexity.ai"
+        # Overridable to point at a proxy or the local mock server (bench/mock_server.py)
+        self.base_url = os.getenv("perplexity_base_url", "https://api.perplexity.ai")
+        self.model = "sonar-reasoning-pro"
+        self.max_tokens = 4096
+        self.session = get_session()
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
-        logger.debug(f"[PerplexityProvider] Initialized with API key: {'set' if bool(api_key) else 'not set'}")
+        logger.debug("[PerplexityProvider] Initialized with API key: %s", 'set' if bool(api_key) else 'not set')
         
-    def analyze(self, prompt: str) -> Dict[str, Any]:
-        logger.debug(f"[PerplexityProvider] analyze called with prompt: {prompt}")
+    def _payload(self, prompt: str, stream: bool = False, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "messages": [{
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            }, {
+                "role": "user",
+                "content": prompt
+            }],
+            "temperature": 0,
+            "max_tokens": max_tokens or self.max_tokens
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _raise_for_error(self, response):
+        # Accepts both requests and httpx responses
+        ok = response.is_success if isinstance(response, httpx.Response) else response.ok
+        if ok:
+            return
         try:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={
-                    "model": "sonar-reasoning-pro",
-                    "messages": [{
-                        "role": "system",
-                        "content": "You are a ModSecurity rule analysis expert. Provide detailed analysis following the exact format specified in the prompt, including all sections and subsections. Use markdown formatting for better readability."
-                    }, {
-                        "role": "user",
-                        "content": prompt
-                    }],
-                    "temperature": 0,
-                    "max_tokens": 4096
-                },
-                timeout=(5.0, 600.0)  # (connect timeout, read timeout)
-            )
-            
-            if not response.ok:
-                try:
-                    error_json = response.json()
-                    error_message = error_json.get('error', {}).get('message', response.text)
-                except JSONDecodeError:
-                    error_message = response.text or "Unknown error"
-                logger.error(f"[PerplexityProvider] API error: {error_message}")
-                raise RuntimeError(f"Perplexity API error ({response.status_code}): {error_message}")
+            error_json = response.json()
+            error_message = error_json.get('error', {}).get('message', response.text)
+        except ValueError:
+            error_message = response.text or "Unknown error"
+        logger.error("[PerplexityProvider] API error: %s", error_message)
+        raise RuntimeError(f"Perplexity API error ({response.status_code}): {error_message}")
+
+    def analyze(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        logger.debug("[PerplexityProvider] analyze called with prompt: %s", prompt)
+        try:
+            with timed("network"):
+                response = self.session.post(
+                    f"{self.base_url}/chat/completions",
+                    headers=self.headers,
+                    json=self._payload(prompt, max_tokens=max_tokens),
+                    timeout=(5.0, 600.0)  # (connect timeout, read timeout)
+                )
             
+            self._raise_for_error(response)
             response.raise_for_status()
-            response_json = response.json()
+            with timed("parse"):
+                return self._result(response.json())
             
-            # Extract the content from the response
-            content = response_json.get('choices', [{}])[0].get('message', {}).get('content', '')
-            if not content:
+        except requests.exceptions.RequestException as e:
+            logger.error("[PerplexityProvider] Request exception: %s", e)
+            raise RuntimeError(f"Error calling Perplexity API: {str(e)}")
+
+    def _result(self, response_json: Dict[str, Any]) -> Dict[str, Any]:
+        # Extract the content from the response
+        content = response_json.get('choices', [{}])[0].get('message', {}).get('content', '')
+        if not content:
+            logger.error("[PerplexityProvider] No content received from Perplexity API")
+            raise RuntimeError("No content received from Perplexity API")
+        result = {"markdown_content": content}
+        # Keep what the call cost and what it cited; the ledger aggregates usage per run
+        usage = response_json.get('usage')
+        usage_ledger.record("perplexity", response_json.get('model') or self.model, usage)
+        for key in ("model", "usage", "citations"):
+            if response_json.get(key):
+                result[key] = response_json[key]
+        logger.debug("[PerplexityProvider] Returning response: %s", result)
+        return result
+
+    async def analyze_async(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Send the prompt with the shared httpx client without blocking the event loop."""
+        logger.debug("[PerplexityProvider] analyze_async called with prompt: %s", prompt)
+        try:
+            with timed("network"):
+                response = await get_async_client().post(
+                    f"{self.base_url}/chat/completions",
+                    headers=self.headers,
+                    json=self._payload(prompt, max_tokens=max_tokens),
+                    timeout=httpx.Timeout(600.0, connect=5.0)
+                )
+        except httpx.HTTPError as e:
+            # Some httpx errors (e.g. timeouts) have an empty message
+            message = str(e) or type(e).__name__
+            logger.error("[PerplexityProvider] Request exception: %s", message)
+            raise RuntimeError(f"Error calling Perplexity API: {message}")
+        self._raise_for_error(response)
+        with timed("parse"):
+            return self._result(response.json())
+
+    def stream(self, prompt: str, max_tokens: Optional[int] = None) -> Iterator[str]:
+        """Stream the completion using Perplexity's server-sent events."""
+        logger.debug("[PerplexityProvider] stream called with prompt: %s", prompt)
+        try:
+            response = self.session.post(
+                f"{self.base_url}/chat/completions",
+                headers=self.headers,
+                json=self._payload(prompt, stream=True, max_tokens=max_tokens),
+                timeout=(5.0, 600.0),  # read timeout applies between chunks
+                stream=True
+            )
+            received = False
+            metadata: Dict[str, Any] = {}
+            with response:
+                self._raise_for_error(response)
+                for line in response.iter_lines():
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    # Usage and citations arrive with the last chunks of the stream
+                    for key in ("model", "usage", "citations"):
+                        if event.get(key):
+                            metadata[key] = event[key]
+                    content = event.get('choices', [{}])[0].get('delta', {}).get('content')
+                    if content:
+                        received = True
+                        yield content
+            usage_ledger.record("perplexity", metadata.get("model") or self.model, metadata.get("usage"))
+            if not received:
                 logger.error("[PerplexityProvider] No content received from Perplexity API")
                 raise RuntimeError("No content received from Perplexity API")
-                
-            result = {"markdown_content": content}
-            logger.debug(f"[PerplexityProvider] Returning response: {result}")
-            return result
-            
+            return metadata
         except requests.exceptions.RequestException as e:
-            logger.error(f"[PerplexityProvider] Request exception: {str(e)}")
-            print(f"Request exception details: {str(e)}")
+            logger.error("[PerplexityProvider] Request exception: %s", e)
             raise RuntimeError(f"Error calling Perplexity API: {str(e)}")
\ No newline at end of file
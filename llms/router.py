@@ -0,0 +1,317 @@
+# Description: Provider routing with failover, retries and hedged requests.
+# Wraps several provider clients behind the LLMProvider interface so callers
+# get an answer from the first healthy provider within a bounded time.
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from engine.concurrency import get_rate_limiter
+from engine.metrics import timed
+from engine.resilience import backoff_delay, get_circuit_breaker
+from .base import LLMProvider
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEDGE_AFTER = 20.0
+
+# Threads that run provider calls so callers can stop waiting on a timeout
+ROUTER_POOL_SIZE = 32
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ROUTER_POOL_SIZE, thread_name_prefix="llm-route")
+        return _executor
+
+
+@dataclass
+class Route:
+    """A provider client together with its call limits."""
+
+    name: str
+    client: LLMProvider
+    timeout: Optional[float] = None
+    retries: int = 0
+
+
+@dataclass
+class RoutingPolicy:
+    """How an analysis is spread across providers.
+
+    Attributes:
+        fallback: Providers tried in order when the primary fails or its
+            circuit is open
+        hedge: Provider sent a duplicate request when the primary has not
+            answered within `hedge_after` seconds (e.g. a local Ollama)
+        hedge_after: Seconds to wait for the primary before hedging
+        timeout: Seconds to wait for each provider call (None waits for
+            the provider's own network timeout)
+        retries: Extra attempts per provider, with jittered backoff
+    """
+
+    fallback: List[str] = field(default_factory=list)
+    hedge: Optional[str] = None
+    hedge_after: float = DEFAULT_HEDGE_AFTER
+    timeout: Optional[float] = None
+    retries: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.fallback or self.hedge or self.timeout or self.retries)
+
+    def route(self, name: str, client: LLMProvider) -> Route:
+        """Build the route for a provider, applying per-provider overrides.
+
+        `<provider>_timeout_seconds` and `<provider>_max_retries` environment
+        variables take precedence over the policy-wide values.
+        """
+        timeout = float(os.getenv(f"{name}_timeout_seconds", self.timeout or 0)) or None
+        retries = int(os.getenv(f"{name}_max_retries", self.retries))
+        return Route(name, client, timeout, retries)
+
+
+class _Call:
+    """A provider call running on the router pool.
+
+    Its outcome is recorded on the provider's circuit breaker exactly once:
+    by settle() when the caller collects it, by abandon() when the caller
+    gives up on it, or when it finishes after being left behind. Calls left
+    behind therefore still release a half-open trial they hold.
+    """
+
+    def __init__(self, route: Route, future: Future):
+        self.route = route
+        self.future = future
+        self._recorded = False
+        self._lock = threading.Lock()
+        future.add_done_callback(self._finished)
+
+    def _record(self, success: Optional[bool]):
+        with self._lock:
+            if self._recorded:
+                return
+            self._recorded = True
+        breaker = get_circuit_breaker(self.route.name)
+        if success is None:
+            breaker.release()
+        elif success:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    def _finished(self, future: Future):
+        self._record(None if future.cancelled() else future.exception() is None)
+
+    def settle(self) -> Dict[str, Any]:
+        """Record the outcome of the finished call and return its tagged result."""
+        try:
+            result = self.future.result()
+        except Exception:
+            self._record(False)
+            raise
+        self._record(True)
+        return {**result, "provider": self.route.name}
+
+    def abandon(self, failed: bool):
+        """Stop waiting for the call.
+
+        With `failed` (a timeout) the call counts as a failure now. Otherwise
+        a call that has not started is cancelled and one that is running
+        records its own outcome once it finishes. A running call cannot be
+        interrupted: it keeps its pool thread until the provider's own
+        network timeout.
+        """
+        if self.future.cancel():
+            return
+        if failed:
+            logger.warning("Abandoning %s call still running on the router pool", self.route.name)
+            self._record(False)
+
+
+class ProviderRouter(LLMProvider):
+    """LLM provider that fails over across an ordered chain of providers.
+
+    Each provider has a shared circuit breaker and rate limiter, so a
+    provider that is down is skipped by every concurrent analysis until its
+    cool-down expires. Results carry the name of the provider that answered
+    under the "provider" key.
+    """
+
+    def __init__(self, routes: List[Route], hedge: Optional[Route] = None,
+                 hedge_after: float = DEFAULT_HEDGE_AFTER):
+        """Initialize the router.
+
+        Args:
+            routes: Providers in the order they are tried
+            hedge: Optional provider raced against the first provider
+            hedge_after: Seconds to wait for the first provider before hedging
+
+        Raises:
+            ValueError: If no route is given
+        """
+        if not routes:
+            raise ValueError("ProviderRouter needs at least one route")
+        self.routes = list(routes)
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        # Used in cache keys: routed results are not interchangeable with
+        # results of the primary provider alone
+        names = [f"{r.name}:{getattr(r.client, 'model', '')}" for r in self.routes]
+        if hedge is not None:
+            names.append(f"hedge={hedge.name}:{getattr(hedge.client, 'model', '')}")
+        self.model = ",".join(names)
+
+    def _attempts(self, errors: List[str]) -> Iterator[Tuple[int, Route]]:
+        """Yield (attempt, route) for every call allowed by the circuit breakers."""
+        for route in self.routes:
+            breaker = get_circuit_breaker(route.name)
+            for attempt in range(route.retries + 1):
+                if attempt:
+                    time.sleep(backoff_delay(attempt - 1))
+                if not breaker.allow():
+                    logger.warning("Circuit open for provider %s, skipping it", route.name)
+                    errors.append(f"{route.name}: circuit open")
+                    break
+                yield attempt, route
+
+    def _submit(self, route: Route, prompt: str, max_tokens: Optional[int]) -> _Call:
+        limiter = get_rate_limiter(route.name)
+        if limiter is not None:
+            with timed("rate_limit_wait"):
+                limiter.acquire()
+        if max_tokens is None:
+            return _Call(route, _get_executor().submit(route.client.analyze, prompt))
+        return _Call(route, _get_executor().submit(route.client.analyze, prompt, max_tokens=max_tokens))
+
+    def _call(self, route: Route, prompt: str, max_tokens: Optional[int]) -> Dict[str, Any]:
+        call = self._submit(route, prompt, max_tokens)
+        try:
+            call.future.result(timeout=route.timeout)
+        except FutureTimeoutError:
+            call.abandon(failed=True)
+            raise TimeoutError(f"{route.name} did not answer within {route.timeout:g}s")
+        except Exception:
+            pass  # re-raised by settle once the breaker has been updated
+        return call.settle()
+
+    def _hedged_call(self, route: Route, prompt: str, max_tokens: Optional[int]) -> Dict[str, Any]:
+        """Call route, racing the hedge provider against it once hedge_after expires."""
+        deadline = None if route.timeout is None else time.monotonic() + route.timeout
+        primary = self._submit(route, prompt, max_tokens)
+        done, _ = wait([primary.future], timeout=self.hedge_after)
+        pending = {primary.future: primary}
+        if not done and get_circuit_breaker(self.hedge.name).allow():
+            logger.info("%s has not answered after %gs, hedging with %s",
+                        route.name, self.hedge_after, self.hedge.name)
+            hedge = self._submit(self.hedge, prompt, max_tokens)
+            pending[hedge.future] = hedge
+
+        error: Optional[Exception] = None
+        while pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, _ = wait(list(pending), timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                for call in pending.values():
+                    call.abandon(failed=True)
+                raise TimeoutError(f"{route.name} did not answer within {route.timeout:g}s")
+            for future in done:
+                call = pending.pop(future)
+                try:
+                    result = call.settle()
+                except Exception as e:
+                    logger.warning("Provider %s failed: %s", call.route.name, e)
+                    error = e
+                    continue
+                # The slower call is not at fault; it records its own outcome when it finishes
+                for other in pending.values():
+                    other.abandon(failed=False)
+                return result
+        raise error
+
+    def analyze(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Return the first successful analysis along the provider chain.
+
+        Raises:
+            RuntimeError: If every provider failed or was skipped
+        """
+        errors: List[str] = []
+        for attempt, route in self._attempts(errors):
+            try:
+                if attempt == 0 and route is self.routes[0] and self.hedge is not None:
+                    return self._hedged_call(route, prompt, max_tokens)
+                return self._call(route, prompt, max_tokens)
+            except Exception as e:
+                logger.warning("Provider %s failed (attempt %d): %s", route.name, attempt + 1, e)
+                errors.append(f"{route.name}: {e}")
+        raise RuntimeError(f"All providers failed: {'; '.join(errors)}")
+
+    def _first_chunk(self, route: Route, chunks: Iterator[str]) -> Optional[str]:
+        """Wait for the first chunk of a stream, bounded by the route timeout."""
+        if route.timeout is None:
+            return next(chunks, None)
+        future = _get_executor().submit(next, chunks, None)
+        try:
+            return future.result(timeout=route.timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"{route.name} did not start answering within {route.timeout:g}s")
+
+    def stream(self, prompt: str, max_tokens: Optional[int] = None) -> Iterator[str]:
+        """Stream from the first provider that starts answering.
+
+        Route timeouts bound the wait for the first chunk. Failover only
+        happens before that chunk; an error after output has been yielded is
+        raised to the caller. Streams are not hedged. Like analyze, the
+        metadata returned when the stream ends names the provider that
+        answered.
+
+        Raises:
+            RuntimeError: If every provider failed before producing output
+        """
+        errors: List[str] = []
+        for attempt, route in self._attempts(errors):
+            breaker = get_circuit_breaker(route.name)
+            limiter = get_rate_limiter(route.name)
+            if limiter is not None:
+                with timed("rate_limit_wait"):
+                    limiter.acquire()
+            started = False
+            recorded = False
+            metadata = None
+            try:
+                if max_tokens is None:
+                    chunks = iter(route.client.stream(prompt))
+                else:
+                    chunks = iter(route.client.stream(prompt, max_tokens=max_tokens))
+                first = self._first_chunk(route, chunks)
+                if first is not None:
+                    started = True
+                    yield first
+                    metadata = yield from chunks
+            except Exception as e:
+                breaker.record_failure()
+                recorded = True
+                if started:
+                    raise
+                logger.warning("Provider %s failed (attempt %d): %s", route.name, attempt + 1, e)
+                errors.append(f"{route.name}: {e}")
+                continue
+            finally:
+                if not recorded and not started:
+                    # Interrupted before any output: no verdict on the provider
+                    breaker.release()
+                elif not recorded:
+                    # Finished, or closed early by the consumer after the provider delivered
+                    breaker.record_success()
+            return {**(metadata or {}), "provider": route.name}
+        raise RuntimeError(f"All providers failed: {'; '.join(errors)}")
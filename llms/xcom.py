@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .base import LLMProvider
 import os
 import logging
@@ -8,10 +8,10 @@ logger = logging.getLogger(__name__)
 class XComProvider(LLMProvider):
     def __init__(self, api_key: str):
         self.api_key = api_key
-        logger.debug(f"[XComProvider] Initialized with API key: {'set' if bool(api_key) else 'not set'}")
+        logger.debug("[XComProvider] Initialized with API key: %s", 'set' if bool(api_key) else 'not set')
 
-    def analyze(self, prompt: str) -> Dict[str, Any]:
-        logger.debug(f"[XComProvider] analyze called with prompt: {prompt}")
+    def analyze(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        logger.debug("[XComProvider] analyze called with prompt: %s", prompt)
         response = {"markdown_content": f"[X.com] Analysis for: {prompt[:40]}..."}
-        logger.debug(f"[XComProvider] Returning response: {response}")
+        logger.debug("[XComProvider] Returning response: %s", response)
         return response 
\ No newline at end of file
@@ -0,0 +1,15 @@
+from .normalizer import canonicalize_rule
+from .parser import Action, ParsedRule, RuleParseError, parse_rule
+from .simulator import HttpRequest, evaluate_rule, request_from_curl, verify_test_cases
+from .similarity import SimilarRule, SimilarityIndex, logic_fingerprint
+from .technical import technical_analysis
+from .splitter import RuleBlock, extract_rule_id, group_rules, iter_rules, iter_rules_from_paths, split_rules
+
+__all__ = [
+    'canonicalize_rule',
+    'Action', 'ParsedRule', 'RuleParseError', 'parse_rule',
+    'HttpRequest', 'evaluate_rule', 'request_from_curl', 'verify_test_cases',
+    'SimilarRule', 'SimilarityIndex', 'logic_fingerprint',
+    'technical_analysis',
+    'RuleBlock', 'extract_rule_id', 'group_rules', 'iter_rules', 'iter_rules_from_paths', 'split_rules',
+]
@@ -0,0 +1,126 @@
+# Description: Compare two rule sets (e.g. two CRS releases) rule by rule.
+# Rules are matched on their `id:` and compared on their canonical form, so
+# only rules that were added or actually modified need a new analysis.
+
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .normalizer import canonicalize_rule
+from .parser import ParsedRule, RuleParseError, parse_rule
+from .splitter import RuleBlock
+
+logger = logging.getLogger(__name__)
+
+ADDED = "added"
+MODIFIED = "modified"
+UNCHANGED = "unchanged"
+REMOVED = "removed"
+
+# Actions that change with every release without changing rule behavior
+RELEASE_ACTIONS = ("ver", "rev")
+
+
+@dataclass
+class RuleChange:
+    """How a single rule differs between the old and the new rule set."""
+
+    rule_id: str
+    status: str
+    old: Optional[RuleBlock] = None
+    new: Optional[RuleBlock] = None
+    details: List[str] = field(default_factory=list)
+
+    @property
+    def needs_analysis(self) -> bool:
+        return self.status in (ADDED, MODIFIED)
+
+
+def _rule_key(block: RuleBlock) -> str:
+    # Rules without an id (rare, pre-2.7 style) are matched on their content
+    return block.rule_id or f"canonical:{canonicalize_rule(block.text, RELEASE_ACTIONS)}"
+
+
+def index_rules(blocks: Iterable[RuleBlock]) -> Dict[str, RuleBlock]:
+    """Index rule blocks by rule id, keeping the last definition of each id."""
+    index: Dict[str, RuleBlock] = {}
+    for block in blocks:
+        key = _rule_key(block)
+        if key in index:
+            logger.warning("Duplicate rule id %s in %s:%s", key, block.source, block.line)
+        index[key] = block
+    return index
+
+
+def _list_change(label: str, old: List[str], new: List[str]) -> List[str]:
+    details = []
+    added = [item for item in new if item not in old]
+    removed = [item for item in old if item not in new]
+    if added:
+        details.append(f"{label} added: {', '.join(added)}")
+    if removed:
+        details.append(f"{label} removed: {', '.join(removed)}")
+    if not added and not removed and old != new:
+        details.append(f"{label} reordered: {', '.join(old)} -> {', '.join(new)}")
+    return details
+
+
+def _operator(rule: ParsedRule) -> str:
+    if not rule.operator:
+        return ""
+    operator = ("!" if rule.negated else "") + rule.operator
+    return f"{operator} {rule.operator_argument}".rstrip()
+
+
+def describe_changes(old_text: str, new_text: str) -> List[str]:
+    """List human-readable differences between two versions of a rule."""
+    try:
+        old_rule, new_rule = parse_rule(old_text), parse_rule(new_text)
+    except RuleParseError:
+        return ["rule text changed"]
+
+    old_chain, new_chain = list(old_rule.iter_chain()), list(new_rule.iter_chain())
+    details = []
+    if len(old_chain) != len(new_chain):
+        details.append(f"chain length changed: {len(old_chain)} -> {len(new_chain)}")
+    for position, (old, new) in enumerate(zip(old_chain, new_chain)):
+        prefix = "" if position == 0 else f"chained rule {position}: "
+        details.extend(prefix + d for d in _list_change("variables", old.variables, new.variables))
+        if _operator(old) != _operator(new):
+            details.append(f"{prefix}operator changed: {_operator(old)} -> {_operator(new)}")
+        details.extend(prefix + d for d in _list_change("transformations", old.transformations, new.transformations))
+        old_actions = [str(a) for a in old.actions if a.name not in RELEASE_ACTIONS + ("t",)]
+        new_actions = [str(a) for a in new.actions if a.name not in RELEASE_ACTIONS + ("t",)]
+        details.extend(prefix + d for d in _list_change("actions", sorted(old_actions), sorted(new_actions)))
+    return details or ["formatting or ordering changed"]
+
+
+def diff_rule_sets(old_blocks: Iterable[RuleBlock], new_blocks: Iterable[RuleBlock]) -> Iterator[RuleChange]:
+    """Match rules by id across two rule sets and classify each one.
+
+    Rules are compared on their canonical form with release metadata
+    (`ver`, `rev`) ignored, so reformatting and version bumps alone do not
+    count as modifications.
+
+    Args:
+        old_blocks: Rule blocks of the previous release
+        new_blocks: Rule blocks of the new release
+
+    Yields:
+        RuleChange objects for every rule of the new set in order, followed
+        by the rules that were removed
+    """
+    old_index = index_rules(old_blocks)
+    seen = set()
+    for key, new in index_rules(new_blocks).items():
+        seen.add(key)
+        old = old_index.get(key)
+        if old is None:
+            yield RuleChange(key, ADDED, new=new)
+        elif canonicalize_rule(old.text, RELEASE_ACTIONS) == canonicalize_rule(new.text, RELEASE_ACTIONS):
+            yield RuleChange(key, UNCHANGED, old=old, new=new)
+        else:
+            yield RuleChange(key, MODIFIED, old=old, new=new, details=describe_changes(old.text, new.text))
+    for key, old in old_index.items():
+        if key not in seen:
+            yield RuleChange(key, REMOVED, old=old)
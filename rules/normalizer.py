@@ -0,0 +1,81 @@
+# Description: Canonical form of ModSecurity rules.
+# Rules that differ only in whitespace, line-continuation style, action
+# order or quoting canonicalize to the same string, which makes the result
+# suitable for de-duplication and cache keys.
+
+import re
+import logging
+from typing import Iterable, List
+
+from .parser import Action, ParsedRule, RuleParseError, join_continuations, parse_rule
+
+logger = logging.getLogger(__name__)
+
+# Characters that can appear in an action value without quoting it.
+_BARE_VALUE_RE = re.compile(r"^[\w.\-/%{}=+!@#&*]+$")
+
+
+def _canonical_variable(variable: str) -> str:
+    prefix = ""
+    while variable[:1] in ("!", "&"):
+        prefix += variable[0]
+        variable = variable[1:]
+    collection, sep, key = variable.partition(":")
+    return f"{prefix}{collection.upper()}{sep}{key}"
+
+
+def _canonical_action(action: Action) -> str:
+    if action.value is None:
+        return action.name
+    if _BARE_VALUE_RE.match(action.value):
+        return f"{action.name}:{action.value}"
+    return f"{action.name}:'{action.value}'"
+
+
+def _canonical_actions(actions: List[Action]) -> str:
+    # A stable sort keeps order-sensitive repeats (t:, setvar:, ctl:) in sequence.
+    ordered = sorted(actions, key=lambda action: action.name)
+    return ",".join(_canonical_action(action) for action in ordered)
+
+
+def _quote(text: str) -> str:
+    return '"' + text.replace('"', '\\"') + '"'
+
+
+def _canonical_directive(rule: ParsedRule, ignore_actions: Iterable[str] = ()) -> str:
+    parts = [rule.directive]
+    if rule.directive == "SecRule":
+        parts.append("|".join(sorted(_canonical_variable(v) for v in rule.variables)))
+        operator = ("!" if rule.negated else "") + rule.operator
+        parts.append(_quote(f"{operator} {rule.operator_argument}".rstrip()))
+    actions = [action for action in rule.actions if action.name not in ignore_actions]
+    if actions or rule.directive == "SecAction":
+        parts.append(_quote(_canonical_actions(actions)))
+    return " ".join(parts)
+
+
+def canonicalize_rule(text: str, ignore_actions: Iterable[str] = ()) -> str:
+    """Return a stable canonical form of a rule for comparison and hashing.
+
+    Variables are upper-cased and sorted, implicit `@rx` operators are made
+    explicit, actions are sorted by name (keeping the relative order of
+    repeated actions such as transformations) and quoting is normalized.
+    Chained rules are canonicalized individually, one per line.
+
+    Text that cannot be parsed falls back to whitespace normalization.
+
+    Args:
+        text: The ModSecurity rule as written
+        ignore_actions: Action names to leave out (e.g. "ver" when comparing
+            rules across releases)
+
+    Returns:
+        The canonical rule text
+    """
+    try:
+        parsed = parse_rule(text)
+    except RuleParseError as e:
+        logger.debug("Falling back to whitespace normalization: %s", e)
+        return " ".join(join_continuations(text).split())
+    ignored = frozenset(ignore_actions)
+    return "\n".join(_canonical_directive(rule, ignored) for rule in parsed.iter_chain())
@@ -0,0 +1,223 @@
+# Description: Parser for ModSecurity SecRule/SecAction directives.
+# Turns rule text (including line continuations and chains) into a
+# structured form: variables, operator and actions.
+
+import re
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+RULE_DIRECTIVES = ("SecRule", "SecAction")
+
+_CONTINUATION_RE = re.compile(r"\\\r?\n")
+
+
+class RuleParseError(ValueError):
+    """Raised when rule text is not a well-formed SecRule/SecAction."""
+
+
+@dataclass
+class Action:
+    """A single rule action such as `phase:2` or `t:lowercase`."""
+
+    name: str
+    value: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self.value is None:
+            return self.name
+        return f"{self.name}:{self.value}"
+
+
+@dataclass
+class ParsedRule:
+    """Structured representation of a SecRule or SecAction.
+
+    For a chain, the first rule is returned by parse_rule and the rules that
+    follow it are listed in `chained`.
+    """
+
+    directive: str
+    variables: List[str] = field(default_factory=list)
+    operator: Optional[str] = None
+    operator_argument: str = ""
+    negated: bool = False
+    actions: List[Action] = field(default_factory=list)
+    chained: List["ParsedRule"] = field(default_factory=list)
+
+    def action_values(self, name: str) -> List[Optional[str]]:
+        """Return the values of every action with the given name, in order."""
+        return [action.value for action in self.actions if action.name == name]
+
+    def action_value(self, name: str) -> Optional[str]:
+        """Return the value of the first action with the given name."""
+        values = self.action_values(name)
+        return values[0] if values else None
+
+    def has_action(self, name: str) -> bool:
+        return any(action.name == name for action in self.actions)
+
+    @property
+    def rule_id(self) -> Optional[str]:
+        return self.action_value("id")
+
+    @property
+    def phase(self) -> Optional[str]:
+        return self.action_value("phase")
+
+    @property
+    def transformations(self) -> List[str]:
+        return [value for value in self.action_values("t") if value]
+
+    def iter_chain(self) -> Iterator["ParsedRule"]:
+        """Yield this rule followed by every rule chained to it."""
+        yield self
+        yield from self.chained
+
+
+def join_continuations(text: str) -> str:
+    """Remove backslash line continuations from rule text."""
+    return _CONTINUATION_RE.sub(" ", text)
+
+
+def tokenize(text: str) -> List[Tuple[str, bool]]:
+    """Split directive text into whitespace separated tokens.
+
+    Double-quoted tokens may contain whitespace and `\\"` escapes.
+
+    Returns:
+        List of (token, was_quoted) tuples
+    """
+    tokens: List[Tuple[str, bool]] = []
+    i, length = 0, len(text)
+    while i < length:
+        char = text[i]
+        if char.isspace():
+            i += 1
+            continue
+        if char == '"':
+            i += 1
+            buffer = []
+            while i < length and text[i] != '"':
+                if text[i] == "\\" and i + 1 < length and text[i + 1] == '"':
+                    buffer.append('"')
+                    i += 2
+                    continue
+                buffer.append(text[i])
+                i += 1
+            if i >= length:
+                raise RuleParseError("Unterminated double-quoted string")
+            tokens.append(("".join(buffer), True))
+            i += 1
+            continue
+        start = i
+        while i < length and not text[i].isspace():
+            i += 1
+        tokens.append((text[start:i], False))
+    return tokens
+
+
+def parse_variables(text: str) -> List[str]:
+    """Split a variable list on `|`, leaving `/regex/` selectors intact."""
+    variables, buffer, in_regex = [], [], False
+    for index, char in enumerate(text):
+        if char == "/" and (in_regex or (index > 0 and text[index - 1] == ":")):
+            in_regex = not in_regex
+        if char == "|" and not in_regex:
+            variables.append("".join(buffer).strip())
+            buffer = []
+            continue
+        buffer.append(char)
+    variables.append("".join(buffer).strip())
+    return [variable for variable in variables if variable]
+
+
+def parse_actions(text: str) -> List[Action]:
+    """Split an action list on commas outside single-quoted values."""
+    actions: List[Action] = []
+    buffer: List[str] = []
+    in_quote = False
+    for char in text + ",":
+        if char == "'":
+            in_quote = not in_quote
+        if char == "," and not in_quote:
+            item = "".join(buffer).strip()
+            buffer = []
+            if not item:
+                continue
+            name, sep, value = item.partition(":")
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] == "'":
+                value = value[1:-1]
+            actions.append(Action(name.strip().lower(), value if sep else None))
+            continue
+        buffer.append(char)
+    if in_quote:
+        raise RuleParseError("Unterminated single-quoted action value")
+    return actions
+
+
+def parse_operator(text: str) -> Tuple[str, str, bool]:
+    """Parse an operator expression into (operator, argument, negated).
+
+    An expression without an explicit `@operator` is an implicit `@rx`.
+    """
+    expression = text.strip()
+    negated = False
+    if expression.startswith("!@"):
+        negated = True
+        expression = expression[1:]
+    if not expression.startswith("@"):
+        if expression.startswith("!"):
+            negated = True
+            expression = expression[1:]
+        return "@rx", expression, negated
+    operator, _, argument = expression.partition(" ")
+    return operator, argument.strip(), negated
+
+
+def _parse_directive(tokens: List[Tuple[str, bool]]) -> ParsedRule:
+    directive = tokens[0][0]
+    args = [token for token, _ in tokens[1:]]
+    if directive == "SecAction":
+        if len(args) > 1:
+            raise RuleParseError("SecAction takes a single action list")
+        return ParsedRule(directive, actions=parse_actions(args[0]) if args else [])
+    if len(args) < 2 or len(args) > 3:
+        raise RuleParseError("SecRule requires variables, an operator and optional actions")
+    operator, argument, negated = parse_operator(args[1])
+    return ParsedRule(
+        directive,
+        variables=parse_variables(args[0]),
+        operator=operator,
+        operator_argument=argument,
+        negated=negated,
+        actions=parse_actions(args[2]) if len(args) == 3 else [],
+    )
+
+
+def parse_rule(text: str) -> ParsedRule:
+    """Parse a SecRule/SecAction, including any chained rules.
+
+    Args:
+        text: Rule text as found in a configuration file
+
+    Returns:
+        The first rule of the chain, with the rest in `chained`
+
+    Raises:
+        RuleParseError: If the text is not a well-formed rule
+    """
+    tokens = tokenize(join_continuations(text))
+    if not tokens or tokens[0][1] or tokens[0][0] not in RULE_DIRECTIVES:
+        raise RuleParseError("Rule must start with SecRule or SecAction")
+
+    groups: List[List[Tuple[str, bool]]] = []
+    for token in tokens:
+        if not token[1] and token[0] in RULE_DIRECTIVES:
+            groups.append([])
+        groups[-1].append(token)
+
+    rules = [_parse_directive(group) for group in groups]
+    head = rules[0]
+    head.chained = rules[1:]
+    return head
@@ -0,0 +1,132 @@
+# Description: Aho-Corasick multi-phrase matching for `@pm` and `@pmFromFile`.
+# An automaton over all phrases finds matches in a single pass over the
+# input, so matching time grows with the payload size rather than with the
+# number of phrases. Automata for data files are built once per file version
+# and shared.
+
+import os
+import logging
+import functools
+import threading
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PhraseMatcher:
+    """Case-insensitive Aho-Corasick automaton over a set of phrases.
+
+    ModSecurity's phrase operators ignore case, so phrases and input are
+    both lowercased.
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Length of the longest phrase ending at each state, following fail links
+        self._output: List[int] = [0]
+        self.phrases = 0
+        for phrase in phrases:
+            phrase = phrase.lower()
+            if phrase:
+                self._add(phrase)
+                self.phrases += 1
+        self._link()
+
+    def _add(self, phrase: str):
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(0)
+            state = next_state
+        self._output[state] = max(self._output[state], len(phrase))
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                if not self._output[child]:
+                    self._output[child] = self._output[self._fail[child]]
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, str]]:
+        """Yield (end offset, phrase) for the longest phrase ending at each matching position.
+
+        Offsets and phrases refer to the lowercased text.
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        lowered = text.lower()
+        state = 0
+        for index, char in enumerate(lowered):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield index + 1, lowered[index + 1 - output[state]:index + 1]
+
+    def search(self, text: str) -> Optional[str]:
+        """Return the first (lowercased) phrase found in text, or None."""
+        for _, phrase in self.finditer(text):
+            return phrase
+        return None
+
+
+def parse_phrases(argument: str) -> List[str]:
+    """Split an `@pm` argument into its space-separated phrases."""
+    return argument.split()
+
+
+def read_phrase_file(path: str) -> List[str]:
+    """Read a CRS data file: one phrase per line, `#` comments and blank lines skipped."""
+    with open(path, encoding="utf-8", errors="replace") as handle:
+        return [line.strip() for line in handle if line.strip() and not line.lstrip().startswith("#")]
+
+
+@functools.lru_cache(maxsize=512)
+def inline_matcher(argument: str) -> PhraseMatcher:
+    """Return the shared automaton for an `@pm` argument."""
+    return PhraseMatcher(parse_phrases(argument))
+
+
+_file_matchers: Dict[str, Tuple[Tuple[float, int], PhraseMatcher]] = {}
+_file_matchers_lock = threading.Lock()
+
+
+def file_matcher(path: str) -> PhraseMatcher:
+    """Return the shared automaton for an `@pmFromFile` data file.
+
+    The automaton is rebuilt when the file's modification time or size changes.
+
+    Raises:
+        OSError: If the file cannot be read
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime, stat.st_size)
+    with _file_matchers_lock:
+        cached = _file_matchers.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    matcher = PhraseMatcher(read_phrase_file(path))
+    logger.debug("Built phrase automaton for %s (%d phrases)", path, matcher.phrases)
+    with _file_matchers_lock:
+        _file_matchers[path] = (version, matcher)
+    return matcher
+
+
+def clear_file_matchers():
+    """Forget cached data file automata (used by tests)."""
+    with _file_matchers_lock:
+        _file_matchers.clear()
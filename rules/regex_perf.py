@@ -0,0 +1,480 @@
+# Description: Local performance and ReDoS analysis of `@rx` patterns.
+# A static pass over the regex syntax tree flags constructs prone to
+# catastrophic backtracking, then every unbounded quantifier is "pumped" with
+# generated adversarial input of growing length while match times are
+# measured with Python's backtracking `re`. Python retries an unanchored
+# search at every start position, which PCRE usually avoids (auto-possessive
+# quantifiers, required-character checks), so without a static finding only
+# the growth of a single match attempt counts. Verdicts are estimates for
+# PCRE, and absolute timings do not carry over.
+
+import math
+import time
+import logging
+import functools
+from dataclasses import dataclass, field
+from typing import FrozenSet, Iterable, List, Optional, Tuple
+
+try:  # Python 3.11+
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # pragma: no cover
+    import sre_constants
+    import sre_parse
+import re
+
+from .parser import ParsedRule, RuleParseError, parse_rule
+
+logger = logging.getLogger(__name__)
+
+LINEAR = "linear"
+POLYNOMIAL = "polynomial"
+EXPONENTIAL = "exponential"
+NOT_ANALYZED = "not analyzed"
+
+# Seconds a single match may take before the pattern is considered dangerous
+DEFAULT_BUDGET = 0.05
+
+# Pump repetitions: small steps catch exponential growth before it gets
+# expensive, large ones expose polynomial growth
+PUMP_STEPS = (8, 12, 16, 20, 24, 28, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+MAX_INPUT_LENGTH = 65536
+MAX_CANDIDATES = 6
+
+# Growth exponent (time ~ length ** k) above which a pattern is polynomial
+POLYNOMIAL_GROWTH = 1.7
+# Timings below this are too noisy to estimate growth from
+MIN_MEASURABLE = 1e-3
+
+BENIGN_INPUT = "id=1024&name=John+Doe&email=john.doe%40example.com&q=spring+sale+shoes&page=2&sort=price_asc&"
+
+_ALPHABET = frozenset(range(128))
+_REPEATS = tuple(getattr(sre_constants, name) for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+                 if hasattr(sre_constants, name))
+_BACKTRACKING_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+_ATOMIC_GROUP = getattr(sre_constants, "ATOMIC_GROUP", None)
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: frozenset(range(48, 58)),
+    sre_constants.CATEGORY_SPACE: frozenset(map(ord, " \t\n\r\f\v")),
+    sre_constants.CATEGORY_WORD: frozenset(c for c in range(128) if chr(c).isalnum() or chr(c) == "_"),
+}
+_CATEGORIES.update({
+    sre_constants.CATEGORY_NOT_DIGIT: _ALPHABET - _CATEGORIES[sre_constants.CATEGORY_DIGIT],
+    sre_constants.CATEGORY_NOT_SPACE: _ALPHABET - _CATEGORIES[sre_constants.CATEGORY_SPACE],
+    sre_constants.CATEGORY_NOT_WORD: _ALPHABET - _CATEGORIES[sre_constants.CATEGORY_WORD],
+})
+# Characters tried after the pumped input to force the overall match to fail
+_FAIL_SUFFIXES = ("!", "\x00", "\n", " ", "_", "0", "a")
+
+
+@dataclass
+class RegexReport:
+    """Backtracking analysis of one pattern.
+
+    Attributes:
+        pattern: The `@rx` argument
+        verdict: "linear", "polynomial", "exponential" or "not analyzed"
+        issues: Constructs found by the static pass
+        attack: Description of the slowest generated input
+        worst_seconds: Time of the slowest measured match
+        worst_length: Length of that input
+        benign_us_per_kb: Microseconds per KiB of ordinary query-string input
+        timings: (input length, seconds) along the slowest pump series
+        error: Why the pattern could not be analyzed
+    """
+
+    pattern: str
+    verdict: str
+    issues: List[str] = field(default_factory=list)
+    attack: Optional[str] = None
+    worst_seconds: float = 0.0
+    worst_length: int = 0
+    benign_us_per_kb: Optional[float] = None
+    timings: List[Tuple[int, float]] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def dangerous(self) -> bool:
+        return self.verdict in (POLYNOMIAL, EXPONENTIAL)
+
+
+def _with_case(chars: Iterable[int], ignorecase: bool) -> FrozenSet[int]:
+    chars = frozenset(chars)
+    if not ignorecase:
+        return chars
+    return chars | frozenset(ord(chr(c).swapcase()) for c in chars if chr(c).isalpha())
+
+
+def _char_set(op, av, ignorecase: bool) -> Optional[FrozenSet[int]]:
+    """Return the ASCII characters a single-character node matches, or None for other nodes."""
+    if op == sre_constants.LITERAL:
+        return _with_case([av], ignorecase) & _ALPHABET
+    if op == sre_constants.NOT_LITERAL:
+        return _ALPHABET - _with_case([av], ignorecase)
+    if op == sre_constants.ANY:
+        return _ALPHABET - {10}
+    if op == sre_constants.IN:
+        chars = set()
+        negate = False
+        for item_op, item_av in av:
+            if item_op == sre_constants.NEGATE:
+                negate = True
+            elif item_op == sre_constants.LITERAL:
+                chars.add(item_av)
+            elif item_op == sre_constants.RANGE:
+                chars.update(range(item_av[0], min(item_av[1], 127) + 1))
+            elif item_op == sre_constants.CATEGORY:
+                chars.update(_CATEGORIES.get(item_av, ()))
+        chars = _with_case(chars, ignorecase) & _ALPHABET
+        return _ALPHABET - chars if negate else chars
+    return None
+
+
+def _subpattern_case(av, ignorecase: bool) -> bool:
+    add_flags, del_flags = av[1], av[2]
+    if add_flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return True
+    if del_flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return False
+    return ignorecase
+
+
+def _first(sequence, ignorecase: bool, last: bool = False) -> Tuple[FrozenSet[int], bool]:
+    """Return (characters a sequence can start with, whether it can match empty).
+
+    With `last`, return the characters it can end with instead.
+    """
+    chars = set()
+    items = list(sequence)
+    for op, av in reversed(items) if last else items:
+        first, nullable = _first_item(op, av, ignorecase, last)
+        chars |= first
+        if not nullable:
+            return frozenset(chars), False
+    return frozenset(chars), True
+
+
+def _first_item(op, av, ignorecase: bool, last: bool = False) -> Tuple[FrozenSet[int], bool]:
+    single = _char_set(op, av, ignorecase)
+    if single is not None:
+        return single, False
+    if op == sre_constants.SUBPATTERN:
+        return _first(av[-1], _subpattern_case(av, ignorecase), last)
+    if op == _ATOMIC_GROUP:
+        return _first(av, ignorecase, last)
+    if op == sre_constants.BRANCH:
+        chars, nullable = set(), False
+        for branch in av[1]:
+            first, branch_nullable = _first(branch, ignorecase, last)
+            chars |= first
+            nullable = nullable or branch_nullable
+        return frozenset(chars), nullable
+    if op in _REPEATS:
+        first, nullable = _first(av[2], ignorecase, last)
+        return first, nullable or av[0] == 0
+    if op == sre_constants.GROUPREF:
+        return _ALPHABET, True
+    return frozenset(), True  # anchors and lookarounds consume nothing
+
+
+def _describe(chars: FrozenSet[int]) -> str:
+    shown = "".join(chr(c) if 32 < c < 127 else repr(chr(c))[1:-1] if c != 32 else "\\x20"
+                    for c in sorted(chars))
+    return shown if len(shown) <= 12 else shown[:12] + "..."
+
+
+def _is_unbounded(op, av) -> bool:
+    return op in _BACKTRACKING_REPEATS and av[1] == sre_constants.MAXREPEAT
+
+
+def _static_issues(sequence, ignorecase: bool, issues: List[str], outer_first: Optional[FrozenSet[int]] = None):
+    """Collect constructs that can backtrack catastrophically.
+
+    Args:
+        sequence: Parsed (op, av) items
+        ignorecase: Whether IGNORECASE is in effect
+        issues: List the findings are appended to
+        outer_first: First characters of the enclosing unbounded repeat's
+            body when `sequence` ends that body
+    """
+    items = list(sequence)
+    for position, (op, av) in enumerate(items):
+        rest_nullable = _first(items[position + 1:], ignorecase)[1]
+        if op in _REPEATS:
+            body = av[2]
+            first, _ = _first(body, ignorecase)
+            unbounded = _is_unbounded(op, av)
+            if unbounded and outer_first is not None and rest_nullable and first & outer_first:
+                issues.append(f"nested quantifier: a repeated group ends in an unbounded repeat of "
+                              f"[{_describe(first & outer_first)}] that can also start the next iteration")
+            if unbounded:
+                for inner_op, inner_av in body:
+                    if inner_op == sre_constants.SUBPATTERN:
+                        inner_items = list(inner_av[-1])
+                        if len(inner_items) == 1 and inner_items[0][0] == sre_constants.BRANCH:
+                            inner_op, inner_av = inner_items[0]
+                    if inner_op == sre_constants.BRANCH:
+                        firsts = [_first(branch, ignorecase)[0] for branch in inner_av[1]]
+                        overlap = frozenset()
+                        for i, a in enumerate(firsts):
+                            for b in firsts[i + 1:]:
+                                overlap |= a & b
+                        if overlap:
+                            issues.append(f"overlapping alternatives inside an unbounded repeat can start "
+                                          f"with the same characters [{_describe(overlap)}]")
+                follower = items[position + 1] if position + 1 < len(items) else None
+                if follower is not None and _is_unbounded(*follower):
+                    # The matcher can shift characters between the two repeats
+                    shared = _first(body, ignorecase, last=True)[0] & _first(follower[1][2], ignorecase)[0]
+                    if shared:
+                        issues.append(f"adjacent unbounded repeats both match [{_describe(shared)}]")
+            _static_issues(body, ignorecase, issues, first if unbounded else (outer_first if rest_nullable else None))
+        elif op == sre_constants.SUBPATTERN:
+            _static_issues(av[-1], _subpattern_case(av, ignorecase), issues,
+                           outer_first if rest_nullable else None)
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                _static_issues(branch, ignorecase, issues, outer_first if rest_nullable else None)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _static_issues(av[1], ignorecase, issues)
+
+
+def _pick(chars: FrozenSet[int]) -> str:
+    for preferred in (ord("a"), ord("0"), ord(" ")):
+        if preferred in chars:
+            return chr(preferred)
+    printable = sorted(c for c in chars if 32 <= c < 127)
+    return chr(printable[0] if printable else min(chars)) if chars else ""
+
+
+def _sample(sequence, ignorecase: bool, at_least_once: bool = False) -> str:
+    """Generate a short string matched by a sequence (lookarounds are ignored)."""
+    return "".join(_sample_item(op, av, ignorecase, at_least_once) for op, av in sequence)
+
+
+def _sample_item(op, av, ignorecase: bool, at_least_once: bool = False) -> str:
+    single = _char_set(op, av, ignorecase)
+    if single is not None:
+        return _pick(single)
+    if op == sre_constants.SUBPATTERN:
+        return _sample(av[-1], _subpattern_case(av, ignorecase), at_least_once)
+    if op == _ATOMIC_GROUP:
+        return _sample(av, ignorecase, at_least_once)
+    if op == sre_constants.BRANCH:
+        return _sample(av[1][0], ignorecase, at_least_once)
+    if op in _REPEATS:
+        count = max(av[0], 1 if at_least_once and av[1] else 0)
+        return _sample(av[2], ignorecase, at_least_once) * count
+    return ""
+
+
+def _prefix(sequence, target, ignorecase: bool) -> Optional[str]:
+    """Return a string that leads the matcher up to the `target` node, or None if it is not in sequence."""
+    sampled = []
+    for item in sequence:
+        if item is target:
+            return "".join(sampled)
+        op, av = item
+        inner = None
+        if op == sre_constants.SUBPATTERN:
+            inner = _prefix(av[-1], target, _subpattern_case(av, ignorecase))
+        elif op == _ATOMIC_GROUP:
+            inner = _prefix(av, target, ignorecase)
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                inner = _prefix(branch, target, ignorecase)
+                if inner is not None:
+                    break
+        elif op in _REPEATS:
+            inner = _prefix(av[2], target, ignorecase)
+        if inner is not None:
+            return "".join(sampled) + inner
+        sampled.append(_sample_item(op, av, ignorecase))
+    return None
+
+
+def _unbounded_repeats(sequence, ignorecase: bool, found: List[Tuple[tuple, bool]]):
+    for item in sequence:
+        op, av = item
+        if op in _REPEATS:
+            if _is_unbounded(op, av):
+                found.append((item, ignorecase))
+            _unbounded_repeats(av[2], ignorecase, found)
+        elif op == sre_constants.SUBPATTERN:
+            _unbounded_repeats(av[-1], _subpattern_case(av, ignorecase), found)
+        elif op == _ATOMIC_GROUP:
+            _unbounded_repeats(av, ignorecase, found)
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                _unbounded_repeats(branch, ignorecase, found)
+
+
+def _time_search(compiled, text: str, anchored: bool = False) -> float:
+    match = compiled.match if anchored else compiled.search
+    best = math.inf
+    for _ in range(3):
+        started = time.perf_counter()
+        match(text)
+        elapsed = time.perf_counter() - started
+        best = min(best, elapsed)
+        if elapsed > MIN_MEASURABLE:
+            break
+    return best
+
+
+def _pump(compiled, prefix: str, pump: str, suffix: str, budget: float,
+          anchored: bool = False) -> Tuple[List[Tuple[int, float]], bool]:
+    """Time matches of prefix + pump * n + suffix for growing n.
+
+    With `anchored`, only the match attempt at the start of the input is
+    timed, leaving out the cost of retrying every later start position.
+
+    Returns:
+        The (input length, seconds) series and whether the budget was exceeded
+    """
+    timings = []
+    for steps in PUMP_STEPS:
+        text = prefix + pump * steps + suffix
+        if len(text) > MAX_INPUT_LENGTH:
+            break
+        elapsed = _time_search(compiled, text, anchored)
+        timings.append((len(text), elapsed))
+        if elapsed > budget:
+            return timings, True
+    return timings, False
+
+
+def _growth(timings: List[Tuple[int, float]]) -> float:
+    """Estimate k in time ~ length ** k from the two longest measurable inputs."""
+    measurable = [(n, t) for n, t in timings if t >= MIN_MEASURABLE]
+    if len(measurable) < 2:
+        return 1.0
+    (n1, t1), (n2, t2) = measurable[-2], measurable[-1]
+    if n2 <= n1:
+        return 1.0
+    return math.log(t2 / t1) / math.log(n2 / n1)
+
+
+def _benign_throughput(compiled) -> float:
+    # A single KiB: longer benign input can itself take seconds on a polynomial pattern
+    text = (BENIGN_INPUT * (1024 // len(BENIGN_INPUT) + 1))[:1024]
+    return _time_search(compiled, text) * 1e6
+
+
+@functools.lru_cache(maxsize=1024)
+def analyze_pattern(pattern: str, budget: float = DEFAULT_BUDGET) -> RegexReport:
+    """Look for catastrophic backtracking in a regular expression.
+
+    Args:
+        pattern: The regex, as written in an `@rx` operator
+        budget: Seconds a single match may take before pumping stops
+
+    Returns:
+        A RegexReport; patterns Python's `re` cannot compile are reported as
+        "not analyzed"
+    """
+    try:
+        compiled = re.compile(pattern)
+        parsed = sre_parse.parse(pattern)
+    except (re.error, RecursionError, OverflowError) as e:
+        return RegexReport(pattern, NOT_ANALYZED, error=f"not supported by Python's re: {e}")
+    state = getattr(parsed, "state", None) or parsed.pattern
+    ignorecase = bool(state.flags & sre_constants.SRE_FLAG_IGNORECASE)
+
+    issues: List[str] = []
+    _static_issues(parsed, ignorecase, issues)
+    report = RegexReport(pattern, LINEAR, issues=list(dict.fromkeys(issues)))
+    report.benign_us_per_kb = round(_benign_throughput(compiled), 2)
+
+    # Without a construct the static pass recognizes, super-linear search time
+    # usually comes from Python retrying every start position, which PCRE
+    # short-cuts; time the attempt at the attack's start only
+    anchored = not report.issues
+    repeats: List[Tuple[tuple, bool]] = []
+    _unbounded_repeats(parsed, ignorecase, repeats)
+    exceeded_any = False
+    growth = 1.0
+    for node, node_case in repeats[:MAX_CANDIDATES]:
+        prefix = _prefix(parsed, node, ignorecase) or ""
+        pump = _sample(node[1][2], node_case, at_least_once=True)
+        if not pump:
+            continue
+        body_first = _first(node[1][2], node_case)[0]
+        suffixes = [s for s in _FAIL_SUFFIXES if ord(s) not in body_first][:2] + [""]
+        for suffix in suffixes:
+            timings, exceeded = _pump(compiled, prefix, pump, suffix, budget, anchored)
+            worst_length, worst_seconds = timings[-1] if timings else (0, 0.0)
+            if worst_seconds > report.worst_seconds:
+                report.worst_seconds = worst_seconds
+                report.worst_length = worst_length
+                report.timings = timings
+                steps = (worst_length - len(prefix) - len(suffix)) // len(pump)
+                report.attack = f"{prefix!r} + {pump!r} * {steps} + {suffix!r}"
+            if exceeded and worst_length <= len(prefix) + len(pump) * PUMP_STEPS[6] + len(suffix):
+                report.verdict = EXPONENTIAL
+            exceeded_any = exceeded_any or exceeded
+            growth = max(growth, _growth(timings))
+            if report.verdict == EXPONENTIAL:
+                break
+        if report.verdict == EXPONENTIAL:
+            break
+    if report.verdict != EXPONENTIAL and (exceeded_any or growth >= POLYNOMIAL_GROWTH):
+        report.verdict = POLYNOMIAL
+    report.worst_seconds = round(report.worst_seconds, 6)
+    report.timings = [(n, round(t, 6)) for n, t in report.timings]
+    logger.debug("Regex %s: %s (worst %.4fs at %d chars)", pattern, report.verdict,
+                 report.worst_seconds, report.worst_length)
+    return report
+
+
+def rule_patterns(rule: ParsedRule) -> List[str]:
+    """Return the `@rx` patterns of a rule and its chain, in order."""
+    return [link.operator_argument for link in rule.iter_chain()
+            if link.operator == "@rx" and link.operator_argument]
+
+
+def analyze_rule_regexes(rule_text: str, budget: float = DEFAULT_BUDGET) -> List[RegexReport]:
+    """Analyze every `@rx` pattern of a rule; unparseable rules yield no reports."""
+    try:
+        parsed = parse_rule(rule_text)
+    except RuleParseError:
+        return []
+    return [analyze_pattern(pattern, budget) for pattern in rule_patterns(parsed)]
+
+
+def _cell(text: str) -> str:
+    return text.replace("|", "\\|").replace("\n", " ")
+
+
+def _shorten(pattern: str, limit: int = 60) -> str:
+    return pattern if len(pattern) <= limit else pattern[:limit - 3] + "..."
+
+
+def regex_performance(rule_text: str, budget: float = DEFAULT_BUDGET) -> Optional[str]:
+    """Build the markdown "Regex Performance" section for a rule.
+
+    Returns:
+        The markdown section, or None if the rule has no `@rx` pattern
+    """
+    reports = analyze_rule_regexes(rule_text, budget)
+    if not reports:
+        return None
+    lines = ["## Regex Performance", "",
+             "| Pattern | Backtracking | Worst case | Benign input |", "| --- | --- | --- | --- |"]
+    for report in reports:
+        if report.error:
+            lines.append(f"| `{_cell(_shorten(report.pattern))}` | {report.verdict} | - | - |")
+            continue
+        worst = (f"{report.worst_seconds * 1000:.2f} ms at {report.worst_length} chars" if report.worst_length
+                 else "no unbounded repeats")
+        lines.append(f"| `{_cell(_shorten(report.pattern))}` | {report.verdict} | {worst} | "
+                     f"{report.benign_us_per_kb:.1f} µs/KiB |")
+    notes = []
+    for report in reports:
+        notes.extend(f"- {_cell(issue)}" for issue in report.issues)
+        if report.error:
+            notes.append(f"- `{_cell(_shorten(report.pattern))}` {report.error}")
+        elif report.dangerous:
+            notes.append(f"- Slowest input for `{_cell(_shorten(report.pattern))}`: `{_cell(report.attack)}`")
+    if notes:
+        lines.extend([""] + list(dict.fromkeys(notes)))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,234 @@
+# Description: Near-duplicate detection for ModSecurity rules.
+# Many CRS rules are copies of each other that differ only in their target
+# variables, ids or paranoia-level bookkeeping. A rule's detection logic
+# (operator, pattern and transformations) is fingerprinted for exact matches,
+# and MinHash signatures with LSH banding find rules whose logic is merely
+# similar, so an existing analysis can be reused as the base for a new one.
+# Rules without a distinctive pattern (SecAction, `@eq 0`) are told apart by
+# their variables and the variables they set instead.
+
+import re
+import json
+import random
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from .parser import ParsedRule, RuleParseError, parse_rule
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.8
+NUM_PERMUTATIONS = 64
+BANDS = 16
+
+# Actions that describe or account for a match rather than define it
+METADATA_ACTIONS = frozenset((
+    "id", "msg", "logdata", "tag", "severity", "ver", "rev", "maturity", "accuracy",
+    "setvar", "capture", "log", "nolog", "auditlog", "noauditlog", "chain",
+))
+
+# Actions whose targets say what a rule without a distinctive pattern does
+TARGET_ACTIONS = ("setvar", "ctl")
+
+# Operator arguments too generic to identify a rule on their own (none, or a number)
+_GENERIC_ARGUMENT = re.compile(r"^\s*(?:-?\d+)?\s*$")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_SHINGLE_SIZE = 4
+
+
+def _detection_links(rule: ParsedRule) -> List[ParsedRule]:
+    return list(rule.iter_chain())
+
+
+def _is_generic(link: ParsedRule) -> bool:
+    """Return True for a link without a distinctive operator argument (SecAction, `@eq 0`)."""
+    return not link.operator or bool(_GENERIC_ARGUMENT.match(link.operator_argument))
+
+
+def _targets(link: ParsedRule) -> List[str]:
+    """Return the variables a link inspects and the setvar/ctl targets it changes."""
+    targets = ["var:" + variable.upper() for variable in link.variables]
+    for action in link.actions:
+        if action.name in TARGET_ACTIONS and action.value:
+            target = action.value.lstrip("!").partition("=")[0] if action.name == "setvar" else action.value
+            targets.append(f"{action.name}:{target.lower()}")
+    return targets
+
+
+def logic_fingerprint(rule: ParsedRule) -> str:
+    """Hash the detection logic of a rule: operators, patterns and transformations.
+
+    Variables and metadata actions are left out, so rules that apply the same
+    pattern to different targets share a fingerprint. Links without a
+    distinctive pattern include their variables and setvar/ctl targets, since
+    those are what such a link is about.
+    """
+    logic = []
+    for link in _detection_links(rule):
+        part = [link.negated, link.operator, link.operator_argument, link.transformations]
+        if _is_generic(link):
+            part.append(sorted(_targets(link)))
+        logic.append(part)
+    return hashlib.sha1(json.dumps(logic).encode("utf-8")).hexdigest()
+
+
+def rule_features(rule: ParsedRule) -> FrozenSet[str]:
+    """Return the token set MinHash signatures are computed over.
+
+    Patterns contribute character shingles so that small edits to a regex
+    keep most of its tokens; variables, transformations and behavioral
+    actions contribute one token each.
+    """
+    features = set()
+    for position, link in enumerate(_detection_links(rule)):
+        prefix = f"{position}:"
+        features.update(prefix + "var:" + variable.upper() for variable in link.variables)
+        if link.operator:
+            features.add(prefix + "op:" + ("!" if link.negated else "") + link.operator)
+            argument = link.operator_argument
+            if len(argument) <= _SHINGLE_SIZE:
+                features.add(prefix + "arg:" + argument)
+            for i in range(len(argument) - _SHINGLE_SIZE + 1):
+                features.add(prefix + "arg:" + argument[i:i + _SHINGLE_SIZE])
+        features.update(prefix + "t:" + name for name in link.transformations)
+        features.update(prefix + "action:" + action.name for action in link.actions
+                        if action.name not in METADATA_ACTIONS and action.name != "t")
+        if _is_generic(link):
+            features.update(prefix + target for target in _targets(link) if not target.startswith("var:"))
+    return frozenset(features)
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class MinHasher:
+    """MinHash signatures from a fixed family of universal hash permutations."""
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, seed: int = 1):
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_permutations)
+        ]
+
+    def signature(self, features: FrozenSet[str]) -> Tuple[int, ...]:
+        hashes = [_token_hash(feature) for feature in features] or [0]
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self.permutations)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class SimilarRule:
+    """An indexed rule that a queried rule resembles."""
+
+    text: str
+    rule_id: Optional[str]
+    payload: Any
+    score: float
+    exact_logic: bool
+
+
+@dataclass
+class _Entry:
+    text: str
+    rule_id: Optional[str]
+    payload: Any
+    features: FrozenSet[str]
+
+
+class SimilarityIndex:
+    """Thread-safe index of rules for finding near-duplicates.
+
+    Rules with an identical logic fingerprint match with a score of 1.0.
+    Other candidates come from LSH buckets over MinHash signatures and are
+    confirmed with the exact Jaccard similarity of their features.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_permutations: int = NUM_PERMUTATIONS,
+                 bands: int = BANDS):
+        """Initialize the index.
+
+        Args:
+            threshold: Minimum Jaccard similarity for a near-duplicate (0..1]
+            num_permutations: MinHash signature length
+            bands: LSH bands; more bands find less similar candidates
+
+        Raises:
+            ValueError: If the threshold or band count is invalid
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        if num_permutations % bands:
+            raise ValueError("num_permutations must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_permutations // bands
+        self._hasher = MinHasher(num_permutations)
+        self._entries: List[_Entry] = []
+        self._by_fingerprint: Dict[str, int] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def add(self, text: str, payload: Any = None) -> bool:
+        """Index a rule together with a payload (typically its analysis).
+
+        Returns:
+            False if the rule could not be parsed and was not indexed
+        """
+        try:
+            parsed = parse_rule(text)
+        except RuleParseError:
+            return False
+        fingerprint = logic_fingerprint(parsed)
+        features = rule_features(parsed)
+        band_keys = self._band_keys(self._hasher.signature(features))
+        with self._lock:
+            position = len(self._entries)
+            self._entries.append(_Entry(text, parsed.rule_id, payload, features))
+            self._by_fingerprint.setdefault(fingerprint, position)
+            for key in band_keys:
+                self._buckets.setdefault(key, []).append(position)
+        return True
+
+    def find(self, text: str) -> Optional[SimilarRule]:
+        """Return the most similar indexed rule, or None below the threshold."""
+        try:
+            parsed = parse_rule(text)
+        except RuleParseError:
+            return None
+        fingerprint = logic_fingerprint(parsed)
+        features = rule_features(parsed)
+        band_keys = self._band_keys(self._hasher.signature(features))
+        with self._lock:
+            position = self._by_fingerprint.get(fingerprint)
+            if position is not None:
+                entry = self._entries[position]
+                return SimilarRule(entry.text, entry.rule_id, entry.payload, 1.0, True)
+            candidates = {p for key in band_keys for p in self._buckets.get(key, ())}
+            entries = [self._entries[p] for p in sorted(candidates)]
+
+        best: Optional[SimilarRule] = None
+        for entry in entries:
+            score = jaccard(features, entry.features)
+            if score >= self.threshold and (best is None or score > best.score):
+                best = SimilarRule(entry.text, entry.rule_id, entry.payload, round(score, 3), False)
+        if best is not None:
+            logger.debug("Rule resembles %s (similarity %.2f)", best.rule_id, best.score)
+        return best
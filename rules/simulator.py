@@ -0,0 +1,661 @@
+# Description: In-process evaluation of a practical subset of SecRule semantics.
+# Requests are matched against a rule locally (request variables, `t:`
+# transformations and the common operators), so generated test payloads can
+# be checked in bulk without sending them to a sandbox. Anything outside the
+# supported subset is reported rather than silently guessed.
+
+import os
+import re
+import html
+import shlex
+import base64
+import hashlib
+import logging
+import functools
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, quote, unquote, unquote_plus, urlsplit
+
+from .parser import ParsedRule, RuleParseError, join_continuations, parse_rule
+from .phrase_match import PhraseMatcher, file_matcher, inline_matcher
+
+logger = logging.getLogger(__name__)
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+
+@dataclass
+class HttpRequest:
+    """A request as seen by ModSecurity's request phases."""
+
+    method: str = "GET"
+    uri: str = "/"
+    headers: List[Tuple[str, str]] = field(default_factory=list)
+    body: str = ""
+    protocol: str = "HTTP/1.1"
+
+    def header(self, name: str) -> Optional[str]:
+        for key, value in self.headers:
+            if key.lower() == name.lower():
+                return value
+        return None
+
+    @property
+    def path(self) -> str:
+        return self.uri.split("?", 1)[0]
+
+    @property
+    def query_string(self) -> str:
+        return self.uri.split("?", 1)[1] if "?" in self.uri else ""
+
+    @property
+    def args_get(self) -> List[Tuple[str, str]]:
+        return parse_qsl(self.query_string, keep_blank_values=True)
+
+    @property
+    def args_post(self) -> List[Tuple[str, str]]:
+        content_type = (self.header("Content-Type") or "").split(";")[0].strip().lower()
+        if not self.body or content_type != FORM_CONTENT_TYPE:
+            return []
+        return parse_qsl(self.body, keep_blank_values=True)
+
+    @property
+    def cookies(self) -> List[Tuple[str, str]]:
+        cookies = []
+        for header in (value for key, value in self.headers if key.lower() == "cookie"):
+            for part in header.split(";"):
+                name, _, value = part.strip().partition("=")
+                if name:
+                    cookies.append((name, value))
+        return cookies
+
+
+@dataclass
+class VariableMatch:
+    """A variable value that satisfied a rule's operator."""
+
+    variable: str
+    value: str
+
+
+@dataclass
+class Evaluation:
+    """Outcome of evaluating a rule (and its chain) against a request.
+
+    Attributes:
+        matched: Whether every rule of the chain matched
+        matches: Matching values of each evaluated chain link
+        unsupported: Variables, transformations, operators or macros outside
+            the simulated subset; a result with entries here may differ from
+            ModSecurity's
+        tx: Transaction variables after capture and setvar
+    """
+
+    matched: bool
+    matches: List[VariableMatch] = field(default_factory=list)
+    unsupported: List[str] = field(default_factory=list)
+    tx: Dict[str, str] = field(default_factory=dict)
+
+
+# --- Transformations ---
+
+def _normalize_path(value: str) -> str:
+    leading = value.startswith("/")
+    trailing = value.endswith("/") and len(value) > 1
+    parts: List[str] = []
+    for segment in value.split("/"):
+        if segment in ("", "."):
+            continue
+        if segment == "..":
+            if parts and parts[-1] != "..":
+                parts.pop()
+            elif not leading:
+                parts.append(segment)
+            continue
+        parts.append(segment)
+    path = ("/" if leading else "") + "/".join(parts)
+    return path + "/" if trailing and path != "/" else path
+
+
+def _cmd_line(value: str) -> str:
+    value = re.sub(r"[\\\"'^]", "", value)
+    value = re.sub(r"[,;]", " ", value)
+    value = re.sub(r"\s+", " ", value)
+    value = re.sub(r" ([/(])", r"\1", value)
+    return value.lower()
+
+
+def _escape_decode(value: str) -> str:
+    simple = {"n": "\n", "t": "\t", "r": "\r", "a": "\a", "b": "\b", "f": "\f", "v": "\v",
+              "\\": "\\", "'": "'", '"': '"', "?": "?", "0": "\x00"}
+
+    def replace(match: "re.Match") -> str:
+        escape = match.group(0)[1:]
+        if escape[0] in "xX" and len(escape) == 3:
+            return chr(int(escape[1:], 16))
+        if escape[0] == "u" and len(escape) == 5:
+            return chr(int(escape[1:], 16))
+        return simple.get(escape, escape)
+    return re.sub(r"\\(?:[xX][0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|.)", replace, value, flags=re.DOTALL)
+
+
+def _base64_decode(value: str) -> str:
+    cleaned = re.sub(r"[^A-Za-z0-9+/]", "", value)
+    try:
+        return base64.b64decode(cleaned + "=" * (-len(cleaned) % 4)).decode("latin-1")
+    except ValueError:
+        return ""
+
+
+def _hex_decode(value: str) -> str:
+    try:
+        return bytes.fromhex(value).decode("latin-1")
+    except ValueError:
+        return value
+
+
+def _url_decode_uni(value: str) -> str:
+    value = re.sub(r"%u([0-9a-fA-F]{4})", lambda m: chr(int(m.group(1), 16)), value)
+    return unquote_plus(value, errors="replace")
+
+
+def _remove_comments(value: str) -> str:
+    value = re.sub(r"/\*.*?(\*/|$)", "", value, flags=re.DOTALL)
+    return re.sub(r"(--|#).*$", "", value, flags=re.MULTILINE)
+
+
+def _digest(algorithm: str) -> Callable[[str], str]:
+    return lambda value: hashlib.new(algorithm, value.encode("utf-8")).digest().decode("latin-1")
+
+
+TRANSFORMATIONS: Dict[str, Callable[[str], str]] = {
+    "lowercase": str.lower,
+    "uppercase": str.upper,
+    "urldecode": lambda value: unquote_plus(value, errors="replace"),
+    "urldecodeuni": _url_decode_uni,
+    "urlencode": lambda value: quote(value, safe=""),
+    "htmlentitydecode": html.unescape,
+    "compresswhitespace": lambda value: re.sub(r"\s+", " ", value),
+    "removewhitespace": lambda value: re.sub(r"\s+", "", value),
+    "removenulls": lambda value: value.replace("\x00", ""),
+    "replacenulls": lambda value: value.replace("\x00", " "),
+    "trim": str.strip,
+    "trimleft": str.lstrip,
+    "trimright": str.rstrip,
+    "length": lambda value: str(len(value.encode("utf-8"))),
+    "base64decode": _base64_decode,
+    "base64decodeext": _base64_decode,
+    "base64encode": lambda value: base64.b64encode(value.encode("utf-8")).decode("ascii"),
+    "hexdecode": _hex_decode,
+    "hexencode": lambda value: value.encode("utf-8").hex(),
+    "normalizepath": _normalize_path,
+    "normalisepath": _normalize_path,
+    "normalizepathwin": lambda value: _normalize_path(value.replace("\\", "/")),
+    "normalisepathwin": lambda value: _normalize_path(value.replace("\\", "/")),
+    "cmdline": _cmd_line,
+    "jsdecode": _escape_decode,
+    "escapeseqdecode": _escape_decode,
+    "replacecomments": lambda value: re.sub(r"/\*.*?(\*/|$)", " ", value, flags=re.DOTALL),
+    "removecomments": _remove_comments,
+    "removecommentschar": lambda value: re.sub(r"/\*|\*/|--|#", "", value),
+    "sha1": _digest("sha1"),
+    "md5": _digest("md5"),
+}
+
+
+# --- Operators ---
+
+@functools.lru_cache(maxsize=4096)
+def _compile(pattern: str) -> "re.Pattern":
+    return re.compile(pattern, re.DOTALL)
+
+
+def _number(value: str) -> int:
+    match = re.match(r"\s*[-+]?\d+", value)
+    return int(match.group(0)) if match else 0
+
+
+def _byte_ranges(argument: str) -> List[Tuple[int, int]]:
+    ranges = []
+    for part in argument.split(","):
+        low, _, high = part.strip().partition("-")
+        if low.strip().isdigit():
+            ranges.append((int(low), int(high) if high.strip().isdigit() else int(low)))
+    return ranges
+
+
+def _pm(argument: str) -> Callable[[str], bool]:
+    matcher = inline_matcher(argument)
+    return lambda value: matcher.search(value) is not None
+
+
+# Operator name -> factory building a value predicate from the (expanded) argument
+OPERATORS: Dict[str, Callable[[str], Callable[[str], bool]]] = {
+    "@pm": _pm,
+    "@contains": lambda arg: lambda value: arg in value,
+    "@containsword": lambda arg: lambda value: re.search(r"(?<!\w)" + re.escape(arg) + r"(?!\w)", value) is not None,
+    "@beginswith": lambda arg: lambda value: value.startswith(arg),
+    "@endswith": lambda arg: lambda value: value.endswith(arg),
+    "@streq": lambda arg: lambda value: value == arg,
+    "@strmatch": lambda arg: lambda value: arg in value,
+    "@within": lambda arg: lambda value: value in arg,
+    "@eq": lambda arg: lambda value: _number(value) == _number(arg),
+    "@ge": lambda arg: lambda value: _number(value) >= _number(arg),
+    "@gt": lambda arg: lambda value: _number(value) > _number(arg),
+    "@le": lambda arg: lambda value: _number(value) <= _number(arg),
+    "@lt": lambda arg: lambda value: _number(value) < _number(arg),
+    "@unconditionalmatch": lambda arg: lambda value: True,
+    "@nomatch": lambda arg: lambda value: False,
+    "@validatebyterange": lambda arg: lambda value: any(
+        not any(low <= byte <= high for low, high in _byte_ranges(arg)) for byte in value.encode("utf-8")),
+}
+
+
+class _Transaction:
+    """Per-evaluation state: the request, TX collection and unsupported features seen."""
+
+    def __init__(self, request: HttpRequest, data_dir: Optional[str] = None):
+        self.request = request
+        self.data_dir = data_dir
+        self.tx: Dict[str, str] = {}
+        self.unsupported: List[str] = []
+
+    def unsupported_feature(self, feature: str):
+        if feature not in self.unsupported:
+            self.unsupported.append(feature)
+
+    def expand(self, text: str) -> str:
+        """Expand %{tx.name} macros; other macros are left as written."""
+        def replace(match: "re.Match") -> str:
+            collection, _, key = match.group(1).partition(".")
+            if collection.lower() == "tx":
+                return self.tx.get(key.lower(), "")
+            if collection.lower() == "request_headers" and key:
+                return self.request.header(key) or ""
+            self.unsupported_feature(f"macro %{{{match.group(1)}}}")
+            return match.group(0)
+        return re.sub(r"%\{([^}]+)\}", replace, text)
+
+    def collection(self, name: str) -> Optional[List[Tuple[str, str]]]:
+        """Return the (key, value) pairs of a variable, or None if it is not simulated."""
+        request = self.request
+        if name == "ARGS":
+            return request.args_get + request.args_post
+        if name == "ARGS_GET":
+            return request.args_get
+        if name == "ARGS_POST":
+            return request.args_post
+        if name in ("ARGS_NAMES", "ARGS_GET_NAMES", "ARGS_POST_NAMES"):
+            pairs = self.collection(name[:-len("_NAMES")])
+            return [(key, key) for key, _ in pairs]
+        if name == "REQUEST_HEADERS":
+            return list(request.headers)
+        if name == "REQUEST_HEADERS_NAMES":
+            return [(key, key) for key, _ in request.headers]
+        if name == "REQUEST_COOKIES":
+            return request.cookies
+        if name == "REQUEST_COOKIES_NAMES":
+            return [(key, key) for key, _ in request.cookies]
+        if name == "TX":
+            return list(self.tx.items())
+        scalars = {
+            "REQUEST_METHOD": request.method,
+            "REQUEST_PROTOCOL": request.protocol,
+            "REQUEST_URI": unquote(request.uri, errors="replace"),
+            "REQUEST_URI_RAW": request.uri,
+            "REQUEST_FILENAME": unquote(request.path, errors="replace"),
+            "REQUEST_BASENAME": unquote(request.path, errors="replace").rsplit("/", 1)[-1],
+            "REQUEST_LINE": f"{request.method} {request.uri} {request.protocol}",
+            "QUERY_STRING": request.query_string,
+            "REQUEST_BODY": request.body,
+            "REQUEST_BODY_LENGTH": str(len(request.body.encode("utf-8"))),
+        }
+        if name in scalars:
+            return [(name, scalars[name])]
+        return None
+
+    def values(self, variables: Iterable[str]) -> List[Tuple[str, str]]:
+        """Resolve a rule's variable list to (variable name, value) pairs."""
+        included: List[Tuple[str, Optional[str], bool]] = []
+        excluded: List[Tuple[str, Optional[str]]] = []
+        for variable in variables:
+            count = variable.startswith("&")
+            exclude = variable.startswith("!")
+            name, _, selector = variable.lstrip("&!").partition(":")
+            entry = (name.upper(), selector or None)
+            if exclude:
+                excluded.append(entry)
+            else:
+                included.append(entry + (count,))
+
+        values = []
+        for name, selector, count in included:
+            pairs = self.collection(name)
+            if pairs is None:
+                self.unsupported_feature(f"variable {name}")
+                pairs = []
+            selected = [(key, value) for key, value in pairs
+                        if _selected(key, selector)
+                        and not any(ex_name == name and _selected(key, ex_selector) and ex_selector
+                                    for ex_name, ex_selector in excluded)]
+            if count:
+                values.append((f"&{name}" + (f":{selector}" if selector else ""), str(len(selected))))
+            else:
+                values.extend((name if key == name else f"{name}:{key}", value) for key, value in selected)
+        return values
+
+
+def _selected(key: str, selector: Optional[str]) -> bool:
+    if selector is None:
+        return True
+    if len(selector) > 1 and selector.startswith("/") and selector.endswith("/"):
+        try:
+            return _compile(selector[1:-1]).search(key) is not None
+        except re.error:
+            return False
+    return key.lower() == selector.lower()
+
+
+def _transform(value: str, names: List[str], transaction: _Transaction, multi_match: bool) -> List[str]:
+    """Apply a rule's transformation pipeline, returning the values to test.
+
+    `t:none` discards the transformations listed before it. With multiMatch
+    the value is tested before and after every transformation.
+    """
+    pipeline: List[str] = []
+    for name in names:
+        pipeline = [] if name.lower() == "none" else pipeline + [name]
+    candidates = [value]
+    for name in pipeline:
+        function = TRANSFORMATIONS.get(name.lower())
+        if function is None:
+            transaction.unsupported_feature(f"transformation t:{name}")
+            continue
+        value = function(value)
+        candidates.append(value)
+    return candidates if multi_match else [value]
+
+
+def _predicate(link: ParsedRule, transaction: _Transaction) -> Callable[[str], Optional[List[str]]]:
+    """Return a function giving the captures of a matching value, or None when it does not match."""
+    operator = (link.operator or "@rx").lower()
+    argument = transaction.expand(link.operator_argument)
+    if operator == "@rx":
+        try:
+            pattern = _compile(argument)
+        except re.error as e:
+            transaction.unsupported_feature(f"@rx pattern Python cannot compile ({e})")
+            return lambda value: None
+
+        def rx(value: str) -> Optional[List[str]]:
+            match = pattern.search(value)
+            if match is None:
+                return None
+            return [match.group(0)] + [group or "" for group in match.groups()[:9]]
+        return rx
+    if operator in ("@pmfromfile", "@pmf"):
+        matchers = _file_matchers(argument, link.operator, transaction)
+        if matchers is None:
+            return lambda value: None
+
+        def pm_from_file(value: str) -> Optional[List[str]]:
+            for matcher in matchers:
+                phrase = matcher.search(value)
+                if phrase is not None:
+                    return [phrase]
+            return None
+        return pm_from_file
+    factory = OPERATORS.get(operator)
+    if factory is None:
+        transaction.unsupported_feature(f"operator {link.operator}")
+        return lambda value: None
+    check = factory(argument)
+    return lambda value: [value] if check(value) else None
+
+
+def _file_matchers(argument: str, operator: str, transaction: _Transaction) -> Optional[List[PhraseMatcher]]:
+    """Load the cached automata of the data files an `@pmFromFile` argument names.
+
+    Relative paths are resolved against the transaction's data directory,
+    as ModSecurity resolves them against the including configuration file.
+    """
+    if transaction.data_dir is None:
+        transaction.unsupported_feature(f"operator {operator} without a data directory")
+        return None
+    matchers = []
+    for name in argument.split():
+        if "://" in name:
+            transaction.unsupported_feature(f"operator {operator} with remote data {name}")
+            return None
+        try:
+            matchers.append(file_matcher(os.path.join(transaction.data_dir, name)))
+        except OSError as e:
+            transaction.unsupported_feature(f"operator {operator} with unreadable data file {name} ({e.strerror})")
+            return None
+    return matchers
+
+
+def _apply_setvar(expression: str, transaction: _Transaction):
+    expression = transaction.expand(expression)
+    if expression.startswith("!"):
+        collection, _, key = expression[1:].partition(".")
+        if collection.lower() == "tx":
+            transaction.tx.pop(key.lower(), None)
+        return
+    target, _, value = expression.partition("=")
+    collection, _, key = target.partition(".")
+    if collection.lower() != "tx":
+        transaction.unsupported_feature(f"setvar on {collection.upper()}")
+        return
+    key = key.lower()
+    if value[:1] in "+-" and value[1:].strip().lstrip("-").isdigit():
+        current = _number(transaction.tx.get(key, "0"))
+        delta = int(value[1:])
+        transaction.tx[key] = str(current + delta if value[0] == "+" else current - delta)
+    else:
+        transaction.tx[key] = value or "1"
+
+
+def _evaluate_link(link: ParsedRule, transaction: _Transaction) -> List[VariableMatch]:
+    if link.directive == "SecAction":
+        return [VariableMatch("", "")]
+    multi_match = link.has_action("multimatch")
+    predicate = _predicate(link, transaction)
+    matches = []
+    captures = None
+    for variable, raw in transaction.values(link.variables):
+        for value in _transform(raw, link.transformations, transaction, multi_match):
+            result = predicate(value)
+            if (result is None) == link.negated:
+                matches.append(VariableMatch(variable, value))
+                if captures is None and result is not None:
+                    captures = result
+                break
+    if matches and captures is not None and link.has_action("capture"):
+        for index, group in enumerate(captures):
+            transaction.tx[str(index)] = group
+    return matches
+
+
+def evaluate_rule(rule: Union[str, ParsedRule], request: HttpRequest,
+                  data_dir: Optional[str] = None) -> Evaluation:
+    """Evaluate a rule and its chain against a request.
+
+    Each chain link is tested in turn; the rule matches only if every link
+    matches. `capture` and `setvar:tx.*` of matching links are applied so
+    later links can refer to TX values.
+
+    Args:
+        rule: The rule text or an already parsed rule
+        request: The request to test
+        data_dir: Directory `@pmFromFile` data files are read from (usually
+            the directory of the rule file); without it the operator is
+            reported as unsupported
+
+    Returns:
+        An Evaluation; check its `unsupported` list before trusting a result
+
+    Raises:
+        RuleParseError: If the rule text cannot be parsed
+    """
+    parsed = parse_rule(rule) if isinstance(rule, str) else rule
+    transaction = _Transaction(request, data_dir)
+    matches: List[VariableMatch] = []
+    matched = True
+    for link in parsed.iter_chain():
+        link_matches = _evaluate_link(link, transaction)
+        if not link_matches:
+            matched = False
+            break
+        matches.extend(m for m in link_matches if m.variable)
+        for expression in link.action_values("setvar"):
+            if expression:
+                _apply_setvar(expression, transaction)
+    return Evaluation(matched, matches, transaction.unsupported, dict(transaction.tx))
+
+
+# --- Test cases ---
+
+# curl options whose value is irrelevant to the request ModSecurity sees
+_CURL_SKIPPED_WITH_VALUE = {"-o", "--output", "-m", "--max-time", "--connect-timeout", "-w", "--write-out",
+                            "-u", "--user", "--proto", "-x", "--proxy", "--retry", "-K", "--config"}
+_CURL_DATA = {"-d", "--data", "--data-raw", "--data-binary", "--data-ascii"}
+
+
+def request_from_curl(command: str) -> HttpRequest:
+    """Build the request a curl command line would send.
+
+    Supports the options test cases use: -X, -H, -A, -e, -b, -d and its
+    variants, --data-urlencode, -G and -I. Other options are ignored.
+
+    Raises:
+        ValueError: If the command is not a curl invocation with a URL
+    """
+    tokens = shlex.split(join_continuations(command))
+    if not tokens or tokens[0] != "curl":
+        raise ValueError("Not a curl command")
+    method = None
+    url = None
+    headers: List[Tuple[str, str]] = []
+    data: List[str] = []
+    as_query = False
+    position = 1
+    while position < len(tokens):
+        token = tokens[position]
+        value = tokens[position + 1] if position + 1 < len(tokens) else ""
+        position += 1
+        if token in ("-X", "--request"):
+            method, position = value, position + 1
+        elif token in ("-H", "--header"):
+            name, _, header_value = value.partition(":")
+            headers.append((name.strip(), header_value.strip()))
+            position += 1
+        elif token in ("-A", "--user-agent"):
+            headers.append(("User-Agent", value))
+            position += 1
+        elif token in ("-e", "--referer"):
+            headers.append(("Referer", value))
+            position += 1
+        elif token in ("-b", "--cookie"):
+            headers.append(("Cookie", value))
+            position += 1
+        elif token in _CURL_DATA:
+            data.append(value)
+            position += 1
+        elif token == "--data-urlencode":
+            name, sep, content = value.rpartition("=")
+            data.append(f"{name}{sep}{quote(content, safe='')}")
+            position += 1
+        elif token in ("-G", "--get"):
+            as_query = True
+        elif token in ("-I", "--head"):
+            method = method or "HEAD"
+        elif token == "--url":
+            url, position = value, position + 1
+        elif token in _CURL_SKIPPED_WITH_VALUE:
+            position += 1
+        elif not token.startswith("-"):
+            url = token
+    if url is None:
+        raise ValueError("curl command has no URL")
+
+    parts = urlsplit(url if "://" in url else f"http://{url}")
+    uri = parts.path or "/"
+    query = parts.query
+    body = ""
+    if data and as_query:
+        query = "&".join(([query] if query else []) + data)
+    elif data:
+        body = "&".join(data)
+    if query:
+        uri += "?" + query
+    names = {name.lower() for name, _ in headers}
+    defaults = [("Host", parts.netloc), ("User-Agent", "curl/8.5.0"), ("Accept", "*/*")]
+    if body:
+        defaults += [("Content-Type", FORM_CONTENT_TYPE), ("Content-Length", str(len(body.encode("utf-8"))))]
+    headers = [(name, value) for name, value in defaults if name.lower() not in names] + headers
+    return HttpRequest(method or ("POST" if body else "GET"), uri, headers, body)
+
+
+_EXPECT_NO_MATCH = re.compile(r"false[ -]positive|benign|legitimate|negative|should not|must not|no match", re.I)
+_EXPECT_MATCH = re.compile(r"true[ -]positive|attack|malicious|positive|should (?:match|trigger|block)", re.I)
+
+
+def extract_curl_tests(text: str) -> List[Tuple[Optional[bool], str]]:
+    """Find curl commands in a test case section, with the outcome their comments expect.
+
+    A comment such as "# True positive" before a command means it should
+    match (True); "# False positive" or "# Benign request" means it should
+    not (False). Unlabelled commands get None.
+    """
+    tests = []
+    expected: Optional[bool] = None
+    for line in join_continuations(text).splitlines():
+        stripped = line.strip().strip("`")
+        if stripped.startswith("curl "):
+            tests.append((expected, stripped))
+            expected = None
+        elif _EXPECT_NO_MATCH.search(stripped):
+            expected = False
+        elif _EXPECT_MATCH.search(stripped):
+            expected = True
+    return tests
+
+
+@dataclass
+class CurlCheck:
+    """Local verdict on one generated test command."""
+
+    command: str
+    expected: Optional[bool]
+    matched: Optional[bool]
+    unsupported: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def passed(self) -> Optional[bool]:
+        """Whether the rule behaved as labelled (None when unlabelled or not evaluated)."""
+        if self.expected is None or self.matched is None:
+            return None
+        return self.expected == self.matched
+
+
+def verify_test_cases(rule_text: str, test_case: Optional[str],
+                      data_dir: Optional[str] = None) -> List[CurlCheck]:
+    """Evaluate every curl command of a test case section against the rule.
+
+    `data_dir` is passed on to evaluate_rule for `@pmFromFile` data files.
+
+    Returns:
+        One CurlCheck per command; an unparseable rule or command is
+        reported in `error` rather than raised
+    """
+    results = []
+    for expected, command in extract_curl_tests(test_case or ""):
+        try:
+            evaluation = evaluate_rule(rule_text, request_from_curl(command), data_dir)
+        except (ValueError, RuleParseError) as e:
+            results.append(CurlCheck(command, expected, None, error=str(e)))
+            continue
+        results.append(CurlCheck(command, expected, evaluation.matched, evaluation.unsupported))
+    return results
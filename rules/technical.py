@@ -0,0 +1,90 @@
+# Description: Deterministic "Technical Analysis" section for a rule.
+# Everything in this section is derivable from rule syntax, so it is built
+# locally from the parsed rule instead of being requested from the LLM.
+
+from typing import List, Optional, Tuple
+
+from .parser import ParsedRule, RuleParseError, parse_rule
+
+PHASES = {
+    "1": "1 (request headers)",
+    "2": "2 (request body)",
+    "3": "3 (response headers)",
+    "4": "4 (response body)",
+    "5": "5 (logging)",
+    "request": "2 (request body)",
+    "response": "4 (response body)",
+    "logging": "5 (logging)",
+}
+
+DISRUPTIVE_ACTIONS = ("allow", "block", "deny", "drop", "pass", "pause", "proxy", "redirect")
+
+# Actions shown in their own rows rather than in the generic action list
+_DEDICATED_ACTIONS = ("id", "phase", "t", "msg", "logdata", "tag", "severity", "ver", "rev", "chain")
+
+
+def _cell(text: str) -> str:
+    return text.replace("|", "\\|").replace("\n", " ")
+
+
+def _code(text: str) -> str:
+    return f"`{_cell(text)}`"
+
+
+def technical_rows(rule: ParsedRule) -> List[Tuple[str, str]]:
+    """Return (field, value) rows describing a parsed rule and its chain."""
+    chain = list(rule.iter_chain())
+    rule_type = rule.directive
+    if rule.chained:
+        rule_type += f" (chain of {len(chain)} rules)"
+
+    variables = []
+    operators = []
+    transformations = []
+    other_actions = []
+    for link in chain:
+        variables.extend(link.variables)
+        if link.operator:
+            operator = ("!" if link.negated else "") + link.operator
+            operators.append(f"{operator} {link.operator_argument}".rstrip())
+        transformations.extend(link.transformations)
+        other_actions.extend(str(a) for a in link.actions
+                             if a.name not in _DEDICATED_ACTIONS and a.name not in DISRUPTIVE_ACTIONS)
+
+    disruptive = [a.name for a in rule.actions if a.name in DISRUPTIVE_ACTIONS]
+    rows = [
+        ("Rule ID", rule.rule_id or "not set"),
+        ("Rule Type", rule_type),
+        ("Variables", ", ".join(_code(v) for v in variables) or "none"),
+        ("Operators", ", ".join(_code(o) for o in operators) or "none (unconditional)"),
+        ("Disruptive Action", ", ".join(disruptive) or "none (inherits SecDefaultAction)"),
+        ("Actions", ", ".join(_code(a) for a in other_actions) or "none"),
+        ("Transformations", ", ".join(transformations) or "none"),
+        ("Phase", PHASES.get((rule.phase or "").lower(), rule.phase or "2 (default)")),
+    ]
+    for label, name in (("Severity", "severity"), ("Message", "msg"), ("Version", "ver")):
+        value = rule.action_value(name)
+        if value:
+            rows.append((label, _cell(value)))
+    tags = [tag for tag in rule.action_values("tag") if tag]
+    if tags:
+        rows.append(("Tags", ", ".join(_cell(tag) for tag in tags)))
+    return rows
+
+
+def technical_analysis(rule_text: str) -> Optional[str]:
+    """Build the markdown "Technical Analysis" section for a rule.
+
+    Args:
+        rule_text: The ModSecurity rule as written
+
+    Returns:
+        The markdown section, or None if the rule cannot be parsed
+    """
+    try:
+        parsed = parse_rule(rule_text)
+    except RuleParseError:
+        return None
+    lines = ["## Technical Analysis", "", "| Field | Value |", "| --- | --- |"]
+    lines.extend(f"| {field} | {value} |" for field, value in technical_rows(parsed))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# Description: Headless HTTP/JSON analysis service.
+# CI pipelines and SIEM tooling submit rules over HTTP instead of driving the
+# web UI. Analyses run on a fixed pool of worker threads fed by a bounded
+# queue; when the queue is full, submissions are refused with 429 so callers
+# back off instead of piling up work. Cached analyses are answered at once
+# without taking a queue slot.
+
+import sys
+import json
+import math
+import time
+import uuid
+import queue
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from analyzer import analysis_record, analyze_modsec_rule, block_record, cached_analysis, check_api_key
+from engine.concurrency import DEFAULT_CONCURRENCY
+from engine.metrics import metrics
+from engine.usage import usage_ledger
+from llms.router import RoutingPolicy
+from rules.splitter import RuleBlock, split_rules
+from templates.prompt_template import DEFAULT_SECTIONS, build_prompt_template
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ('perplexity', 'openai', 'xcom', 'google', 'ollama')
+DEFAULT_PORT = 8088
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_MAX_JOBS = 1000
+# Seconds POST /analyze waits for its result before answering 202 with the job
+DEFAULT_WAIT = 120.0
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+
+class QueueFull(RuntimeError):
+    """Raised when a submission does not fit in the job queue right now."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class AnalysisRequest:
+    """Analysis options of one submission."""
+
+    provider: str
+    prompt_template: Optional[str]  # None when only local sections are requested
+    options: Dict[str, Any]
+    structured: bool = False
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any], provider: str, use_cache: bool = True,
+                     routing: Optional[RoutingPolicy] = None) -> "AnalysisRequest":
+        """Build the options from a request body's `provider`, `sections`, `max_tokens` and `structured`.
+
+        Raises:
+            ValueError: If an option is invalid or the provider has no API key
+        """
+        provider = payload.get("provider") or provider
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown provider: {provider}")
+        sections = payload.get("sections") or list(DEFAULT_SECTIONS)
+        if not isinstance(sections, list) or not all(isinstance(s, str) for s in sections):
+            raise ValueError("sections must be a list of section names")
+        max_tokens = payload.get("max_tokens")
+        if max_tokens is not None and (isinstance(max_tokens, bool) or not isinstance(max_tokens, int)
+                                       or max_tokens < 1):
+            raise ValueError("max_tokens must be a positive integer")
+        options = {
+            "use_cache": use_cache,
+            "include_technical_analysis": "technical_analysis" in sections,
+            "include_regex_performance": "regex_performance" in sections,
+            "max_tokens": max_tokens,
+            "routing": routing if routing is not None and routing.enabled else None,
+        }
+        prompt_template = build_prompt_template(sections, max_tokens)
+        if prompt_template is not None:
+            check_api_key(provider)
+        return cls(provider, prompt_template, options, bool(payload.get("structured")))
+
+
+class Job:
+    """The rules of one submission and their records as they complete."""
+
+    def __init__(self, job_id: str, blocks: List[RuleBlock], request: AnalysisRequest):
+        self.id = job_id
+        self.blocks = blocks
+        self.request = request
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.records: List[Optional[Dict[str, Any]]] = [None] * len(blocks)
+        self._remaining = len(blocks)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not blocks:
+            self._finish()
+
+    def _finish(self):
+        self.finished = time.time()
+        self._done.set()
+
+    def complete(self, index: int, record: Dict[str, Any]):
+        with self._lock:
+            self.records[index] = record
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._finish()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def status(self) -> str:
+        if self.done:
+            return "done"
+        with self._lock:
+            return "running" if self._remaining < len(self.blocks) else "queued"
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every rule is analyzed; returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            records = [record for record in self.records if record is not None]
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "rules": len(self.blocks),
+            "completed": len(records),
+            "failed": sum(1 for record in records if "error" in record),
+            "created": self.created,
+            "finished": self.finished,
+            "results": records,
+        }
+
+
+class AnalysisService:
+    """Bounded job queue drained by a pool of analysis worker threads."""
+
+    def __init__(self, provider: str = "perplexity", workers: int = DEFAULT_CONCURRENCY,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, max_jobs: int = DEFAULT_MAX_JOBS,
+                 use_cache: bool = True, routing: Optional[RoutingPolicy] = None):
+        """Initialize the service; call start() to launch the workers.
+
+        Args:
+            provider: Provider used when a request does not name one
+            workers: Analyses run concurrently
+            queue_size: Rules that may wait for a worker before submissions get 429
+            max_jobs: Finished jobs kept for GET /jobs/{id}; the oldest are forgotten first
+            use_cache: Serve and store results in the persistent analysis cache
+            routing: Optional failover/hedging policy across providers
+
+        Raises:
+            ValueError: If a size is not positive
+        """
+        if workers < 1 or queue_size < 1 or max_jobs < 1:
+            raise ValueError("workers, queue_size and max_jobs must be at least 1")
+        self.provider = provider
+        self.workers = workers
+        self.use_cache = use_cache
+        self.routing = routing
+        self.max_jobs = max_jobs
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._admit_lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "AnalysisService":
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"analysis-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Fail the rules still queued and stop the workers once their current analysis ends."""
+        while True:
+            try:
+                job, index = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            job.complete(index, {**block_record(job.blocks[index]), "error": "Service stopped"})
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def request(self, payload: Dict[str, Any]) -> AnalysisRequest:
+        """Validate a request body's analysis options against the service defaults."""
+        return AnalysisRequest.from_payload(payload, self.provider, self.use_cache, self.routing)
+
+    def submit(self, blocks: List[RuleBlock], request: AnalysisRequest) -> Job:
+        """Queue the rules of a submission as one job.
+
+        A submission is admitted whole or not at all. Rules whose analysis is
+        cached complete immediately and need no queue slot.
+
+        Raises:
+            QueueFull: If the uncached rules do not fit in the queue right now
+            ValueError: If they could never fit (more rules than the queue holds)
+        """
+        job = Job(uuid.uuid4().hex, blocks, request)
+        pending = []
+        for index, block in enumerate(blocks):
+            analysis = self._cached(block, request)
+            if analysis is None:
+                pending.append(index)
+            else:
+                job.complete(index, _analysis_record(block, analysis, request.structured, cached=True))
+        if len(pending) > self._queue.maxsize:
+            raise ValueError(f"{len(pending)} uncached rules exceed the queue size of {self._queue.maxsize}")
+        with self._admit_lock:
+            free = self._queue.maxsize - self._queue.qsize()
+            if len(pending) > free:
+                raise QueueFull(f"Queue full: {self._queue.qsize()} rules waiting", self.retry_after())
+            self._remember(job)
+            for index in pending:
+                self._queue.put_nowait((job, index))
+        logger.info("Job %s: %d rules (%d cached)", job.id, len(blocks), len(blocks) - len(pending))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        """Seconds until the queued work is likely drained, from the observed analysis time."""
+        mean_ms = metrics.snapshot().get("analysis", {}).get("mean_ms") or 1000.0
+        return max(1, math.ceil(self._queue.qsize() / self.workers * mean_ms / 1000))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._jobs_lock:
+            jobs = list(self._jobs.values())
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "jobs": len(jobs),
+            "active_jobs": sum(1 for job in jobs if not job.done),
+        }
+
+    def _remember(self, job: Job):
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs; running ones are kept until they finish
+            for job_id in list(self._jobs):
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                if self._jobs[job_id].done:
+                    del self._jobs[job_id]
+
+    def _cached(self, block: RuleBlock, request: AnalysisRequest) -> Optional[Dict[str, Any]]:
+        # Regex performance timing is CPU-bound, so leave it to the worker pool
+        # rather than running it on the request thread for a cache hit
+        if not request.options["use_cache"] or request.options["include_regex_performance"]:
+            return None
+        options = {k: v for k, v in request.options.items() if k != "use_cache"}
+        try:
+            return cached_analysis(block.text, request.prompt_template, provider=request.provider, **options)
+        except Exception as e:
+            logger.warning("Cache lookup failed: %s", e)
+            logger.debug("Stack trace:", exc_info=True)
+            return None
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job, index = item
+            block = job.blocks[index]
+            request = job.request
+            try:
+                analysis = analyze_modsec_rule(block.text, request.prompt_template, provider=request.provider,
+                                               **request.options)
+                record = _analysis_record(block, analysis, request.structured)
+            except Exception as e:
+                logger.error("Job %s: analysis of rule %s failed: %s", job.id, block.rule_id, e)
+                logger.debug("Stack trace:", exc_info=True)
+                record = {**block_record(block), "error": str(e)}
+            job.complete(index, record)
+
+
+def _analysis_record(block: RuleBlock, analysis: Dict[str, Any], structured: bool,
+                     cached: bool = False) -> Dict[str, Any]:
+    """Record of an analyzed rule, in the format of the CLI's batch output."""
+    return {**analysis_record(block, analysis, structured), "cached": cached}
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    """Routes POST /analyze, POST /batch, GET /jobs/{id}, GET /health, GET /metrics and GET /usage."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    @property
+    def service(self) -> AnalysisService:
+        return self.server.service
+
+    def log_message(self, format: str, *args: Any):
+        logger.debug("service: " + format, *args)
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        self._send_json(status, {"error": message}, headers)
+
+    def _read_json(self) -> Dict[str, Any]:
+        """Read the request body as a JSON object.
+
+        Raises:
+            ValueError: If the body is too large or not a JSON object
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise ValueError(f"Request body exceeds {MAX_BODY_BYTES} bytes")
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if not isinstance(payload, dict):
+            raise ValueError("Request body must be a JSON object")
+        return payload
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/health":
+            self._send_json(200, {"status": "ok", **self.service.stats()})
+        elif path == "/metrics":
+            self._send_json(200, metrics.snapshot())
+        elif path == "/usage":
+            self._send_json(200, usage_ledger.snapshot())
+        elif path.startswith("/jobs/"):
+            job = self.service.get(path[len("/jobs/"):])
+            if job is None:
+                self._send_error(404, "Unknown job")
+            else:
+                self._send_json(200, job.to_dict())
+        else:
+            self._send_error(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path not in ("/analyze", "/batch"):
+            self._send_error(404, f"Unknown path {self.path}")
+            return
+        try:
+            payload = self._read_json()
+            blocks = _analyze_blocks(payload) if path == "/analyze" else _batch_blocks(payload)
+            request = self.service.request(payload)
+            job = self.service.submit(blocks, request)
+        except QueueFull as e:
+            self._send_error(429, str(e), {"Retry-After": str(e.retry_after)})
+            return
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+        location = {"Location": f"/jobs/{job.id}"}
+        if path == "/batch":
+            self._send_json(202, {"job_id": job.id, "status": job.status, "rules": len(blocks)}, location)
+            return
+        # "wait": false answers 202 at once; a number caps the wait in seconds
+        wait = payload.get("wait", True)
+        if isinstance(wait, bool) or not isinstance(wait, (int, float)):
+            wait = DEFAULT_WAIT if wait is not False else 0
+        if not job.wait(max(0.0, min(float(wait), DEFAULT_WAIT))):
+            self._send_json(202, {"job_id": job.id, "status": job.status}, location)
+            return
+        record = job.records[0]
+        status = 502 if "error" in record else 200
+        self._send_json(status, {"job_id": job.id, **record})
+
+
+def _analyze_blocks(payload: Dict[str, Any]) -> List[RuleBlock]:
+    rule = payload.get("rule")
+    if not isinstance(rule, str) or not rule.strip():
+        raise ValueError("'rule' must be a non-empty string")
+    return [RuleBlock(rule.strip(), "<request>")]
+
+
+def _batch_blocks(payload: Dict[str, Any]) -> List[RuleBlock]:
+    """Rules of a batch: a `rules` list (one rule per entry) and/or rule file `text`."""
+    rules = payload.get("rules", [])
+    text = payload.get("text", "")
+    if not isinstance(rules, list) or not all(isinstance(rule, str) for rule in rules) \
+            or not isinstance(text, str):
+        raise ValueError("'rules' must be a list of strings and 'text' a string")
+    blocks = [RuleBlock(rule.strip(), "<request>", position + 1)
+              for position, rule in enumerate(rules) if rule.strip()]
+    blocks.extend(split_rules(text, "<text>"))
+    if not blocks:
+        raise ValueError("No rules to analyze")
+    return blocks
+
+
+class _ServiceHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class AnalysisServer:
+    """Serve an AnalysisService over HTTP, on a background thread or the calling one.
+
+    Usable as a context manager; `url` is the base URL to send requests to.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, **service_options: Any):
+        self.service = AnalysisService(**service_options)
+        self._server = _ServiceHTTPServer((host, port), AnalysisHandler)
+        self._server.service = self.service
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "AnalysisServer":
+        self.service.start()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="analysis-service", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted."""
+        self.service.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self.service.stop()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+        self.service.stop()
+
+    def __enter__(self) -> "AnalysisServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any):
+        self.stop()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='HTTP/JSON service analyzing ModSecurity rules')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--provider', default='perplexity', choices=PROVIDERS,
+                        help='Provider for requests that do not name one (default: perplexity)')
+    parser.add_argument('--workers', '-j', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Concurrent analyses (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f'Rules waiting for a worker before submissions get HTTP 429 (default: {DEFAULT_QUEUE_SIZE})')
+    parser.add_argument('--max-jobs', type=int, default=DEFAULT_MAX_JOBS,
+                        help=f'Finished jobs kept for GET /jobs/{{id}} (default: {DEFAULT_MAX_JOBS})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always call the provider instead of reusing cached analyses')
+    parser.add_argument('--fallback', nargs='+', metavar='PROVIDER', default=[], choices=PROVIDERS,
+                        help='Providers to try in order when the main provider fails or times out')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                        help='Give up on a provider call after this many seconds')
+    parser.add_argument('--retries', type=int, default=0,
+                        help='Extra attempts per provider, with jittered backoff (default: 0)')
+    args = parser.parse_args()
+
+    load_dotenv()
+    try:
+        check_api_key(args.provider)
+        routing = RoutingPolicy(args.fallback, timeout=args.timeout, retries=args.retries)
+        server = AnalysisServer(args.host, args.port, provider=args.provider, workers=args.workers,
+                                queue_size=args.queue_size, max_jobs=args.max_jobs,
+                                use_cache=not args.no_cache, routing=routing)
+    except (ValueError, OSError) as e:
+        print(f"Error: {str(e)}")
+        return 1
+    print(f"Analysis service listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
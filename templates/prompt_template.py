@@ -1,56 +1,259 @@
-PROMPT_TEMPLATE = """
-Analyze the following ModSecurity/OWASP CRS rule and provide a detailed analysis including:
+# Description: Prompt templates for rule analysis.
+# The full template asks for every interpretive section; build_prompt_template
+# composes a smaller prompt for a chosen subset of sections and an optional
+# completion token budget. Templates put the static instructions first and
+# the rule last, so consecutive prompts share a long identical prefix that
+# providers with prompt caching can reuse.
 
-Rule: {rule}
+from typing import Iterable, List, Optional, Sequence
 
-Please provide your analysis in the following markdown format:
+PROMPT_HEADER = """
+Analyze the ModSecurity/OWASP CRS rule given at the end of this prompt and provide a detailed analysis
+in the following markdown format:
 
-## Rule Overview
-[150 words or less: Provide a brief overview of what the rule does, include TTPs, OWASP Top 10/API Top 10 CVE, CWE, known exploit detail and what risks it mitigates etc.]
+"""
 
-## Technical Analysis
-Table:
-- Rule ID: [Rule ID]
-- Rule Type: [SecRule, SecAction, etc.]
-- Variables: [List variables being examined]
-- Operators: [List operators used]
-- Actions: [List actions taken]
-- Phase: [Which phase the rule executes in]
+PROMPT_FOOTER = """
+Rule: {rule}
+"""
 
-## Security Impact
+# Sections the LLM is asked for, in output order.
+PROMPT_SECTIONS = {
+    "overview": """## Rule Overview
+[150 words or less: Provide a brief overview of what the rule does, include TTPs, OWASP Top 10/API Top 10 CVE, CWE, known exploit detail and what risks it mitigates etc.]""",
+    "security_impact": """## Security Impact
 Table format:
 - CRS rule ID: [CRS rule ID] or ModSecurity rule ID: [ModSecurity rule ID
 - Attack Type: [What type of attack this rule protects against]
 - Impact: [What impact does this rule have on security]
-- TTPs: [TTPs mitigated by this rule]
-
-## Effectiveness and False Postives
+- TTPs: [TTPs mitigated by this rule]""",
+    "effectiveness": """## Effectiveness and False Postives
 - How effective is this rule at detecting common attacks? (CVEs, OWASP Top 10, CRS version etc.)
 - Are there any common false positives associated with this rule?
-- How could this rule be improved to reduce false positives?
-
-## Comparison of versions
+- How could this rule be improved to reduce false positives?""",
+    "version_comparison": """## Comparison of versions
 - Compare this rule to other similar rules in terms of effectiveness and false positives
 - Compare ModeSecurity Versions: Are there any differences in how this rule is implemented in different versions of ModSecurity?
-- Compare Core Rule Set Versions: Are there any differences in how this rule is implemented in different versions of the Core Rule Set?
-
-## Potential Improvements and Additional Conditions
+- Compare Core Rule Set Versions: Are there any differences in how this rule is implemented in different versions of the Core Rule Set?""",
+    "improvements": """## Potential Improvements and Additional Conditions
 - Are there any potential improvements to this rule?
 - Are there any additional conditions that could be added to improve detection?
-- Regex improvements: Are there any regex improvements that could be made to this rule?
-
-## Suggest improvements
+- Regex improvements: Are there any regex improvements that could be made to this rule?""",
+    "suggestions": """## Suggest improvements
 - provide 1-3 suggestions for improving the rule, including any additional conditions or changes to existing
-- provide a brief explanation of why you think these changes would be beneficial
-
-## Test case
+- provide a brief explanation of why you think these changes would be beneficial""",
+    "test_case": """## Test case
 [Provide 2x tests to show the rule is working as expected; one test should be a false positive and the other should be a true positive.
 The bash curl test should start with 'curl -H "x-format-output: txt-matched-rules" https://sandbox.coreruleset.org/'.]
 
 ```bash
 [Add curl test here]
-```
+```""",
+    "summary": """## Summary
+[300 words or less: Summary of rule and any other relevant information or considerations. Link to OWASP CRS and other OWASP protect documentation where needed]""",
+}
+# Sections produced locally instead of by the LLM (see rules.technical and
+# rules.regex_perf).
+LOCAL_SECTIONS = ("technical_analysis", "regex_performance")
+
+SECTION_TITLES = {
+    "overview": "Rule Overview",
+    "technical_analysis": "Technical Analysis",
+    "regex_performance": "Regex Performance",
+    "security_impact": "Security Impact",
+    "effectiveness": "Effectiveness and False Positives",
+    "version_comparison": "Comparison of versions",
+    "improvements": "Potential Improvements",
+    "suggestions": "Suggest improvements",
+    "test_case": "Test case",
+    "summary": "Summary",
+}
+
+# All selectable sections, in report order.
+ALL_SECTIONS = tuple(SECTION_TITLES)
+
+# Sections only generated when selected explicitly: timing regex backtracking
+# costs CPU on every analysis, cache hits included.
+OPT_IN_SECTIONS = ("regex_performance",)
+
+# Sections generated when no selection is made.
+DEFAULT_SECTIONS = tuple(key for key in ALL_SECTIONS if key not in OPT_IN_SECTIONS)
+
+# Relative size of each LLM section, used to split a token budget.
+SECTION_WEIGHTS = {
+    "overview": 2,
+    "security_impact": 2,
+    "effectiveness": 3,
+    "version_comparison": 3,
+    "improvements": 3,
+    "suggestions": 2,
+    "test_case": 3,
+    "summary": 3,
+}
+
+# Rough words-per-token ratio for English prose
+WORDS_PER_TOKEN = 0.75
+
+
+def _section_keys(sections: Optional[Iterable[str]]) -> List[str]:
+    """Return the selected LLM sections, in report order (empty for local-only selections)."""
+    selected = list(PROMPT_SECTIONS) if sections is None else list(sections)
+    unknown = [key for key in selected if key not in SECTION_TITLES]
+    if unknown:
+        raise ValueError(f"Unknown section(s): {', '.join(unknown)}")
+    if not selected:
+        raise ValueError("Select at least one section")
+    return [key for key in PROMPT_SECTIONS if key in selected]
+
+
+def _section_instructions(keys: List[str], max_tokens: Optional[int]) -> str:
+    parts = []
+    total_weight = sum(SECTION_WEIGHTS[key] for key in keys)
+    for key in keys:
+        part = PROMPT_SECTIONS[key]
+        if max_tokens:
+            words = max(20, int(max_tokens * WORDS_PER_TOKEN * SECTION_WEIGHTS[key] / total_weight))
+            part += f"\n[Keep this section under {words} words.]"
+        parts.append(part)
+    return "\n\n".join(parts) + "\n"
+
+
+def build_prompt_template(sections: Optional[Iterable[str]] = None,
+                          max_tokens: Optional[int] = None) -> Optional[str]:
+    """Compose a prompt template asking only for the selected sections.
+
+    Args:
+        sections: Section keys from ALL_SECTIONS (default: every LLM section).
+            Local sections such as "technical_analysis" are accepted and skipped.
+        max_tokens: Optional completion token budget, split across the selected
+            sections as per-section word limits
+
+    Returns:
+        A template containing a `{rule}` placeholder, or None if only local
+        sections are selected (the analyzer then makes no provider call)
+
+    Raises:
+        ValueError: If a section is unknown or no section is selected
+    """
+    keys = _section_keys(sections)
+    if not keys:
+        return None
+    template = PROMPT_HEADER + _section_instructions(keys, max_tokens)
+    if max_tokens:
+        template += f"\nOnly include the sections above. Keep the whole response under {int(max_tokens * WORDS_PER_TOKEN)} words.\n"
+    return template + PROMPT_FOOTER
+
+
+PROMPT_TEMPLATE = build_prompt_template()
+
+# Completion budget per rule of a multi-rule request when no budget is given
+GROUP_RULE_MAX_TOKENS = 2048
+
+GROUP_PROMPT_HEADER = """
+Analyze each of the ModSecurity/OWASP CRS rules given at the end of this prompt separately.
+Answer with one part per rule, in the order given. Start each part with a line containing only
+"# Rule <number>", using the number shown before the rule, followed by that rule's analysis
+in the following markdown format:
+
+"""
+
+GROUP_PROMPT_FOOTER = """
+Rules:
+{rules}
+"""
+
+
+def build_group_prompt_template(sections: Optional[Iterable[str]] = None,
+                                max_tokens: Optional[int] = None) -> Optional[str]:
+    """Compose a template asking for the selected sections of several rules in one response.
+
+    The instructions are those of build_prompt_template, so each part of the
+    answer can be read like a single-rule analysis.
+
+    Args:
+        sections: Section keys from ALL_SECTIONS (default: every LLM section)
+        max_tokens: Optional completion token budget per rule
+
+    Returns:
+        A template with a `{rules}` placeholder, filled in by format_rule_group,
+        or None if only local sections are selected
+
+    Raises:
+        ValueError: If a section is unknown or no section is selected
+    """
+    keys = _section_keys(sections)
+    if not keys:
+        return None
+    template = GROUP_PROMPT_HEADER + _section_instructions(keys, max_tokens)
+    if max_tokens:
+        template += (f"\nOnly include the sections above. Keep each rule's analysis under "
+                     f"{int(max_tokens * WORDS_PER_TOKEN)} words.\n")
+    return template + GROUP_PROMPT_FOOTER
+
+
+def format_rule_group(template: str, rules: Sequence[str]) -> str:
+    """Fill a group template with numbered rules (numbering starts at 1)."""
+    numbered = "\n".join(f"Rule {number}:\n{rule}\n" for number, rule in enumerate(rules, 1))
+    return template.format(rules=numbered)
+
+
+# Completion budget for a delta analysis, which only covers the differences
+DELTA_MAX_TOKENS = 600
+
+# Longest base analysis quoted in a delta prompt, in characters
+DELTA_BASE_ANALYSIS_CHARS = 4000
+
+# The base rule and its analysis come first, so near-copies of the same base
+# share the prompt prefix
+DELTA_PROMPT_TEMPLATE = """
+Rule {base_id} of the ModSecurity/OWASP CRS has already been analyzed.
+
+Rule {base_id}:
+{base_rule}
+
+Existing analysis of rule {base_id}:
+{base_analysis}
+
+The rule given at the end of this prompt is a near-copy of rule {base_id}. Do not repeat the existing
+analysis. Explain only how the differences change what this rule detects, its false positive risk and
+its paranoia level, in the following markdown format:
+
+## Differences from Rule {base_id}
+[Keep this section under {words} words.]
+
+Differences from rule {base_id}:
+{differences}
+
+Rule: {{rule}}
+"""
+
+
+def build_delta_prompt_template(base_rule: str, base_analysis: str, differences: Iterable[str],
+                                base_id: Optional[str] = None, max_tokens: int = DELTA_MAX_TOKENS) -> str:
+    """Compose a short prompt that explains a rule relative to an analyzed base rule.
+
+    Args:
+        base_rule: Text of the similar rule that was already analyzed
+        base_analysis: Markdown analysis of the base rule (truncated to
+            DELTA_BASE_ANALYSIS_CHARS)
+        differences: Human-readable differences between the two rules
+        base_id: Rule id of the base rule, if it has one
+        max_tokens: Completion token budget for the delta section
+
+    Returns:
+        A template containing a `{rule}` placeholder
+    """
+    if len(base_analysis) > DELTA_BASE_ANALYSIS_CHARS:
+        base_analysis = base_analysis[:DELTA_BASE_ANALYSIS_CHARS] + "\n[...]"
+
+    def escape(text: str) -> str:
+        # Rule and analysis text is literal; only {rule} is filled in later
+        return text.replace("{", "{{").replace("}", "}}")
 
-## Summary
-[300 words or less: Summary of rule and any other relevant information or considerations. Link to OWASP CRS and other OWASP protect documentation where needed]
-"""
\ No newline at end of file
+    return DELTA_PROMPT_TEMPLATE.format(
+        base_id=escape(base_id or "(no id)"),
+        base_rule=escape(base_rule),
+        differences="\n".join(f"- {escape(d)}" for d in differences),
+        base_analysis=escape(base_analysis.strip()),
+        words=int(max_tokens * WORDS_PER_TOKEN),
+    )
@@ -0,0 +1,243 @@
+# Description: Structured view of a markdown analysis.
+# Providers answer in markdown following the prompt template; the section
+# parser splits that text into typed per-section fields incrementally, so it
+# works on streamed output as well as on complete analyses.
+
+import re
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .prompt_template import PROMPT_SECTIONS, SECTION_TITLES
+
+# Section produced by delta analyses of near-duplicate rules
+DIFFERENCES = "differences"
+
+_HEADING = re.compile(r"^\s{0,3}(#{1,3})\s+(.+?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s{0,3}(```|~~~)")
+_FIELD = re.compile(r"^\s*[-*]\s+\**([^:*]+?)\**\s*:\s*(.+?)\s*$")
+_CURL = re.compile(r"^\s*(curl\s.+)$", re.MULTILINE)
+# Marker starting each rule's part of a multi-rule answer (see build_group_prompt_template)
+_GROUP_MARKER = re.compile(r"^\s{0,3}#\s+\**Rule\s+(\d+)\b")
+
+# Headings LLMs commonly use instead of the requested ones
+COMMON_HEADINGS = {
+    "improvement suggestions": "suggestions",
+    "suggested improvements": "suggestions",
+    "test cases": "test_case",
+    "false positives": "effectiveness",
+}
+
+
+def _normalize(title: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9 ]+", " ", title.lower()).split())
+
+
+def _section_aliases() -> List[Tuple[str, str]]:
+    """Return (normalized heading, section key) pairs, longest heading first."""
+    aliases = dict(COMMON_HEADINGS)
+    aliases.update({_normalize(title): key for key, title in SECTION_TITLES.items()})
+    for key, prompt in PROMPT_SECTIONS.items():
+        # The headings the LLM is asked for, including their historic spellings
+        aliases[_normalize(prompt.splitlines()[0].lstrip("#"))] = key
+    aliases["differences from rule"] = DIFFERENCES
+    aliases["differences from"] = DIFFERENCES
+    return sorted(aliases.items(), key=lambda item: -len(item[0]))
+
+
+_ALIASES = _section_aliases()
+
+
+def section_key(heading: str) -> Optional[str]:
+    """Map a markdown heading to its section key, or None if it is not a known section.
+
+    Headings match when they start with a known title, so "Rule Overview:
+    942100" and "Summary of the rule" are recognized too.
+    """
+    normalized = _normalize(heading)
+    for alias, key in _ALIASES:
+        if normalized == alias or normalized.startswith(alias + " "):
+            return key
+    return None
+
+
+@dataclass
+class AnalysisReport:
+    """An analysis split into its report sections.
+
+    Section fields hold the markdown body of each section (without its
+    heading), or None when the analysis does not contain it. Sections with
+    unrecognized headings are kept in `extra`, keyed by heading.
+    """
+
+    rule_id: Optional[str] = None
+    overview: Optional[str] = None
+    technical_analysis: Optional[str] = None
+    regex_performance: Optional[str] = None
+    security_impact: Optional[str] = None
+    effectiveness: Optional[str] = None
+    version_comparison: Optional[str] = None
+    improvements: Optional[str] = None
+    suggestions: Optional[str] = None
+    test_case: Optional[str] = None
+    summary: Optional[str] = None
+    differences: Optional[str] = None
+    preamble: Optional[str] = None
+    extra: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def impact(self) -> Dict[str, str]:
+        """The "- Key: value" items of the Security Impact section (e.g. "Attack Type")."""
+        items = {}
+        for line in (self.security_impact or "").splitlines():
+            match = _FIELD.match(line)
+            if match:
+                items[match.group(1).strip()] = match.group(2)
+        return items
+
+    @property
+    def test_commands(self) -> List[str]:
+        """The curl commands of the Test case section."""
+        return _CURL.findall(self.test_case or "")
+
+    def add_section(self, heading: Optional[str], body: str):
+        """Store a section body under the field its heading maps to.
+
+        Repeated sections (e.g. the base analysis appended to a delta
+        analysis) keep their first occurrence.
+        """
+        body = body.strip()
+        if heading is None:
+            if body:
+                self.preamble = body
+            return
+        key = section_key(heading)
+        if key is None:
+            self.extra.setdefault(heading, body)
+        elif getattr(self, key) is None:
+            setattr(self, key, body)
+
+    def sections(self) -> Dict[str, str]:
+        """Return the present report sections keyed by section key, in report order."""
+        return {f.name: getattr(self, f.name) for f in fields(self)
+                if f.name in SECTION_TITLES or f.name == DIFFERENCES
+                if getattr(self, f.name) is not None}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a JSON-serializable dict, including the derived impact and test fields."""
+        data = {key: value for key, value in asdict(self).items() if value not in (None, {})}
+        if self.impact:
+            data["impact"] = self.impact
+        if self.test_commands:
+            data["test_commands"] = self.test_commands
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AnalysisReport":
+        """Build a report from to_dict output or a provider's JSON answer; unknown keys are ignored."""
+        names = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in names})
+
+
+class SectionParser:
+    """Incremental markdown section parser.
+
+    Feed it text chunks as they arrive; every section is emitted as soon as
+    the next heading starts, and close() emits the last one. Headings inside
+    fenced code blocks (such as shell comments in test cases) are ignored.
+    """
+
+    def __init__(self, rule_id: Optional[str] = None):
+        self.report = AnalysisReport(rule_id=rule_id)
+        self._partial = ""
+        self._heading: Optional[str] = None
+        self._lines: List[str] = []
+        self._in_fence = False
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], str]]:
+        """Consume a chunk of markdown.
+
+        Returns:
+            The (heading, body) pairs of the sections completed by this chunk
+        """
+        text = self._partial + chunk
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        completed = []
+        for line in lines:
+            section = self._line(line)
+            if section is not None:
+                completed.append(section)
+        return completed
+
+    def _line(self, line: str) -> Optional[Tuple[Optional[str], str]]:
+        if _FENCE.match(line):
+            self._in_fence = not self._in_fence
+        elif not self._in_fence:
+            match = _HEADING.match(line)
+            if match:
+                completed = self._flush()
+                self._heading = match.group(2).strip("*_ ")
+                return completed
+        self._lines.append(line)
+        return None
+
+    def _flush(self) -> Optional[Tuple[Optional[str], str]]:
+        body = "\n".join(self._lines)
+        self._lines = []
+        if self._heading is None and not body.strip():
+            return None
+        self.report.add_section(self._heading, body)
+        return self._heading, body.strip()
+
+    def close(self) -> AnalysisReport:
+        """Flush the last section and return the completed report."""
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ""
+        self._flush()
+        return self.report
+
+
+def parse_report(markdown: str, rule_id: Optional[str] = None) -> AnalysisReport:
+    """Split a complete markdown analysis into an AnalysisReport."""
+    parser = SectionParser(rule_id)
+    parser.feed(markdown)
+    return parser.close()
+
+
+def parse_stream(chunks: Iterable[str], rule_id: Optional[str] = None) -> AnalysisReport:
+    """Build an AnalysisReport from a stream of markdown chunks."""
+    parser = SectionParser(rule_id)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def split_group_response(markdown: str, count: int) -> Dict[int, str]:
+    """Split a multi-rule answer into the analyses of its rules.
+
+    Each part starts with a "# Rule <number>" line; markers inside fenced
+    code blocks, numbers outside 1..count and repeated numbers are ignored.
+
+    Returns:
+        The analysis of each rule found in the answer, keyed by its 0-based position
+    """
+    parts: Dict[int, List[str]] = {}
+    current: Optional[List[str]] = None
+    in_fence = False
+    for line in markdown.split("\n"):
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = _GROUP_MARKER.match(line)
+            if match:
+                index = int(match.group(1)) - 1
+                if 0 <= index < count and index not in parts:
+                    current = parts[index] = []
+                else:
+                    current = None
+                continue
+        if current is not None:
+            current.append(line)
+    analyses = {index: "\n".join(lines).strip() for index, lines in parts.items()}
+    return {index: analysis for index, analysis in analyses.items() if analysis}
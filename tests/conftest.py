@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def disable_analysis_cache(monkeypatch):
+    """Keep tests (and CLI subprocesses) away from the user's analysis cache."""
+    monkeypatch.setenv("analysis_cache_path", "off")
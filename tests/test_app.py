@@ -1,7 +1,16 @@
 import pytest
-from unittest.mock import patch, Mock
+from unittest.mock import patch, AsyncMock, Mock
+import asyncio
 import os
-from app import check_api_key, analyze_modsec_rule
+import threading
+import time
+from analyzer import (check_api_key, analysis_record, analyze_modsec_rule, analyze_modsec_rule_async,
+                      analyze_rule_group, analyze_with_index, stream_modsec_rule)
+from engine.resilience import reset_circuit_breakers
+from engine.usage import BudgetExceeded
+from llms.router import RoutingPolicy
+from rules.splitter import RuleBlock
+from rules.similarity import SimilarityIndex
 
 # Test cases for the check_api_key function
 def test_check_api_key_present(monkeypatch):
@@ -27,8 +36,8 @@ def test_check_api_key_unknown_provider():
         check_api_key("unknown_provider")
 
 # Test cases for the analyze_modsec_rule function
-@patch('app.check_api_key')
-@patch('app.get_llm_client')
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
 def test_analyze_modsec_rule_success(mock_get_llm_client, mock_check_api_key):
     """
     Test a successful analysis of a ModSecurity rule.
@@ -55,7 +64,7 @@ def test_analyze_modsec_rule_success(mock_get_llm_client, mock_check_api_key):
 
     assert result == {"markdown_content": "Detailed analysis"}
 
-@patch('app.check_api_key', side_effect=ValueError("API Key Not Found"))
+@patch('analyzer.check_api_key', side_effect=ValueError("API Key Not Found"))
 def test_analyze_modsec_rule_api_key_error(mock_check_api_key):
     """
     Test that analyze_modsec_rule raises an exception if the API key is missing.
@@ -70,8 +79,8 @@ def test_analyze_modsec_rule_api_key_error(mock_check_api_key):
     
     mock_check_api_key.assert_called_once_with("perplexity")
 
-@patch('app.check_api_key')
-@patch('app.get_llm_client')
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
 def test_analyze_modsec_rule_llm_failure(mock_get_llm_client, mock_check_api_key):
     """
     Test how analyze_modsec_rule handles an exception from the LLM client.
@@ -88,4 +97,326 @@ def test_analyze_modsec_rule_llm_failure(mock_get_llm_client, mock_check_api_key
 
     # Act & Assert
     with pytest.raises(RuntimeError, match="LLM API Error"):
-        analyze_modsec_rule(rule, prompt_template)
\ No newline at end of file
+        analyze_modsec_rule(rule, prompt_template)
+
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
+def test_analyze_modsec_rule_uses_cache(mock_get_llm_client, mock_check_api_key, tmp_path, monkeypatch):
+    """
+    Test that a repeated analysis is served from the persistent cache.
+    """
+    # Arrange
+    monkeypatch.setenv("analysis_cache_path", str(tmp_path / "cache.sqlite3"))
+    mock_check_api_key.return_value = "fake_api_key"
+    mock_llm_client = Mock(model="test-model")
+    mock_llm_client.analyze.return_value = {"markdown_content": "Detailed analysis"}
+    mock_get_llm_client.return_value = mock_llm_client
+
+    # Act
+    first = analyze_modsec_rule("SecRule ARGS \"@rx x\"", "Analyze: {rule}", provider="openai")
+    second = analyze_modsec_rule("SecRule  ARGS  \"@rx x\"", "Analyze: {rule}", provider="openai")
+
+    # Assert
+    assert first == second == {"markdown_content": "Detailed analysis"}
+    mock_llm_client.analyze.assert_called_once()
+
+
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
+def test_stream_modsec_rule_yields_chunks_and_caches(mock_get_llm_client, mock_check_api_key, tmp_path, monkeypatch):
+    """
+    Test that streamed chunks are passed through and the joined result is cached.
+    """
+    # Arrange
+    monkeypatch.setenv("analysis_cache_path", str(tmp_path / "cache.sqlite3"))
+    mock_check_api_key.return_value = "fake_api_key"
+    mock_llm_client = Mock(model="test-model")
+
+    def stream(prompt):
+        yield "## Rule Overview\n"
+        yield "Detects scanners"
+        return {"model": "test-model", "usage": {"prompt_tokens": 5}, "citations": ["https://coreruleset.org"]}
+
+    mock_llm_client.stream.side_effect = stream
+    mock_get_llm_client.return_value = mock_llm_client
+    rule = "SecRule ARGS \"@rx x\""
+
+    # Act
+    chunks = list(stream_modsec_rule(rule, "Analyze: {rule}", provider="openai"))
+    cached = analyze_modsec_rule(rule, "Analyze: {rule}", provider="openai")
+
+    # Assert
+    assert chunks == ["## Rule Overview\n", "Detects scanners"]
+    assert cached == {"markdown_content": "## Rule Overview\nDetects scanners", "model": "test-model",
+                      "usage": {"prompt_tokens": 5}, "citations": ["https://coreruleset.org"]}
+    mock_llm_client.analyze.assert_not_called()
+
+
+def test_check_api_key_not_required_for_ollama():
+    """
+    Test that local providers do not need an API key.
+    """
+    assert check_api_key("ollama") == ""
+
+
+
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
+def test_analyze_modsec_rule_prepends_technical_analysis(mock_get_llm_client, mock_check_api_key):
+    """
+    Test that the locally built Technical Analysis section is added on request.
+    """
+    # Arrange
+    mock_check_api_key.return_value = "fake_api_key"
+    mock_llm_client = Mock()
+    mock_llm_client.analyze.return_value = {"markdown_content": "## Rule Overview\nDetects scanners"}
+    mock_get_llm_client.return_value = mock_llm_client
+    rule = 'SecRule REQUEST_HEADERS:User-Agent "@rx nikto" "id:949110,phase:1,deny"'
+
+    # Act
+    result = analyze_modsec_rule(rule, "Analyze: {rule}", include_technical_analysis=True)
+
+    # Assert
+    content = result["markdown_content"]
+    assert content.startswith("## Technical Analysis")
+    assert "| Rule ID | 949110 |" in content
+    assert content.endswith("## Rule Overview\nDetects scanners")
+
+
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
+def test_stream_modsec_rule_releases_followers_when_cache_write_fails(mock_get_llm_client, mock_check_api_key,
+                                                                      tmp_path, monkeypatch):
+    """
+    Test that a failing cache write neither fails the stream nor strands a waiting follower.
+    """
+    # Arrange
+    monkeypatch.setenv("analysis_cache_path", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr("engine.cache.AnalysisCache.set", Mock(side_effect=OSError("disk full")))
+    mock_check_api_key.return_value = "fake_api_key"
+    mock_llm_client = Mock(model="test-model")
+    mock_llm_client.stream.return_value = iter(["## Rule Overview\n", "Detects scanners"])
+    mock_get_llm_client.return_value = mock_llm_client
+    rule = "SecRule ARGS \"@rx x\""
+    followed = []
+
+    # Act
+    leader = stream_modsec_rule(rule, "Analyze: {rule}", provider="openai")
+    chunks = [next(leader)]
+    follower = threading.Thread(target=lambda: followed.extend(
+        stream_modsec_rule(rule, "Analyze: {rule}", provider="openai")))
+    follower.start()
+    time.sleep(0.1)
+    chunks.extend(leader)
+    follower.join(timeout=2)
+
+    # Assert
+    assert not follower.is_alive()
+    assert "".join(chunks) == "".join(followed) == "## Rule Overview\nDetects scanners"
+    mock_llm_client.stream.assert_called_once()
+
+
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
+def test_concurrent_identical_analyses_share_one_provider_call(mock_get_llm_client, mock_check_api_key):
+    """
+    Test that identical analyses running at the same time call the provider once.
+    """
+    # Arrange
+    mock_check_api_key.return_value = "fake_api_key"
+    mock_llm_client = Mock(model="test-model")
+
+    def slow_analyze(prompt):
+        time.sleep(0.1)
+        return {"markdown_content": "Detailed analysis"}
+
+    mock_llm_client.analyze.side_effect = slow_analyze
+    mock_get_llm_client.return_value = mock_llm_client
+    results = []
+
+    # Act
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            analyze_modsec_rule("SecRule ARGS \"@rx x\"", "Analyze: {rule}", provider="openai")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Assert
+    assert results == [{"markdown_content": "Detailed analysis"}] * 4
+    mock_llm_client.analyze.assert_called_once()
+
+
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
+def test_analyze_modsec_rule_fails_over_to_fallback_provider(mock_get_llm_client, mock_check_api_key):
+    """
+    Test that a routing policy sends the analysis to the fallback when the primary fails.
+    """
+    # Arrange
+    reset_circuit_breakers()
+    mock_check_api_key.return_value = "fake_api_key"
+    primary = Mock(model="primary-model")
+    primary.analyze.side_effect = Exception("503 Service Unavailable")
+    fallback = Mock(model="local-model")
+    fallback.analyze.return_value = {"markdown_content": "Local analysis"}
+    mock_get_llm_client.side_effect = lambda api_key, provider: primary if provider == "perplexity" else fallback
+
+    # Act
+    result = analyze_modsec_rule("SecRule ARGS \"@rx x\"", "Analyze: {rule}",
+                                 routing=RoutingPolicy(fallback=["ollama"]))
+    reset_circuit_breakers()
+
+    # Assert
+    assert result == {"markdown_content": "Local analysis", "provider": "ollama"}
+    primary.analyze.assert_called_once()
+
+
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
+def test_analyze_modsec_rule_async_awaits_provider(mock_get_llm_client, mock_check_api_key):
+    """
+    Test that the async analysis awaits the provider's async API once per distinct rule.
+    """
+    # Arrange
+    mock_check_api_key.return_value = "fake_api_key"
+    mock_llm_client = Mock(model="test-model")
+
+    async def slow_analyze(prompt):
+        await asyncio.sleep(0.05)
+        return {"markdown_content": "Async analysis"}
+
+    mock_llm_client.analyze_async = AsyncMock(side_effect=slow_analyze)
+    mock_get_llm_client.return_value = mock_llm_client
+
+    async def run():
+        return await asyncio.gather(*(
+            analyze_modsec_rule_async("SecRule ARGS \"@rx x\"", "Analyze: {rule}", provider="openai")
+            for _ in range(3)
+        ))
+
+    # Act
+    results = asyncio.run(run())
+
+    # Assert
+    assert results == [{"markdown_content": "Async analysis"}] * 3
+    mock_llm_client.analyze_async.assert_awaited_once_with("Analyze: SecRule ARGS \"@rx x\"")
+    mock_llm_client.analyze.assert_not_called()
+
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
+def test_analyze_with_index_sends_delta_prompt_for_near_duplicates(mock_get_llm_client, mock_check_api_key):
+    """
+    Test that a near-duplicate rule is explained relative to the analyzed base rule.
+    """
+    # Arrange
+    mock_check_api_key.return_value = "test_key"
+    mock_llm_client = Mock()
+    mock_llm_client.analyze.side_effect = [
+        {"markdown_content": "## Rule Overview\nFull analysis"},
+        {"markdown_content": "## Differences from Rule 1\nAlso inspects cookies"},
+    ]
+    mock_get_llm_client.return_value = mock_llm_client
+    index = SimilarityIndex()
+    base = 'SecRule ARGS "@rx evil" "id:1,phase:2,block,t:lowercase"'
+    copy = 'SecRule REQUEST_COOKIES "@rx evil" "id:2,phase:2,block,t:lowercase"'
+
+    # Act
+    first = analyze_with_index(base, "Analyze: {rule}", index, provider="perplexity", use_cache=False)
+    second = analyze_with_index(copy, "Analyze: {rule}", index, provider="perplexity", use_cache=False)
+
+    # Assert
+    assert first == {"markdown_content": "## Rule Overview\nFull analysis"}
+    delta_prompt = mock_llm_client.analyze.call_args.args[0]
+    assert "near-copy of rule 1" in delta_prompt and "variables added: REQUEST_COOKIES" in delta_prompt
+    assert "Full analysis" in delta_prompt and copy in delta_prompt
+    assert mock_llm_client.analyze.call_args.kwargs["max_tokens"] == 600
+    assert second["markdown_content"].startswith("## Differences from Rule 1\nAlso inspects cookies")
+    assert second["markdown_content"].endswith("## Rule Overview\nFull analysis")
+    assert (second["similar_to"], second["similarity"]) == ("1", 1.0)
+
+
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
+def test_analyze_rule_group_splits_one_answer_across_rules(mock_get_llm_client, mock_check_api_key, tmp_path,
+                                                           monkeypatch):
+    """
+    Test that related rules share one request and a rule missing from the answer is analyzed alone.
+    """
+    # Arrange
+    monkeypatch.setenv("analysis_cache_path", str(tmp_path / "cache.sqlite3"))
+    mock_check_api_key.return_value = "test_key"
+    mock_llm_client = Mock(model="test-model")
+    mock_llm_client.analyze.side_effect = [
+        {"markdown_content": "# Rule 1\n## Rule Overview\nFirst\n\n# Rule 2\n## Rule Overview\nSecond",
+         "model": "test-model", "usage": {"prompt_tokens": 300}, "citations": ["https://coreruleset.org"]},
+        {"markdown_content": "## Rule Overview\nThird, alone"},
+    ]
+    mock_get_llm_client.return_value = mock_llm_client
+    rules = [f'SecRule ARGS "@rx {word}" "id:{n}"' for n, word in enumerate(("union", "select", "sleep"), 1)]
+
+    # Act
+    results = analyze_rule_group(rules, "Analyze: {rule}", "Analyze each:\n{rules}", provider="perplexity")
+    again = analyze_rule_group(rules, "Analyze: {rule}", "Analyze each:\n{rules}", provider="perplexity")
+
+    # Assert
+    group_prompt = mock_llm_client.analyze.call_args_list[0].args[0]
+    assert group_prompt.index("Rule 1:\n" + rules[0]) < group_prompt.index("Rule 3:\n" + rules[2])
+    assert mock_llm_client.analyze.call_args_list[0].kwargs["max_tokens"] == 3 * 2048
+    assert [r["markdown_content"] for r in results] == [
+        "## Rule Overview\nFirst", "## Rule Overview\nSecond", "## Rule Overview\nThird, alone"]
+    assert results[0]["group_size"] == 3 and "group_size" not in results[2]
+    assert results[1]["usage"] == {"prompt_tokens": 300} and results[1]["citations"] == ["https://coreruleset.org"]
+    # Every rule was cached under the single-rule template
+    assert again == results and mock_llm_client.analyze.call_count == 2
+
+
+@patch('analyzer.check_api_key')
+@patch('analyzer.get_llm_client')
+def test_analyze_rule_group_falls_back_to_single_rules_when_request_fails(mock_get_llm_client,
+                                                                         mock_check_api_key):
+    """
+    Test that a failed group request is retried rule by rule, but an exhausted budget is not.
+    """
+    # Arrange
+    mock_check_api_key.return_value = "test_key"
+    mock_llm_client = Mock(model="test-model")
+    mock_llm_client.analyze.side_effect = [
+        TimeoutError("no answer"),
+        {"markdown_content": "## Rule Overview\nFirst, alone"},
+        {"markdown_content": "## Rule Overview\nSecond, alone"},
+    ]
+    mock_get_llm_client.return_value = mock_llm_client
+    rules = ['SecRule ARGS "@rx union" "id:1"', 'SecRule ARGS "@rx select" "id:2"']
+
+    # Act
+    results = analyze_rule_group(rules, "Analyze: {rule}", "Analyze each:\n{rules}", provider="perplexity")
+
+    # Assert
+    assert [r["markdown_content"] for r in results] == [
+        "## Rule Overview\nFirst, alone", "## Rule Overview\nSecond, alone"]
+    assert mock_llm_client.analyze.call_count == 3
+    mock_llm_client.analyze.side_effect = BudgetExceeded("Token budget exhausted")
+    with pytest.raises(BudgetExceeded):
+        analyze_rule_group(rules, "Analyze: {rule}", "Analyze each:\n{rules}", provider="perplexity")
+    assert mock_llm_client.analyze.call_count == 4
+
+
+def test_analysis_record_checks_test_cases_against_data_files_next_to_the_rule(tmp_path):
+    """
+    Test that structured records resolve @pmFromFile data files against the rule's directory.
+    """
+    (tmp_path / "scanners.data").write_text("nikto\n")
+    rule = 'SecRule REQUEST_HEADERS:User-Agent "@pmFromFile scanners.data" "id:1,t:lowercase"'
+    block = RuleBlock(rule, str(tmp_path / "rules.conf"), 3)
+    analysis = {"markdown_content": "## Test case\n```bash\n# True positive\ncurl -A 'Nikto' http://localhost/\n```",
+                "model": "sonar", "usage": {"prompt_tokens": 10}}
+
+    record = analysis_record(block, analysis, structured=True)
+
+    assert (record["source"], record["line"], record["rule_id"]) == (str(tmp_path / "rules.conf"), 3, "1")
+    assert record["model"] == "sonar" and record["usage"] == {"prompt_tokens": 10}
+    assert [check["passed"] for check in record["report"]["test_results"]] == [True]
@@ -0,0 +1,70 @@
+import os
+import pytest
+from bench.benchmark import find_regressions, measure_import_time, run_benchmark, synthetic_rules
+from bench.mock_server import MockLLMServer
+from llms.factory import LLMFactory
+from llms.ollama import OllamaProvider
+from llms.perplexity import PerplexityProvider
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    with MockLLMServer(latency=0.01, jitter=0.01, seed=1) as server:
+        monkeypatch.setenv("perplexity_base_url", server.url)
+        monkeypatch.setenv("OLLAMA_HOST", server.url)
+        yield server
+
+
+def test_mock_server_speaks_perplexity_api(mock_server):
+    provider = PerplexityProvider("mock-key")
+    assert provider.analyze("prompt")["markdown_content"].startswith("## Rule Overview")
+    assert "".join(provider.stream("prompt")).startswith("## Rule Overview")
+
+
+def test_mock_server_speaks_ollama_api(mock_server):
+    provider = OllamaProvider()
+    assert provider.analyze("prompt")["markdown_content"].startswith("## Rule Overview")
+    assert "".join(provider.stream("prompt", max_tokens=100)).startswith("## Rule Overview")
+
+
+def test_mock_server_error_rate(mock_server):
+    mock_server.settings.error_rate = 1.0
+    with pytest.raises(RuntimeError, match="503"):
+        PerplexityProvider("mock-key").analyze("prompt")
+
+
+def test_run_benchmark_reports_every_mode(mock_server, monkeypatch):
+    for name in ("perplexity_api_key", "perplexity_requests_per_minute"):
+        monkeypatch.setenv(name, "0")
+    try:
+        results = run_benchmark(synthetic_rules(6), concurrency=2, async_concurrency=3, url=mock_server.url)
+    finally:
+        LLMFactory.clear_clients()
+
+    assert [r.mode for r in results] == ["single", "batch", "concurrent"]
+    assert all(r.rules == 6 and r.errors == 0 and r.rules_per_sec > 0 for r in results)
+    assert all(0 < r.p50_ms <= r.p95_ms <= r.p99_ms for r in results)
+    assert mock_server.settings.requests == 18
+
+    baseline = [{"mode": "batch", "rules_per_sec": results[1].rules_per_sec * 10, "p95_ms": 0}]
+    assert find_regressions(results, baseline, 0.2) == [
+        f"batch: rules/sec {baseline[0]['rules_per_sec']} -> {results[1].rules_per_sec}"]
+
+
+def test_run_benchmark_restores_environment(monkeypatch):
+    for name in ("perplexity_base_url", "OLLAMA_HOST", "perplexity_api_key"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("perplexity_requests_per_minute", "50")
+    results = run_benchmark(synthetic_rules(2), modes=("single",), latency=0, jitter=0)
+
+    assert results[0].errors == 0
+    assert "perplexity_base_url" not in os.environ and "OLLAMA_HOST" not in os.environ
+    assert "perplexity_api_key" not in os.environ
+    assert os.environ["perplexity_requests_per_minute"] == "50"
+    assert not LLMFactory._clients
+
+
+def test_cli_import_skips_heavy_dependencies():
+    result = measure_import_time("cli", repeat=1)
+    assert result.module == "cli" and result.median_ms > 0
+    assert result.heavy_modules == []
@@ -1,6 +1,8 @@
+import json
 import subprocess
 import sys
 import os
+import sqlite3
 import pytest
 
 CLI_PATH = os.path.join(os.path.dirname(__file__), '..', 'cli.py')
@@ -29,4 +31,213 @@ def test_cli_missing_api_key():
     cmd = [sys.executable, CLI_PATH, '--provider', 'openai', rule]
     result = subprocess.run(cmd, capture_output=True, text=True, env=env)
     assert result.returncode == 1
-    assert "openai_api_key environment variable is not found" in result.stdout or "openai_api_key environment variable not found" in result.stdout
\ No newline at end of file
+    assert "openai_api_key environment variable is not found" in result.stdout or "openai_api_key environment variable not found" in result.stdout
+
+def test_cli_batch_streams_jsonl(tmp_path):
+    rules_dir = tmp_path / "rules"
+    rules_dir.mkdir()
+    (rules_dir / "REQUEST-901-TEST.conf").write_text(
+        '# comment\n'
+        'SecRule ARGS "@rx foo" \\\n'
+        '    "id:1001,phase:2,deny,chain"\n'
+        '    SecRule REQUEST_URI "@contains bar" "t:none"\n'
+        'SecAction "id:1002,phase:1,pass,nolog"\n'
+    )
+    (rules_dir / "notes.txt").write_text('SecRule ARGS "@rx skipped" "id:9"\n')
+    output = tmp_path / "out.jsonl"
+    env = os.environ.copy()
+    env["openai_api_key"] = "dummy_key"
+    metrics_path = tmp_path / "metrics.json"
+    cmd = [sys.executable, CLI_PATH, '--provider', 'openai', '--batch', str(rules_dir), '-o', str(output),
+           '--metrics', str(metrics_path)]
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    assert json.loads(metrics_path.read_text())["provider_call"]["count"] == 2
+    records = sorted((json.loads(line) for line in output.read_text().splitlines()), key=lambda r: r["line"])
+    assert [r["rule_id"] for r in records] == ["1001", "1002"]
+    assert "SecRule REQUEST_URI" in records[0]["rule"]
+    assert records[0]["line"] == 2
+    assert records[1]["analysis"].startswith("## Technical Analysis")
+    assert "[OpenAI] Analysis for:" in records[1]["analysis"]
+
+
+def test_cli_batch_run_can_be_resumed(tmp_path):
+    rules = tmp_path / "rules.conf"
+    rules.write_text('SecRule ARGS "@rx foo" "id:1001"\nSecRule ARGS "@rx bar" "id:1002"\n')
+    store_path = tmp_path / "jobs.sqlite3"
+    output = tmp_path / "out.jsonl"
+    metrics_path = tmp_path / "metrics.json"
+    env = os.environ.copy()
+    env["openai_api_key"] = "dummy_key"
+    base = [sys.executable, CLI_PATH, '--job-store', str(store_path), '-o', str(output), '--metrics', str(metrics_path)]
+    result = subprocess.run(base + ['--provider', 'openai', '--sections', 'overview', '--batch', str(rules),
+                                    '--run-id', 'crs'], capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    assert "Run crs: 2 done, 0 failed" in result.stderr
+    assert subprocess.run(base + ['--batch', str(rules), '--run-id', 'crs'],
+                          capture_output=True, text=True, env=env).returncode == 1
+
+    # Simulate a crash during the second rule
+    with sqlite3.connect(str(store_path)) as conn:
+        conn.execute("UPDATE rules SET state = 'running', record = NULL WHERE position = 1")
+    result = subprocess.run(base + ['--resume', 'crs'], capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    assert json.loads(metrics_path.read_text())["provider_call"]["count"] == 1
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [r["rule_id"] for r in records] == ["1001", "1002"]
+    assert all("[OpenAI] Analysis for:" in r["analysis"] for r in records)
+    assert "Technical Analysis" not in records[1]["analysis"]
+    assert subprocess.run(base + ['--resume', 'missing'], capture_output=True, text=True, env=env).returncode == 1
+
+
+def test_cli_rejects_sections_with_custom_template():
+    env = os.environ.copy()
+    env["openai_api_key"] = "dummy_key"
+    cmd = [sys.executable, CLI_PATH, '--provider', 'openai', '--sections', 'overview',
+           '--prompt-template', 'Explain: {rule}', 'SecRule ARGS "@rx x"']
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    assert result.returncode == 1
+    assert "--sections cannot be combined with --prompt-template" in result.stdout
+
+
+def test_cli_local_sections_need_no_provider(tmp_path):
+    rules = tmp_path / "rules.conf"
+    rules.write_text('SecRule ARGS "@rx foo" "id:1001,phase:2,t:lowercase"\n')
+    env = os.environ.copy()
+    env.pop("perplexity_api_key", None)
+    cmd = [sys.executable, CLI_PATH, '--sections', 'technical_analysis', '--batch', str(rules)]
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stdout + result.stderr
+    record = json.loads(result.stdout)
+    assert record["analysis"].startswith("## Technical Analysis") and "Rule Overview" not in record["analysis"]
+
+
+def test_cli_batch_dedup_marks_near_duplicates(tmp_path):
+    rules_file = tmp_path / "rules.conf"
+    rules_file.write_text('SecRule ARGS "@rx evil" "id:1,phase:2,block,t:lowercase"\n'
+                          'SecRule REQUEST_COOKIES "@rx evil" "id:2,phase:2,block,t:lowercase"\n')
+    output = tmp_path / "out.jsonl"
+    env = os.environ.copy()
+    env["openai_api_key"] = "dummy_key"
+    cmd = [sys.executable, CLI_PATH, '--provider', 'openai', '--batch', str(rules_file), '-o', str(output),
+           '--dedup', '--concurrency', '1']
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    records = {r["rule_id"]: r for r in map(json.loads, output.read_text().splitlines())}
+    assert "similar_to" not in records["1"]
+    assert (records["2"]["similar_to"], records["2"]["similarity"]) == ("1", 1.0)
+    assert "the analysis of rule 1 applies" in records["2"]["analysis"]
+
+def test_cli_structured_output(tmp_path):
+    rules_file = tmp_path / "rules.conf"
+    rules_file.write_text('SecRule ARGS "@rx evil" "id:1,phase:2,block"\n')
+    output = tmp_path / "out.jsonl"
+    env = os.environ.copy()
+    env["openai_api_key"] = "dummy_key"
+    cmd = [sys.executable, CLI_PATH, '--provider', 'openai', '--sections', 'technical_analysis,overview',
+           '--structured', '--batch', str(rules_file), '-o', str(output)]
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    record = json.loads(output.read_text())
+    assert record["report"]["rule_id"] == "1"
+    assert "| Rule ID | 1 |" in record["report"]["technical_analysis"]
+
+    cmd = [sys.executable, CLI_PATH, '--provider', 'openai', '--sections', 'technical_analysis,overview',
+           '--structured', 'SecRule ARGS "@rx evil" "id:1,phase:2,block"']
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    assert json.loads(result.stdout)["technical_analysis"] == record["report"]["technical_analysis"]
+
+def test_cli_regex_check_needs_no_provider(tmp_path):
+    rules_file = tmp_path / "rules.conf"
+    rules_file.write_text('SecRule ARGS "@rx ^(\\w+\\s?)*$" "id:1,phase:2,block"\n'
+                          'SecRule ARGS "@rx (?i)select\\s+from" "id:2,phase:2,block"\n')
+    env = os.environ.copy()
+    env.pop("perplexity_api_key", None)
+    cmd = [sys.executable, CLI_PATH, '--regex-check', str(rules_file)]
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    assert result.returncode == 1
+    records = {r["rule_id"]: r for r in map(json.loads, result.stdout.splitlines())}
+    assert records["1"]["verdict"] == "exponential" and records["1"]["pattern"] == "^(\\w+\\s?)*$"
+    assert records["2"]["verdict"] == "linear"
+    assert "2 pattern(s), 1 with super-linear backtracking" in result.stderr
+
+
+def test_cli_diff_only_analyzes_changed_rules(tmp_path):
+    old = tmp_path / "old.conf"
+    new = tmp_path / "new.conf"
+    old.write_text('SecRule ARGS "@rx foo" "id:1,phase:2,ver:\'OWASP_CRS/3.3.2\'"\n'
+                   'SecRule ARGS "@rx bar" "id:2,phase:2"\n'
+                   'SecRule ARGS "@rx qux" "id:3,phase:2"\n')
+    new.write_text('SecRule ARGS "@rx foo" "id:1,phase:2,ver:\'OWASP_CRS/4.0.0\'"\n'
+                   'SecRule ARGS "@rx baz" "id:2,phase:2"\n'
+                   'SecRule ARGS "@rx qux" "id:3,phase:2"\n')
+    previous = tmp_path / "previous.jsonl"
+    previous.write_text(json.dumps({"rule_id": "1", "analysis": "prior analysis", "model": "sonar",
+                                    "usage": {"prompt_tokens": 12}}) + "\n")
+    output = tmp_path / "diff.jsonl"
+    env = os.environ.copy()
+    env["openai_api_key"] = "dummy_key"
+    cmd = [sys.executable, CLI_PATH, '--provider', 'openai', '--diff', str(old), str(new),
+           '--previous', str(previous), '-o', str(output)]
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    records = {r["rule_id"]: r for r in map(json.loads, output.read_text().splitlines())}
+    assert records["1"]["change"] == "unchanged" and records["1"]["analysis"] == "prior analysis"
+    assert records["1"]["model"] == "sonar" and records["1"]["usage"] == {"prompt_tokens": 12}
+    assert records["2"]["change"] == "modified"
+    assert records["2"]["changes"] == ["operator changed: @rx bar -> @rx baz"]
+    assert "[OpenAI] Analysis for:" in records["2"]["analysis"]
+    # An unchanged rule without a previous analysis is analyzed rather than left empty
+    assert records["3"]["change"] == "unchanged" and "[OpenAI] Analysis for:" in records["3"]["analysis"]
+    assert "1 modified, 2 unchanged" in result.stderr and "2 analyzed, 1 reused" in result.stderr
+
+
+def test_cli_budget_stops_run_and_resume_finishes_it(tmp_path):
+    from bench.mock_server import MockLLMServer
+    rules = tmp_path / "rules.conf"
+    rules.write_text('SecRule ARGS "@rx foo" "id:1001"\nSecRule ARGS "@rx bar" "id:1002"\n')
+    output = tmp_path / "out.jsonl"
+    usage_path = tmp_path / "usage.json"
+    env = os.environ.copy()
+    env.update(perplexity_api_key="dummy_key", perplexity_requests_per_minute="0")
+    base = [sys.executable, CLI_PATH, '--job-store', str(tmp_path / "jobs.sqlite3"), '-o', str(output),
+            '--usage', str(usage_path)]
+    with MockLLMServer(latency=0) as server:
+        env["perplexity_base_url"] = server.url
+        result = subprocess.run(base + ['--sections', 'overview', '--batch', str(rules), '--run-id', 'crs',
+                                        '-j', '1', '--max-total-tokens', '1'],
+                                capture_output=True, text=True, env=env)
+        assert result.returncode == 1
+        assert "Run crs: 1 done, 0 failed, 1 pending" in result.stderr
+        usage = json.loads(usage_path.read_text())
+        assert usage["total"]["requests"] == 1 and usage["by_model"][0]["model"] == "sonar-reasoning-pro"
+        record = json.loads(output.read_text())
+        assert record["usage"]["completion_tokens"] > 0 and record["citations"]
+
+        result = subprocess.run(base + ['--resume', 'crs', '--max-attempts', '1'],
+                                capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    assert [json.loads(line)["rule_id"] for line in output.read_text().splitlines()] == ["1001", "1002"]
+    assert "Usage: 1 request(s)" in result.stderr
+
+
+def test_cli_batch_groups_rules_per_request(tmp_path):
+    rules = tmp_path / "rules.conf"
+    rules.write_text('SecRule ARGS "@rx foo" "id:1001"\nSecRule ARGS "@rx bar" "id:1002"\n'
+                     'SecRule ARGS "@rx baz" "id:1003"\n')
+    output = tmp_path / "out.jsonl"
+    env = os.environ.copy()
+    env["openai_api_key"] = "dummy_key"
+    base = [sys.executable, CLI_PATH, '--provider', 'openai', '--batch', str(rules), '--group-size', '2']
+    result = subprocess.run(base + ['--sections', 'overview', '-o', str(output)],
+                            capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    # The mock provider does not answer per rule, so each rule falls back to its own analysis
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(r["rule_id"] for r in records) == ["1001", "1002", "1003"]
+    assert all("[OpenAI] Analysis for:" in r["analysis"] for r in records)
+
+    result = subprocess.run(base + ['--prompt-template', 'Explain: {rule}'], capture_output=True, text=True, env=env)
+    assert result.returncode == 1
+    assert "--group-size cannot be combined with --prompt-template" in result.stdout
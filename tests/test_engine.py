@@ -0,0 +1,313 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import pytest
+from engine.cache import AnalysisCache, make_cache_key
+from engine.coalesce import SingleFlight
+from engine.jobs import DONE, FAILED, PENDING, RUNNING, JobStore
+from engine.concurrency import (TokenBucket, get_rate_limiter, reset_rate_limiters, run_async_concurrently,
+                                run_concurrently)
+from engine.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, backoff_delay
+from engine.metrics import metrics, timed, trace
+from engine.usage import Budget, BudgetExceeded, UsageLedger
+from rules.splitter import RuleBlock
+
+
+def test_token_bucket_allows_burst_then_throttles():
+    bucket = TokenBucket(rate=1000, capacity=2)
+    assert bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=1)
+
+
+def test_get_rate_limiter_reads_environment(monkeypatch):
+    reset_rate_limiters()
+    monkeypatch.setenv("openai_requests_per_minute", "120")
+    monkeypatch.setenv("perplexity_requests_per_minute", "0")
+    try:
+        limiter = get_rate_limiter("openai")
+        assert limiter.rate == pytest.approx(2.0)
+        assert get_rate_limiter("openai") is limiter
+        assert get_rate_limiter("perplexity") is None
+        assert get_rate_limiter("ollama") is None
+    finally:
+        reset_rate_limiters()
+
+
+def test_run_concurrently_bounds_in_flight_work():
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def work(item):
+        with lock:
+            active.append(item)
+            peak.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.remove(item)
+        if item == 3:
+            raise RuntimeError("boom")
+        return item * 2
+
+    results = list(run_concurrently(work, range(10), max_workers=3))
+
+    assert max(peak) <= 3
+    assert sorted(item for item, _, _ in results) == list(range(10))
+    errors = {item: error for item, _, error in results if error is not None}
+    assert list(errors) == [3] and isinstance(errors[3], RuntimeError)
+    assert {item: result for item, result, error in results if error is None}[4] == 8
+
+
+def test_run_async_concurrently_bounds_in_flight_work():
+    active = []
+    peak = []
+
+    async def work(item):
+        active.append(item)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.remove(item)
+        if item == 3:
+            raise RuntimeError("boom")
+        return item * 2
+
+    async def collect():
+        return [entry async for entry in run_async_concurrently(work, range(50), max_in_flight=20)]
+
+    results = asyncio.run(collect())
+
+    assert max(peak) == 20
+    assert sorted(item for item, _, _ in results) == list(range(50))
+    errors = {item: error for item, _, error in results if error is not None}
+    assert list(errors) == [3] and isinstance(errors[3], RuntimeError)
+
+
+def test_token_bucket_acquire_async_waits_for_tokens():
+    bucket = TokenBucket(rate=100, capacity=1)
+
+    async def take_three():
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire_async()
+        return time.monotonic() - started
+
+    assert asyncio.run(take_three()) >= 0.015
+
+
+def test_single_flight_runs_identical_calls_once():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        release.wait(1)
+        return {"markdown_content": "shared"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"markdown_content": "shared"}] * 5
+    assert flight.in_flight() == 0
+
+
+def test_single_flight_shares_errors_and_forgets_finished_keys():
+    flight = SingleFlight()
+    with pytest.raises(RuntimeError, match="boom"):
+        flight.do("key", lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+    assert flight.do("key", lambda: 42) == 42
+
+
+def test_circuit_breaker_opens_then_allows_one_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [backoff_delay(attempt, base=0.5, cap=2.0) for attempt in range(6) for _ in range(20)]
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_single_flight_coalesces_coroutines():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "shared"
+
+    async def run_all():
+        return await asyncio.gather(*(flight.do_async("key", work) for _ in range(10)))
+
+    assert asyncio.run(run_all()) == ["shared"] * 10
+    assert len(calls) == 1
+
+
+def test_cache_key_ignores_whitespace_but_not_provider():
+    rule = 'SecRule ARGS "@rx foo" \\\n    "id:1,phase:2"'
+    same = 'SecRule ARGS   "@rx foo" "id:1,phase:2"'
+    assert make_cache_key(rule, "T {rule}", "perplexity", "m") == make_cache_key(same, "T {rule}", "perplexity", "m")
+    assert make_cache_key(rule, "T {rule}", "perplexity", "m") != make_cache_key(rule, "T {rule}", "ollama", "m")
+    assert make_cache_key(rule, "T {rule}", "perplexity", "m") != make_cache_key(rule, "U {rule}", "perplexity", "m")
+
+
+def test_analysis_cache_round_trip_and_ttl(tmp_path, monkeypatch):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+    cache.set("k", {"markdown_content": "analysis"})
+    assert cache.get("k") == {"markdown_content": "analysis"}
+    later = time.time() + 120
+    monkeypatch.setattr("engine.cache.time.time", lambda: later)
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_analysis_cache_evicts_least_recently_used(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"), max_bytes=120, ttl=0)
+    cache.set("a", {"markdown_content": "x" * 30})
+    time.sleep(0.01)
+    cache.set("b", {"markdown_content": "y" * 30})
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.set("c", {"markdown_content": "z" * 30})
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_sqlite_stores_close_their_connections(tmp_path, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+
+    def tracking_connect(*args, **kwargs):
+        opened.append(connect(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(sqlite3, "connect", tracking_connect)
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("k", {"markdown_content": "analysis"})
+    assert cache.get("k") is not None
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    store.create_run("crs", [RuleBlock('SecRule ARGS "@rx foo" "id:1"')], {})
+    store.mark_done("crs", 0, {"rule_id": "1"})
+    assert len(opened) == 6
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError, match="closed"):
+            conn.execute("SELECT 1")
+
+
+def test_trace_collects_stage_timings():
+    metrics.reset()
+    with trace("analysis", provider="test") as current:
+        with timed("network"):
+            time.sleep(0.01)
+        with timed("parse"):
+            pass
+    snapshot = metrics.snapshot()
+    assert set(current.stages) == {"network", "parse"}
+    assert current.to_dict()["provider"] == "test"
+    assert snapshot["network"]["count"] == 1 and snapshot["network"]["total_ms"] >= 10
+    assert snapshot["analysis"]["count"] == 1
+    with timed("network"):
+        pass
+    assert metrics.snapshot()["network"]["count"] == 2
+    assert set(current.stages) == {"network", "parse"}
+
+
+def test_job_store_tracks_rule_states_and_retries(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    blocks = [RuleBlock(f'SecRule ARGS "@rx {n}" "id:{n}"', "rules.conf", n) for n in (1, 2, 3)]
+    assert store.create_run("crs", blocks, {"provider": "openai"}) == 3
+    with pytest.raises(ValueError, match="already exists"):
+        store.create_run("crs", blocks, {})
+    assert store.run_config("crs") == {"provider": "openai"} and store.run_config("other") is None
+
+    for position in range(3):
+        store.mark_running("crs", position)
+    store.mark_done("crs", 0, {"rule_id": "1", "analysis": "ok"})
+    store.mark_failed("crs", 1, {"rule_id": "2", "error": "timeout"})
+    # Rule 3 stays running, as after a crash
+    assert store.counts("crs") == {PENDING: 0, RUNNING: 1, DONE: 1, FAILED: 1}
+    assert [p for p, _ in store.remaining("crs", max_attempts=2)] == [1, 2]
+    assert store.remaining("crs", max_attempts=2)[0][1] == blocks[1]
+    assert [p for p, _ in store.remaining("crs", max_attempts=1)] == [2]
+    assert store.records("crs") == [(0, {"rule_id": "1", "analysis": "ok"}), (1, {"rule_id": "2", "error": "timeout"})]
+    # A rule stopped before reaching the provider gets its attempt back
+    store.mark_pending("crs", 2)
+    assert store.counts("crs")[PENDING] == 1
+    assert [p for p, _ in store.remaining("crs", max_attempts=1)] == [2]
+    # State survives reopening the database
+    assert JobStore(store.path).counts("crs")[DONE] == 1
+
+
+def test_usage_ledger_aggregates_per_provider_and_model(monkeypatch):
+    monkeypatch.delenv("model_prices", raising=False)
+    ledger = UsageLedger()
+    usage = {"prompt_tokens": 1000, "completion_tokens": 2000, "citation_tokens": 500, "num_search_queries": 2}
+    ledger.record("perplexity", "sonar-reasoning-pro", usage)
+    ledger.record("perplexity", "sonar-reasoning-pro", usage)
+    ledger.record("ollama", "gemma3:latest", {"prompt_tokens": 10, "completion_tokens": 20})
+    snapshot = ledger.snapshot()
+    assert [(m["provider"], m["requests"]) for m in snapshot["by_model"]] == [("ollama", 1), ("perplexity", 2)]
+    # 2 x (1000 x $2 + 2000 x $8 per million tokens + 2 x $6 per thousand searches); Ollama is free
+    assert snapshot["total"]["cost_usd"] == pytest.approx(2 * (0.018 + 0.012))
+    assert snapshot["total"]["tokens"] == 2 * 3500 + 30
+    # A model without a price makes the cost unknown rather than wrong
+    ledger.record("perplexity", "unknown-model", usage)
+    assert ledger.total().cost_usd is None
+    ledger.reset()
+    assert ledger.total().requests == 0
+
+
+def test_budget_stops_at_limits_and_paces_token_rate():
+    ledger = UsageLedger()
+    budget = Budget(max_tokens=100, max_cost=1.0, ledger=ledger)
+    budget.admit()
+    ledger.record("perplexity", "sonar", {"prompt_tokens": 60, "completion_tokens": 40})
+    with pytest.raises(BudgetExceeded, match="Token budget"):
+        budget.admit()
+    with pytest.raises(ValueError):
+        Budget(max_cost=0)
+
+    paced = Budget(tokens_per_minute=600, ledger=ledger)
+    paced.spent(600)  # drains the one-minute burst...
+    paced.admit()
+    paced.spent(10)  # ...so the next 10 tokens take about a second at 10 tokens/s
+    start = time.monotonic()
+    paced.admit()
+    assert time.monotonic() - start >= 0.8
+
+
+def test_budget_enforces_cost_of_priced_models_after_unpriced_usage(monkeypatch):
+    monkeypatch.delenv("model_prices", raising=False)
+    ledger = UsageLedger()
+    budget = Budget(max_cost=0.01, ledger=ledger)
+    ledger.record("perplexity", "unknown-model", {"prompt_tokens": 1000})
+    budget.admit()
+    ledger.record("perplexity", "sonar-pro", {"completion_tokens": 120000})  # $1.80
+    with pytest.raises(BudgetExceeded, match="Cost budget"):
+        budget.admit()
@@ -1,3 +1,7 @@
+import asyncio
+import json
+import time
+import httpx
 import pytest
 from llms.base import LLMProvider
 from llms.perplexity import PerplexityProvider
@@ -5,6 +9,9 @@ from llms.openai import OpenAIProvider
 from llms.xcom import XComProvider
 from llms.google import GoogleProvider
 from llms.factory import LLMFactory
+from llms.router import ProviderRouter, Route
+from engine.resilience import CLOSED, get_circuit_breaker, reset_circuit_breakers
+from engine.usage import UsageLedger
 
 def test_llm_factory_create():
     # Test creating a known provider
@@ -33,6 +40,12 @@ def test_llm_factory_register():
     provider = LLMFactory.create("test", "test_key")
     assert isinstance(provider, TestProvider)
 
+def test_llm_factory_imports_registered_paths_on_first_use():
+    LLMFactory.register_provider("lazy", "llms.openai:OpenAIProvider")
+    assert LLMFactory._providers["lazy"] == "llms.openai:OpenAIProvider"
+    assert LLMFactory.provider_class("lazy") is OpenAIProvider
+    assert LLMFactory._providers["lazy"] is OpenAIProvider
+
 def test_perplexity_provider():
     # Test initialization
     provider = PerplexityProvider("test_key")
@@ -58,4 +71,232 @@ def test_google_provider():
     provider = GoogleProvider("test_key")
     result = provider.analyze("Test prompt for Google")
     assert isinstance(result, dict)
-    assert result["markdown_content"].startswith("[Google] Analysis for:")
\ No newline at end of file
+    assert result["markdown_content"].startswith("[Google] Analysis for:")
+
+
+def test_providers_share_pooled_session():
+    from llms.ollama import OllamaProvider
+    first = PerplexityProvider("test_key")
+    second = PerplexityProvider("other_key")
+    assert first.session is second.session
+    assert OllamaProvider().session is first.session
+
+def test_ollama_health_check_is_cached(mocker):
+    import llms.ollama
+    from llms.ollama import OllamaProvider
+    mocker.patch.dict(llms.ollama._healthy_until, clear=True)
+    provider = OllamaProvider()
+    get = mocker.patch.object(provider.session, "get")
+    post = mocker.patch.object(provider.session, "post")
+    post.return_value.json.return_value = {"response": "analysis"}
+    provider.analyze("first")
+    provider.analyze("second")
+    assert get.call_count == 1
+    assert post.call_count == 2
+
+def test_perplexity_stream_parses_sse(mocker):
+    provider = PerplexityProvider("test_key")
+    response = mocker.MagicMock(ok=True)
+    response.__enter__.return_value = response
+    response.iter_lines.return_value = [
+        b'data: {"choices": [{"delta": {"content": "## Rule"}}]}',
+        b'',
+        b'data: {"choices": [{"delta": {"content": " Overview"}}]}',
+        b'data: [DONE]',
+    ]
+    post = mocker.patch.object(provider.session, "post", return_value=response)
+    assert list(provider.stream("prompt")) == ["## Rule", " Overview"]
+    assert post.call_args.kwargs["json"]["stream"] is True
+
+
+def test_perplexity_stream_returns_usage_and_citations(mocker):
+    ledger = UsageLedger()
+    mocker.patch("llms.perplexity.usage_ledger", ledger)
+    provider = PerplexityProvider("test_key")
+    response = mocker.MagicMock(ok=True)
+    response.__enter__.return_value = response
+    response.iter_lines.return_value = [
+        b'data: {"model": "sonar", "choices": [{"delta": {"content": "## Rule"}}]}',
+        b'data: {"model": "sonar", "choices": [{"delta": {}}], "usage": {"prompt_tokens": 7}, '
+        b'"citations": ["https://coreruleset.org"]}',
+        b'data: [DONE]',
+    ]
+    mocker.patch.object(provider.session, "post", return_value=response)
+    stream = provider.stream("prompt")
+    assert next(stream) == "## Rule"
+    with pytest.raises(StopIteration) as stop:
+        next(stream)
+    assert stop.value.value == {"model": "sonar", "usage": {"prompt_tokens": 7},
+                                "citations": ["https://coreruleset.org"]}
+    # Recorded under the model that answered, not the configured default
+    assert [m["model"] for m in ledger.snapshot()["by_model"]] == ["sonar"]
+
+def test_perplexity_stream_closes_response_on_http_error(mocker):
+    provider = PerplexityProvider("test_key")
+    response = mocker.MagicMock(ok=False, status_code=429, text="rate limited")
+    response.json.side_effect = ValueError
+    mocker.patch.object(provider.session, "post", return_value=response)
+    with pytest.raises(RuntimeError, match="429"):
+        list(provider.stream("prompt"))
+    response.__exit__.assert_called_once()
+
+def test_ollama_stream_parses_ndjson(mocker):
+    import llms.ollama
+    from llms.ollama import OllamaProvider
+    mocker.patch.dict(llms.ollama._healthy_until, clear=True)
+    provider = OllamaProvider()
+    mocker.patch.object(provider.session, "get")
+    response = mocker.MagicMock()
+    response.__enter__.return_value = response
+    response.iter_lines.return_value = [
+        b'{"response": "## Rule", "done": false}',
+        b'{"response": " Overview", "done": false}',
+        b'{"response": "", "done": true}',
+    ]
+    mocker.patch.object(provider.session, "post", return_value=response)
+    assert list(provider.stream("prompt")) == ["## Rule", " Overview"]
+
+def test_base_stream_falls_back_to_analyze():
+    provider = OpenAIProvider("test_key")
+    chunks = list(provider.stream("Test prompt"))
+    assert len(chunks) == 1 and chunks[0].startswith("[OpenAI] Analysis for:")
+
+def test_llm_factory_get_client_reuses_instances():
+    LLMFactory.clear_clients()
+    first = LLMFactory.get_client("openai", "test_key")
+    assert LLMFactory.get_client("openai", "test_key") is first
+    assert LLMFactory.get_client("openai", "other_key") is not first
+    LLMFactory.clear_clients("openai")
+    assert LLMFactory.get_client("openai", "test_key") is not first
+    with pytest.raises(ValueError):
+        LLMFactory.get_client("unknown_provider", "test_key")
+
+
+class _ScriptedProvider(LLMProvider):
+    def __init__(self, api_key=None, delay=0.0, error=None, text="ok"):
+        self.delay, self.error, self.text, self.calls = delay, error, text, 0
+    def analyze(self, prompt, max_tokens=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {"markdown_content": self.text}
+
+def test_router_fails_over_and_opens_circuit(monkeypatch):
+    reset_circuit_breakers()
+    monkeypatch.setenv("route_down_failure_threshold", "2")
+    down = _ScriptedProvider(error=RuntimeError("503"))
+    backup = _ScriptedProvider(text="from backup")
+    router = ProviderRouter([Route("route_down", down, retries=1), Route("route_backup", backup)])
+    try:
+        assert router.analyze("p") == {"markdown_content": "from backup", "provider": "route_backup"}
+        assert down.calls == 2
+        router.analyze("p")
+        assert down.calls == 2  # circuit open, primary skipped
+    finally:
+        reset_circuit_breakers()
+
+def test_router_times_out_and_hedges():
+    reset_circuit_breakers()
+    slow = _ScriptedProvider(delay=0.5, text="slow")
+    fast = _ScriptedProvider(text="local")
+    try:
+        timed_out = ProviderRouter([Route("route_slow", slow, timeout=0.05), Route("route_fast", fast)])
+        assert timed_out.analyze("p")["provider"] == "route_fast"
+        hedged = ProviderRouter([Route("route_slow", slow)], hedge=Route("route_fast", fast), hedge_after=0.05)
+        assert hedged.analyze("p") == {"markdown_content": "local", "provider": "route_fast"}
+        with pytest.raises(RuntimeError, match="All providers failed"):
+            ProviderRouter([Route("route_down", _ScriptedProvider(error=RuntimeError("boom")))]).analyze("p")
+    finally:
+        reset_circuit_breakers()
+
+def test_router_stream_fails_over_before_first_chunk():
+    reset_circuit_breakers()
+    router = ProviderRouter([Route("route_down", _ScriptedProvider(error=RuntimeError("503"))),
+                             Route("route_backup", _ScriptedProvider(text="streamed"))])
+    try:
+        stream = router.stream("p")
+        assert next(stream) == "streamed"
+        with pytest.raises(StopIteration) as stop:
+            next(stream)
+        assert stop.value.value == {"provider": "route_backup"}
+    finally:
+        reset_circuit_breakers()
+
+def test_router_hedge_loser_releases_half_open_trial(monkeypatch):
+    reset_circuit_breakers()
+    monkeypatch.setenv("route_hedge_failure_threshold", "1")
+    monkeypatch.setenv("route_hedge_circuit_reset_seconds", "0.05")
+    breaker = get_circuit_breaker("route_hedge")
+    breaker.record_failure()
+    time.sleep(0.06)
+    hedge = _ScriptedProvider(delay=0.3, text="local")
+    router = ProviderRouter([Route("route_primary", _ScriptedProvider(delay=0.15, text="remote"))],
+                            hedge=Route("route_hedge", hedge), hedge_after=0.05)
+    try:
+        assert router.analyze("p")["provider"] == "route_primary"
+        assert hedge.calls == 1  # the hedge took the half-open trial...
+        time.sleep(0.4)
+        assert breaker.state == CLOSED  # ...and recorded its outcome once it finished
+    finally:
+        reset_circuit_breakers()
+
+class _ChunkedProvider(_ScriptedProvider):
+    def stream(self, prompt, max_tokens=None):
+        yield from ("one", "two", "three")
+
+def test_router_stream_closed_early_records_outcome(monkeypatch):
+    reset_circuit_breakers()
+    monkeypatch.setenv("route_chunked_failure_threshold", "1")
+    monkeypatch.setenv("route_chunked_circuit_reset_seconds", "0")
+    breaker = get_circuit_breaker("route_chunked")
+    breaker.record_failure()
+    router = ProviderRouter([Route("route_chunked", _ChunkedProvider())])
+    try:
+        stream = router.stream("p")
+        assert next(stream) == "one"  # the half-open trial is now in flight
+        stream.close()
+        assert breaker.state == CLOSED and breaker.allow()
+    finally:
+        reset_circuit_breakers()
+
+def test_perplexity_analyze_async_uses_httpx(mocker):
+    def handler(request):
+        assert request.url.path == "/chat/completions"
+        assert json.loads(request.content)["max_tokens"] == 512
+        return httpx.Response(200, json={"choices": [{"message": {"content": "## Rule Overview"}}]})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            mocker.patch("llms.perplexity.get_async_client", return_value=client)
+            return await PerplexityProvider("test_key").analyze_async("prompt", max_tokens=512)
+
+    assert asyncio.run(run()) == {"markdown_content": "## Rule Overview"}
+
+def test_perplexity_analyze_async_raises_api_errors(mocker):
+    def handler(request):
+        return httpx.Response(429, json={"error": {"message": "rate limited"}})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            mocker.patch("llms.perplexity.get_async_client", return_value=client)
+            return await PerplexityProvider("test_key").analyze_async("prompt")
+
+    with pytest.raises(RuntimeError, match=r"\(429\): rate limited"):
+        asyncio.run(run())
+
+def test_base_analyze_async_falls_back_to_thread():
+    provider = _ScriptedProvider(text="threaded")
+    assert asyncio.run(provider.analyze_async("p")) == {"markdown_content": "threaded"}
+
+def test_perplexity_result_keeps_usage_and_citations(monkeypatch):
+    ledger = UsageLedger()
+    monkeypatch.setattr("llms.perplexity.usage_ledger", ledger)
+    with open("resources/perplexity-example-response.json") as handle:
+        response = json.load(handle)
+    result = PerplexityProvider("test_key")._result(response)
+    assert result["usage"] == response["usage"] and result["model"] == response["model"]
+    assert result["citations"] == response["citations"]
+    total = ledger.total()
+    assert total.requests == 1 and total.prompt_tokens == response["usage"]["prompt_tokens"]
+    assert total.cost_usd > 0
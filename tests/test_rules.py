@@ -0,0 +1,300 @@
+import pytest
+from rules.diff import diff_rule_sets
+from rules.normalizer import canonicalize_rule
+from rules.parser import RuleParseError, parse_rule
+from rules.phrase_match import PhraseMatcher, clear_file_matchers, file_matcher
+from rules.regex_perf import analyze_pattern, regex_performance
+from rules.simulator import HttpRequest, evaluate_rule, request_from_curl, verify_test_cases
+from rules.similarity import SimilarityIndex, logic_fingerprint
+from rules.splitter import extract_rule_id, group_rules, split_rules
+from rules.technical import technical_analysis
+
+CHAINED = '''# Leading comment
+SecMarker BEGIN_TEST
+
+SecRule REQUEST_METHOD "@streq POST" \\
+    "id:920180,\\
+    phase:1,\\
+    block,\\
+    msg:'POST without Content-Length - chain of checks',\\
+    chain"
+    SecRule &REQUEST_HEADERS:Content-Length "@eq 0" \\
+        "t:none,\\
+        chain"
+        SecRule &REQUEST_HEADERS:Transfer-Encoding "@eq 0" "t:none"
+
+SecRule ARGS "@rx attack" "id:942100,phase:2,block,msg:'SQLi chain attack'"
+'''
+
+
+def test_split_rules_groups_chains():
+    blocks = split_rules(CHAINED)
+    assert [b.rule_id for b in blocks] == ["920180", "942100"]
+    assert blocks[0].text.count("SecRule") == 3
+    assert blocks[0].line == 4
+    assert blocks[1].line == 15
+
+
+def test_split_rules_keeps_line_continuations():
+    blocks = split_rules(CHAINED)
+    assert blocks[0].text.splitlines()[0] == 'SecRule REQUEST_METHOD "@streq POST" \\'
+
+
+def test_split_rules_ignores_chain_in_message():
+    blocks = split_rules('SecRule ARGS "@rx x" "id:1,msg:\'Attack chain detected\'"\nSecAction "id:2"\n')
+    assert len(blocks) == 2
+
+
+def test_split_rules_ignores_chain_token_inside_quoted_values():
+    text = ('SecRule ARGS "@rx x" "id:1,msg:\'a,chain,b\'"\nSecRule ARGS "@rx y" "id:2,tag:\'x,chain\'"\n'
+            'SecRule ARGS "@rx z" "id:3,chain,msg:\'chained\'"\n    SecRule ARGS "@rx w" "t:none"\n')
+    blocks = split_rules(text)
+    assert [block.rule_id for block in blocks] == ["1", "2", "3"]
+    assert len(blocks[2].text.splitlines()) == 2
+
+
+def test_group_rules_keeps_files_apart_and_caps_size():
+    blocks = split_rules("".join(f'SecRule ARGS "@rx {n}" "id:{n}"\n' for n in range(3)), "a.conf")
+    blocks += split_rules('SecRule ARGS "@rx 3" "id:3"\n', "b.conf")
+    groups = list(group_rules(blocks, 2))
+    assert [[block.rule_id for block in group] for group in groups] == [["0", "1"], ["2"], ["3"]]
+    with pytest.raises(ValueError):
+        list(group_rules(blocks, 0))
+
+
+@pytest.mark.parametrize("rule,expected", [
+    ('SecRule ARGS "@rx x" "id:1234,phase:2"', "1234"),
+    ("SecAction \"id:'900000',pass\"", "900000"),
+    ('SecRule ARGS "@rx x" "phase:2"', None),
+])
+def test_extract_rule_id(rule, expected):
+    assert extract_rule_id(rule) == expected
+
+
+def test_parse_rule_structure():
+    rule = parse_rule(CHAINED.split("\n\n")[1])
+    assert rule.directive == "SecRule"
+    assert rule.variables == ["REQUEST_METHOD"]
+    assert (rule.operator, rule.operator_argument, rule.negated) == ("@streq", "POST", False)
+    assert rule.rule_id == "920180" and rule.phase == "1"
+    assert rule.action_value("msg") == "POST without Content-Length - chain of checks"
+    assert [r.variables for r in rule.chained] == [["&REQUEST_HEADERS:Content-Length"], ["&REQUEST_HEADERS:Transfer-Encoding"]]
+
+
+def test_parse_rule_variable_regex_and_implicit_rx():
+    rule = parse_rule('SecRule ARGS:/^(foo|bar)$/|!ARGS:baz "!attack" "id:1"')
+    assert rule.variables == ["ARGS:/^(foo|bar)$/", "!ARGS:baz"]
+    assert (rule.operator, rule.operator_argument, rule.negated) == ("@rx", "attack", True)
+
+
+def test_parse_rule_rejects_non_rules():
+    with pytest.raises(RuleParseError):
+        parse_rule("SecMarker END")
+    with pytest.raises(RuleParseError):
+        parse_rule('SecRule ARGS "@rx unterminated')
+
+
+def test_canonicalize_rule_ignores_cosmetic_differences():
+    original = (
+        'SecRule ARGS|REQUEST_HEADERS:User-Agent "@rx foo" \\\n'
+        '    "id:1,\\\n    phase:2,\\\n    t:none,t:lowercase,\\\n    msg:\'Bad thing\',\\\n    tag:\'attack\'"'
+    )
+    reformatted = (
+        'SecRule  request_headers:User-Agent|args  "foo"  '
+        '"tag:attack,msg:\'Bad thing\',t:none,phase:2,t:lowercase,id:1"'
+    )
+    assert canonicalize_rule(original) == canonicalize_rule(reformatted)
+
+
+def test_canonicalize_rule_keeps_transformation_order():
+    assert canonicalize_rule('SecRule ARGS "x" "t:lowercase,t:urlDecode"') != canonicalize_rule(
+        'SecRule ARGS "x" "t:urlDecode,t:lowercase"')
+
+
+def test_technical_analysis_table():
+    section = technical_analysis(CHAINED.split("\n\n")[1])
+    rows = dict(line.strip("| ").split(" | ", 1) for line in section.splitlines()[4:])
+    assert section.startswith("## Technical Analysis")
+    assert rows["Rule ID"] == "920180"
+    assert rows["Rule Type"] == "SecRule (chain of 3 rules)"
+    assert rows["Operators"] == "`@streq POST`, `@eq 0`, `@eq 0`"
+    assert rows["Disruptive Action"] == "block"
+    assert rows["Transformations"] == "none, none"
+    assert rows["Phase"] == "1 (request headers)"
+
+
+def test_technical_analysis_escapes_pipes_and_rejects_garbage():
+    section = technical_analysis('SecRule ARGS|ARGS_NAMES "@rx a|b" "id:1"')
+    assert "`ARGS`, `ARGS_NAMES`" in section
+    assert "`@rx a\\|b`" in section
+    assert technical_analysis("not a rule") is None
+
+
+OLD_RELEASE = """SecRule ARGS "@rx foo" "id:1,phase:2,block,t:none,ver:'OWASP_CRS/3.3.2'"
+SecRule ARGS "@rx bar" "id:2,phase:2,block,t:none,ver:'OWASP_CRS/3.3.2'"
+SecRule ARGS "@rx gone" "id:3,phase:2,block,ver:'OWASP_CRS/3.3.2'"
+"""
+
+NEW_RELEASE = """SecRule ARGS  "@rx foo" "phase:2,id:1,t:none,block,ver:'OWASP_CRS/4.0.0'"
+SecRule ARGS|ARGS_NAMES "@rx bar|baz" "id:2,phase:2,block,t:none,t:lowercase,ver:'OWASP_CRS/4.0.0'"
+SecRule ARGS "@rx new" "id:4,phase:1,deny"
+"""
+
+
+def test_diff_rule_sets_classifies_rules():
+    changes = {c.rule_id: c for c in diff_rule_sets(split_rules(OLD_RELEASE), split_rules(NEW_RELEASE))}
+    assert {k: c.status for k, c in changes.items()} == {
+        "1": "unchanged", "2": "modified", "3": "removed", "4": "added"}
+    assert changes["2"].details == [
+        "variables added: ARGS_NAMES",
+        "operator changed: @rx bar -> @rx bar|baz",
+        "transformations added: lowercase",
+    ]
+    assert [c.needs_analysis for c in changes.values()] == [False, True, True, False]
+
+
+SQLI_ARGS = ('SecRule ARGS|ARGS_NAMES "@rx (?i)union\\s+(all\\s+)?select\\s+\\w+" '
+             '"id:942100,phase:2,block,t:none,t:urlDecodeUni,msg:\'SQLi\',setvar:\'tx.sql_score=+5\'"')
+SQLI_COOKIES = ('SecRule REQUEST_COOKIES "@rx (?i)union\\s+(all\\s+)?select\\s+\\w+" '
+                '"id:942101,phase:2,block,t:none,t:urlDecodeUni,msg:\'SQLi in cookies\',setvar:\'tx.pl2=+1\'"')
+SQLI_TWEAKED = ('SecRule ARGS|ARGS_NAMES "@rx (?i)union\\s+(all\\s+)?select\\s+[\\w(]+" '
+                '"id:942102,phase:2,block,t:none,t:urlDecodeUni,msg:\'SQLi\'"')
+
+
+def test_logic_fingerprint_ignores_targets_and_metadata():
+    assert logic_fingerprint(parse_rule(SQLI_ARGS)) == logic_fingerprint(parse_rule(SQLI_COOKIES))
+    assert logic_fingerprint(parse_rule(SQLI_ARGS)) != logic_fingerprint(parse_rule(SQLI_TWEAKED))
+
+
+def test_similarity_index_finds_near_duplicates():
+    index = SimilarityIndex(threshold=0.7)
+    assert index.add(SQLI_ARGS, "base analysis")
+    assert not index.add("not a rule")
+
+    exact = index.find(SQLI_COOKIES)
+    assert (exact.rule_id, exact.payload, exact.score, exact.exact_logic) == ("942100", "base analysis", 1.0, True)
+    near = index.find(SQLI_TWEAKED)
+    assert near.rule_id == "942100" and not near.exact_logic and 0.7 <= near.score < 1
+    assert index.find('SecRule REQUEST_URI "@pm wp-admin phpmyadmin" "id:2,phase:1,deny"') is None
+    assert len(index) == 1
+
+
+def test_similarity_index_keeps_rules_without_distinctive_patterns_apart():
+    index = SimilarityIndex()
+    index.add('SecAction "id:900000,phase:1,nolog,pass,setvar:tx.blocking_paranoia_level=1"', "paranoia")
+    index.add('SecRule &TX:crs_setup_version "@eq 0" "id:901001,phase:1,deny"', "setup check")
+    assert index.find('SecAction "id:900100,phase:1,nolog,pass,setvar:tx.critical_anomaly_score=5"') is None
+    assert index.find('SecRule &TX:enforce_bodyproc_urlencoded "@eq 0" "id:901010,phase:1,deny"') is None
+    same = index.find('SecAction "id:900001,phase:1,nolog,pass,setvar:tx.blocking_paranoia_level=2"')
+    assert same.payload == "paranoia" and same.exact_logic
+
+
+def test_analyze_pattern_flags_catastrophic_backtracking():
+    nested = analyze_pattern(r"^(\w+\s?)*$")
+    assert nested.verdict == "exponential" and nested.dangerous
+    assert any(issue.startswith("nested quantifier") for issue in nested.issues)
+    assert nested.worst_seconds > 0.05 and nested.attack
+    assert analyze_pattern(r"\s*\s*x").verdict == "polynomial"
+
+
+def test_analyze_pattern_accepts_linear_patterns():
+    report = analyze_pattern(r"(?i)union\s+(?:all\s+)?select")
+    assert (report.verdict, report.issues, report.dangerous) == ("linear", [], False)
+    assert report.worst_length > 4096 and report.benign_us_per_kb is not None
+    assert analyze_pattern(r"^(?:[^/]+/)*[^/]+\.php$").issues == []
+    assert analyze_pattern(r"\x{41}").verdict == "not analyzed"
+
+
+@pytest.mark.parametrize("pattern", [r"[a-z]+=[a-z]+", r"\d+\.\d+", r"(?:\w+,)+\w+\s*=", r'[^"]+"[^"]*"'])
+def test_analyze_pattern_ignores_search_retries_without_static_finding(pattern):
+    # Python's search is quadratic on these, PCRE's is not
+    report = analyze_pattern(pattern)
+    assert (report.verdict, report.issues) == ("linear", [])
+
+
+def test_regex_performance_section():
+    section = regex_performance('SecRule ARGS "@rx (a+)+$" "id:1,chain"\n'
+                                '    SecRule ARGS "@pm foo bar" "t:none"')
+    assert section.startswith("## Regex Performance")
+    assert "| `(a+)+$` | exponential |" in section
+    assert "Slowest input for `(a+)+$`: `'' + 'a' * " in section
+    assert regex_performance('SecRule ARGS "@pm foo" "id:2"') is None
+
+
+SQLI_CHAIN = ('SecRule ARGS|REQUEST_COOKIES|!ARGS:safe "@rx (?i)union\\s+select" '
+              '"id:942100,phase:2,block,t:none,t:urlDecodeUni,t:lowercase,capture,chain"\n'
+              '    SecRule TX:0 "@contains select" "setvar:tx.sql_score=+5"')
+
+
+def test_request_from_curl():
+    request = request_from_curl("curl -H 'User-Agent: sqlmap' -b 'sid=1; theme=dark' \\\n"
+                                "  -d 'q=%27or+1' 'https://sandbox.coreruleset.org/search?id=1#top'")
+    assert (request.method, request.uri, request.body) == ("POST", "/search?id=1", "q=%27or+1")
+    assert request.header("host") == "sandbox.coreruleset.org"
+    assert request.header("User-Agent") == "sqlmap"
+    assert request.args_get + request.args_post == [("id", "1"), ("q", "'or 1")]
+    assert request.cookies == [("sid", "1"), ("theme", "dark")]
+
+
+def test_evaluate_rule_applies_transformations_and_chain():
+    attack = evaluate_rule(SQLI_CHAIN, HttpRequest(uri="/?q=UNION%2520%0aSELECT"))
+    assert attack.matched and attack.unsupported == []
+    assert [m.variable for m in attack.matches] == ["ARGS:q", "TX:0"]
+    assert attack.tx == {"0": "union \nselect", "sql_score": "5"}
+    assert not evaluate_rule(SQLI_CHAIN, HttpRequest(uri="/?safe=union+select")).matched
+    assert not evaluate_rule(SQLI_CHAIN, HttpRequest(uri="/?q=union+all")).matched
+
+
+def test_evaluate_rule_operators_and_unsupported_features():
+    request = HttpRequest(uri="/admin", headers=[("User-Agent", "Nikto/2.5")])
+    assert evaluate_rule('SecRule REQUEST_HEADERS:User-Agent "@pm sqlmap nikto" "id:1"', request).matched
+    assert evaluate_rule('SecRule &REQUEST_HEADERS:Accept "@eq 0" "id:2"', request).matched
+    assert evaluate_rule('SecRule REQUEST_FILENAME "!@beginsWith /api" "id:3"', request).matched
+    unsupported = evaluate_rule('SecRule FILES "@detectSQLi" "id:4,t:cssDecode"', request)
+    assert not unsupported.matched
+    assert unsupported.unsupported == ["operator @detectSQLi", "variable FILES"]
+
+
+def test_phrase_matcher_finds_overlapping_and_suffix_phrases():
+    matcher = PhraseMatcher(["he", "she", "hers", "HIS", ""])
+    assert matcher.phrases == 4
+    assert list(matcher.finditer("uSHErs")) == [(4, "she"), (6, "hers")]
+    assert matcher.search("this") == "his"
+    assert matcher.search("hxs") is None
+    assert PhraseMatcher([]).search("anything") is None
+
+
+def test_file_matcher_caches_until_the_file_changes(tmp_path):
+    clear_file_matchers()
+    data = tmp_path / "scanners.data"
+    data.write_text("# scanner user agents\nnikto\n\nsqlmap\n")
+    matcher = file_matcher(str(data))
+    assert matcher.phrases == 2
+    assert file_matcher(str(data)) is matcher
+    data.write_text("nikto\nsqlmap\nmasscan\n")
+    assert file_matcher(str(data)).search("Masscan/1.3") == "masscan"
+
+
+def test_evaluate_rule_pm_from_file(tmp_path):
+    (tmp_path / "scanners.data").write_text("nikto\nsqlmap\n")
+    rule = 'SecRule REQUEST_HEADERS:User-Agent "@pmFromFile scanners.data" "id:1,t:lowercase"'
+    request = HttpRequest(headers=[("User-Agent", "Mozilla/5.0 Nikto/2.5")])
+    assert evaluate_rule(rule, request, data_dir=str(tmp_path)).matched
+    assert not evaluate_rule(rule, HttpRequest(headers=[("User-Agent", "curl")]), str(tmp_path)).matched
+    assert evaluate_rule(rule, request).unsupported == ["operator @pmFromFile without a data directory"]
+    missing = evaluate_rule(rule.replace("scanners", "missing"), request, str(tmp_path))
+    assert not missing.matched and missing.unsupported[0].startswith("operator @pmFromFile with unreadable")
+
+
+def test_verify_test_cases_checks_labelled_commands():
+    test_case = """```bash
+# True positive
+curl -H "x-format-output: txt-matched-rules" "https://sandbox.coreruleset.org/?q=1%20union%20select%202"
+# False positive: ordinary search
+curl -H "x-format-output: txt-matched-rules" "https://sandbox.coreruleset.org/?q=union+station"
+curl "https://sandbox.coreruleset.org/?safe=union+select"
+```"""
+    checks = verify_test_cases(SQLI_CHAIN, test_case)
+    assert [(c.expected, c.matched, c.passed) for c in checks] == [
+        (True, True, True), (False, False, True), (None, False, None)]
+    assert verify_test_cases(SQLI_CHAIN, "curl") == []
@@ -0,0 +1,124 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+import pytest
+
+from service import AnalysisServer
+
+RULE = 'SecRule ARGS "@rx foo" "id:1001,phase:2,deny"'
+
+
+def _call(server, method, path, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(server.url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, dict(response.headers), json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), json.loads(e.read())
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("perplexity_api_key", "test_key")
+
+
+@patch('service.cached_analysis', return_value=None)
+@patch('service.analyze_modsec_rule')
+def test_analyze_and_batch_jobs(mock_analyze, mock_cached):
+    """
+    Test that /analyze answers with the record and /batch jobs can be polled.
+    """
+    # Arrange
+    mock_analyze.side_effect = lambda rule, template, provider, **options: {"markdown_content": f"Analysis of {rule}"}
+
+    with AnalysisServer(port=0, workers=2) as server:
+        # Act
+        status, _, record = _call(server, "POST", "/analyze", {"rule": RULE, "structured": True})
+        batch_status, headers, batch = _call(server, "POST", "/batch", {
+            "rules": [RULE], "text": 'SecRule ARGS "@rx bar" "id:1002"\nSecRule ARGS "@rx baz" "id:1003"'})
+        server.service.get(batch["job_id"]).wait(5)
+        job_status, _, job = _call(server, "GET", headers["Location"])
+
+        # Assert
+        assert status == 200
+        assert record["rule_id"] == "1001" and record["analysis"] == f"Analysis of {RULE}"
+        assert record["cached"] is False and record["report"]["preamble"] == f"Analysis of {RULE}"
+        assert batch_status == 202 and batch["rules"] == 3
+        assert job_status == 200 and job["status"] == "done" and job["completed"] == 3
+        assert [r["rule_id"] for r in job["results"]] == ["1001", "1002", "1003"]
+        assert _call(server, "GET", "/jobs/unknown")[0] == 404
+        assert _call(server, "POST", "/analyze", {"rule": ""})[0] == 400
+        assert _call(server, "POST", "/analyze", {"rule": RULE, "sections": ["bogus"]})[0] == 400
+        assert _call(server, "POST", "/analyze", {"rule": RULE, "max_tokens": True})[0] == 400
+        assert _call(server, "GET", "/health")[2]["queued"] == 0
+
+
+@patch('service.cached_analysis')
+@patch('service.analyze_modsec_rule')
+def test_full_queue_gets_429_but_cached_rules_are_answered(mock_analyze, mock_cached):
+    """
+    Test backpressure: a full queue refuses uncached work while cache hits still succeed.
+    """
+    # Arrange
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_analysis(rule, template, provider, **options):
+        started.set()
+        release.wait(5)
+        return {"markdown_content": "done"}
+
+    mock_analyze.side_effect = slow_analysis
+    mock_cached.side_effect = lambda rule, *args, **kwargs: {"markdown_content": "cached"} if "cached" in rule else None
+
+    with AnalysisServer(port=0, workers=1, queue_size=1) as server:
+        # Act
+        running = _call(server, "POST", "/batch", {"rules": [RULE]})[2]
+        started.wait(5)
+        queued = _call(server, "POST", "/batch", {"rules": [RULE]})
+        refused = _call(server, "POST", "/batch", {"rules": [RULE]})
+        too_large = _call(server, "POST", "/batch", {"rules": [RULE, RULE]})
+        cached = _call(server, "POST", "/analyze", {"rule": 'SecRule ARGS "@rx cached" "id:7"'})
+        release.set()
+        for job_id in (running["job_id"], queued[2]["job_id"]):
+            assert server.service.get(job_id).wait(5)
+
+        # Assert
+        assert queued[0] == 202
+        assert refused[0] == 429 and int(refused[1]["Retry-After"]) >= 1
+        assert too_large[0] == 400 and "exceed the queue size" in too_large[2]["error"]
+        assert cached[0] == 200 and cached[2]["analysis"] == "cached" and cached[2]["cached"] is True
+        assert mock_analyze.call_count == 2
+
+
+def test_local_sections_are_answered_without_a_provider(monkeypatch):
+    """
+    Test that a request for local sections only needs no API key and no provider call.
+    """
+    monkeypatch.delenv("perplexity_api_key")
+    with AnalysisServer(port=0, workers=1) as server:
+        status, _, record = _call(server, "POST", "/analyze", {"rule": RULE, "sections": ["technical_analysis"]})
+
+    assert status == 200
+    assert record["analysis"].startswith("## Technical Analysis") and "Rule Overview" not in record["analysis"]
+
+
+@patch('service.cached_analysis', return_value={"markdown_content": "cached"})
+@patch('service.analyze_modsec_rule', return_value={"markdown_content": "measured"})
+def test_regex_performance_is_opt_in_and_runs_in_the_worker(mock_analyze, mock_cached):
+    """
+    Test that regex performance is left out by default and, when selected, is
+    measured in the worker pool instead of on the request thread.
+    """
+    with AnalysisServer(port=0, workers=1) as server:
+        default = _call(server, "POST", "/analyze", {"rule": RULE})
+        selected = _call(server, "POST", "/analyze", {"rule": RULE, "sections": ["summary", "regex_performance"]})
+
+    assert default[2]["analysis"] == "cached" and mock_cached.call_args.kwargs["include_regex_performance"] is False
+    assert selected[2]["analysis"] == "measured" and mock_cached.call_count == 1
+    assert mock_analyze.call_args.kwargs["include_regex_performance"] is True
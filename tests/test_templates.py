@@ -0,0 +1,127 @@
+import pytest
+from templates.prompt_template import (PROMPT_SECTIONS, PROMPT_TEMPLATE, build_delta_prompt_template,
+                                       build_group_prompt_template, build_prompt_template, format_rule_group)
+from templates.report import AnalysisReport, SectionParser, parse_report, section_key, split_group_response
+
+
+def test_default_template_asks_for_every_llm_section():
+    for section in PROMPT_SECTIONS.values():
+        assert section in PROMPT_TEMPLATE
+    assert "## Technical Analysis" not in PROMPT_TEMPLATE
+    assert PROMPT_TEMPLATE.format(rule="SecRule ARGS x").count("SecRule ARGS x") == 1
+
+
+def test_prompts_put_the_rule_after_the_static_prefix():
+    first = PROMPT_TEMPLATE.format(rule='SecRule ARGS "@rx a" "id:1"')
+    second = PROMPT_TEMPLATE.format(rule='SecRule ARGS "@rx b" "id:2"')
+    shared = len(PROMPT_TEMPLATE.split("{rule}")[0])
+    assert first[:shared] == second[:shared] and first.rstrip().endswith('"id:1"')
+    assert all(section in first[:shared] for section in PROMPT_SECTIONS.values())
+
+
+def test_group_prompt_numbers_rules_after_the_instructions():
+    template = build_group_prompt_template(["overview", "test_case"], max_tokens=1000)
+    prompt = format_rule_group(template, ['SecRule ARGS "@rx a{2}" "id:1"', 'SecRule ARGS "@rx b" "id:2"'])
+    assert '"# Rule <number>"' in prompt and "## Rule Overview" in prompt and "## Summary" not in prompt
+    assert "Keep each rule's analysis under 750 words" in prompt
+    assert prompt.index("## Test case") < prompt.index('Rule 1:\nSecRule ARGS "@rx a{2}" "id:1"')
+    assert prompt.rstrip().endswith('Rule 2:\nSecRule ARGS "@rx b" "id:2"')
+
+
+def test_split_group_response_keeps_one_part_per_rule():
+    answer = ("Here are the analyses.\n# Rule 1\n## Rule Overview\nFirst\n```bash\n# Rule 2\n```\n"
+              "# **Rule 2**: 942100\n## Summary\nSecond\n# Rule 2\nRepeated\n# Rule 7\nOut of range")
+    assert split_group_response(answer, 3) == {
+        0: "## Rule Overview\nFirst\n```bash\n# Rule 2\n```",
+        1: "## Summary\nSecond",
+    }
+
+
+def test_build_prompt_template_selects_sections_in_report_order():
+    template = build_prompt_template(["test_case", "technical_analysis", "overview"])
+    assert "## Rule Overview" in template and "## Test case" in template
+    assert template.index("## Rule Overview") < template.index("## Test case")
+    assert "## Summary" not in template
+    assert len(template) < len(PROMPT_TEMPLATE) / 2
+
+
+def test_build_prompt_template_splits_token_budget():
+    template = build_prompt_template(["overview", "test_case"], max_tokens=1000)
+    assert "[Keep this section under 300 words.]" in template
+    assert "[Keep this section under 450 words.]" in template
+    assert "under 750 words" in template
+
+
+def test_build_prompt_template_rejects_bad_selection():
+    with pytest.raises(ValueError, match="Unknown section"):
+        build_prompt_template(["overview", "bogus"])
+    with pytest.raises(ValueError, match="at least one section"):
+        build_prompt_template([])
+    # Local sections alone need no prompt
+    assert build_prompt_template(["technical_analysis", "regex_performance"]) is None
+
+
+def test_build_delta_prompt_template_quotes_base_literally():
+    template = build_delta_prompt_template('SecRule ARGS "@rx a{2,3}" "id:1"', "## Rule Overview\nMatches %{TX.x}",
+                                           ["variables added: ARGS_NAMES"], "1", max_tokens=400)
+    prompt = template.format(rule='SecRule ARGS|ARGS_NAMES "@rx a{2,3}" "id:2"')
+    assert '"@rx a{2,3}" "id:1"' in prompt and "Matches %{TX.x}" in prompt
+    assert "- variables added: ARGS_NAMES" in prompt
+    assert "## Differences from Rule 1" in prompt and "under 300 words" in prompt
+
+
+SAMPLE_ANALYSIS = """Here is the analysis.
+
+## Rule Overview
+Detects SQL injection.
+
+## Security Impact
+- CRS rule ID: 942100
+- **Attack Type**: SQL Injection
+- Impact: Blocks data exfiltration
+
+## Effectiveness and False Postives
+Few false positives.
+
+## Test case
+```bash
+# True positive
+curl -H "x-format-output: txt-matched-rules" https://sandbox.coreruleset.org/?id=1%20union%20select
+## not a heading inside a fence
+```
+
+## Closing Notes
+Nothing else.
+"""
+
+
+def test_parse_report_splits_sections():
+    report = parse_report(SAMPLE_ANALYSIS, rule_id="942100")
+    assert report.preamble == "Here is the analysis."
+    assert report.overview == "Detects SQL injection."
+    assert report.effectiveness == "Few false positives."
+    assert report.impact == {"CRS rule ID": "942100", "Attack Type": "SQL Injection",
+                             "Impact": "Blocks data exfiltration"}
+    assert report.test_commands == [
+        'curl -H "x-format-output: txt-matched-rules" https://sandbox.coreruleset.org/?id=1%20union%20select']
+    assert "## not a heading inside a fence" in report.test_case
+    assert report.extra == {"Closing Notes": "Nothing else."}
+    assert list(report.sections()) == ["overview", "security_impact", "effectiveness", "test_case"]
+    assert AnalysisReport.from_dict(report.to_dict()) == report
+
+
+def test_section_parser_emits_sections_as_they_complete():
+    parser = SectionParser()
+    emitted = []
+    for i in range(0, len(SAMPLE_ANALYSIS), 7):
+        emitted.extend(heading for heading, _ in parser.feed(SAMPLE_ANALYSIS[i:i + 7]))
+    assert emitted == [None, "Rule Overview", "Security Impact", "Effectiveness and False Postives", "Test case"]
+    assert parser.close() == parse_report(SAMPLE_ANALYSIS)
+
+
+def test_section_key_accepts_heading_variants():
+    assert section_key("Rule Overview: 942100") == "overview"
+    assert section_key("**Potential Improvements and Additional Conditions**") == "improvements"
+    assert section_key("Differences from Rule 942100") == "differences"
+    assert section_key("Improvement Suggestions") == "suggestions"
+    assert section_key("Appendix") is None